@@ -6,13 +6,21 @@ from dotenv import load_dotenv
 from datetime import datetime
 
 from celery import Celery
+from celery.signals import worker_init
 
 from dump.dump_production import DumpFlow
 from settings import DatabaseConfig
+from models.audience_models import MODEL_ROOT
+from models.cascade_model import CascadeModel
+from models.model_creator import ModelCreator
 from utils.database_core import update2state, get_batch_by_timedelta, check_break_status, update2state_nodata, \
-    update2state_temp_result_table
+    update2state_temp_result_table, update2state_rule_telemetry, update2training_result_stage, update2training_result, \
+    update2state_cascade_coverage
 from utils.helper import get_logger, get_config
+from utils.model_registry import preload_models, set_memory_budget, set_version_ttl
+from utils.pattern_cache import RULE_BASE_MODELS, load_compiled_model
 from utils.run_label_task import labeling
+from utils.selections import ModelType, TrainingStage
 from utils.task_generate_production_core import TaskGenerateOutput
 from utils.task_info_core import TaskInfo
 
@@ -29,6 +37,17 @@ celery_app.conf.update(task_track_started=configuration.CELERY_TASK_TRACK_STARTE
 celery_app.conf.update(task_acks_late=configuration.CELERY_ACKS_LATE)
 celery_app.conf.update(task_serializer=configuration.CELERY_SERIALIZER)
 
+
+@worker_init.connect
+def preload_supervised_models(**kwargs):
+    # the first batch of a task should not wait for the models to be loaded, ``worker_init`` is sent by the main
+    # process of every pool, the gevent and thread pools run their tasks in it, and the children of a prefork pool
+    # inherit the loaded models when they are forked
+    set_memory_budget(configuration.MODEL_REGISTRY_MEMORY_BUDGET)
+    set_version_ttl(configuration.MODEL_REGISTRY_VERSION_TTL)
+    preload_models(configuration.MODEL_REGISTRY_PRELOAD)
+
+
 @celery_app.task(name=f'{configuration.CELERY_NAME}.label_data', track_started=True)
 # @memory_usage_tracking
 def label_data(task_id: str, kwargs_json: str) -> Optional[str]:
@@ -53,6 +72,37 @@ def label_data(task_id: str, kwargs_json: str) -> Optional[str]:
     count = 0
     row_number = 0
 
+    # the hits of every rule are aggregated over all batches of the task
+    task_telemetry = None
+    if kwargs.get('RULE_TELEMETRY', True) and kwargs.get('MODEL_TYPE') in RULE_BASE_MODELS:
+        try:
+            task_telemetry = load_compiled_model(kwargs.get('MODEL_TYPE'), kwargs.get('PATTERN')).create_telemetry()
+        except Exception as e:
+            update2state(task_id, '', _logger,
+                         schema=DatabaseConfig.OUTPUT_SCHEMA,
+                         success=False,
+                         check_point=start_date_d,
+                         error_message=e)
+            _logger.error(f'task {task_id} has an invalid pattern, additional error message {e}')
+            raise e
+
+    # the stages of a cascade count their coverage over all batches of the task as well
+    cascade = None
+    if kwargs.get('MODEL_TYPE') == ModelType.CASCADE_MODEL.value:
+        try:
+            cascade = CascadeModel(kwargs.get('CASCADE'),
+                                   predict_type="author_name" if kwargs.get('PREDICT_TYPE') == "author"
+                                   else kwargs.get('PREDICT_TYPE'),
+                                   rule_telemetry=kwargs.get('RULE_TELEMETRY', True))
+        except Exception as e:
+            update2state(task_id, '', _logger,
+                         schema=DatabaseConfig.OUTPUT_SCHEMA,
+                         success=False,
+                         check_point=start_date_d,
+                         error_message=e)
+            _logger.error(f'task {task_id} has an invalid cascade, additional error message {e}')
+            raise e
+
     for idx, elements in enumerate(get_batch_by_timedelta(kwargs.get('INPUT_SCHEMA'),
                                                           kwargs.get('PREDICT_TYPE'),
                                                           kwargs.get('INPUT_TABLE'),
@@ -88,7 +138,8 @@ def label_data(task_id: str, kwargs_json: str) -> Optional[str]:
 
         try:
             _output, row_num = labeling(task_id, element, kwargs.get('MODEL_TYPE'),
-                               pred, kwargs.get('PATTERN'), _logger)
+                               pred, kwargs.get('PATTERN'), _logger, telemetry=task_telemetry,
+                               cascade=cascade)
 
             row_number += row_num
 
@@ -129,6 +180,14 @@ def label_data(task_id: str, kwargs_json: str) -> Optional[str]:
                  schema=DatabaseConfig.OUTPUT_SCHEMA,
                  uniq_source_author=','.join([str(len(i)) for i in table_dict.values()]))
 
+    if task_telemetry is not None:
+        update2state_rule_telemetry(task_id, DatabaseConfig.OUTPUT_SCHEMA,
+                                    json.dumps(task_telemetry.summary(), ensure_ascii=False), _logger)
+
+    if cascade is not None:
+        update2state_cascade_coverage(task_id, DatabaseConfig.OUTPUT_SCHEMA,
+                                      json.dumps(cascade.summary(), ensure_ascii=False), _logger)
+
     # return json.dumps(list(table_dict.keys()), ensure_ascii=False)
 
     output_table =  list(table_dict.keys())
@@ -229,6 +288,43 @@ def label_data(task_id: str, kwargs_json: str) -> Optional[str]:
     #     _logger.info('Local testing will not generate ZIP mysql table backup...skip this part')
     #     _logger.info(f'{task_id} done')
 
+@celery_app.task(name=f'{configuration.CELERY_NAME}.train_model', track_started=True, bind=True)
+def train_model(self, job_id: str, model_type: str, model_info: Dict, examples, y_true,
+                validation_set=None, validation_y=None) -> Optional[str]:
+    _logger = get_logger('train_model')
+    start_time = datetime.now()
+
+    def report_stage(stage: TrainingStage):
+        self.update_state(state='PROGRESS', meta={'stage': stage.value})
+        update2training_result_stage(job_id, 'PROGRESS', stage.value, _logger, schema=DatabaseConfig.OUTPUT_SCHEMA)
+
+    try:
+        model = ModelCreator.create_model(model_type, **model_info)
+        model.progress_callback = report_stage
+        model_path = model.fit(examples=examples, y_true=y_true)
+        model.progress_callback = None
+
+        metrics = {'training_size': len(examples)}
+        if validation_set:
+            report_stage(TrainingStage.EVALUATION)
+            metrics['validation_size'] = len(validation_set)
+            metrics['report'] = model.eval(validation_set, validation_y)
+        metrics['run_time'] = (datetime.now() - start_time).total_seconds()
+
+        artifact_path = str(MODEL_ROOT / model_path)
+        update2training_result(job_id, _logger, schema=DatabaseConfig.OUTPUT_SCHEMA,
+                               metrics=json.dumps(metrics, ensure_ascii=False, default=str),
+                               artifact_path=artifact_path)
+        _logger.info(f'training job {job_id} done, the model is saved in {artifact_path}')
+        return artifact_path
+
+    except Exception as e:
+        update2training_result(job_id, _logger, schema=DatabaseConfig.OUTPUT_SCHEMA, success=False,
+                               error_message=str(e))
+        _logger.error(f'training job {job_id} failed, additional error message {e}')
+        raise e
+
+
 @celery_app.task(name=f'{configuration.CELERY_NAME}.dump_result', track_started=True)
 def dump_result(**kwargs):
     _logger = get_logger('dump')
@@ -0,0 +1,32 @@
+import json
+
+import click
+
+from models.tw_model import TermWeightModel
+from utils.data_helper import load_examples
+
+
+@click.command()
+@click.option('--model_path', required=True)
+@click.option('--min_weight', type=float, default=None)
+@click.option('--top_k', type=int, default=None)
+@click.option('--eval_file', default=None)
+@click.option('--dry_run/--save', default=False)
+def compact_command(model_path, min_weight, top_k, eval_file, dry_run):
+    model = TermWeightModel(model_dir_name=model_path)
+    model.load()
+
+    examples, y_true = None, None
+    if eval_file:
+        examples = load_examples(file=eval_file, shuffle=False)
+        y_true = [[example.label] for example in examples]
+
+    report = model.compact(min_weight=min_weight, top_k=top_k, examples=examples, y_true=y_true)
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if not dry_run:
+        model.save()
+        click.echo(f'compacted dictionary is saved to {model_path}')
+
+if __name__ == '__main__':
+    compact_command()
@@ -13,6 +13,9 @@ Path(SAVE_FOLDER).mkdir(exist_ok=True)
 RULE_FOLDER = Path(ROOT_DIR / "rules")
 Path(RULE_FOLDER).mkdir(exist_ok=True)
 
+# caches which may be deleted at any time, e.g. the segmented tokens, created when they are first written
+CACHE_FOLDER = Path(ROOT_DIR / "cache")
+
 # only use this in lab machine
 AUDIENCE_PRODUCTION_PATH = '/home/deeprd2/audience_production'
 
@@ -0,0 +1,33 @@
+import json
+
+import click
+
+from models.rf_model import RandomForestModel
+from utils.data_helper import load_examples
+
+
+@click.command()
+@click.option('--model_path', required=True)
+@click.option('--multi_label', is_flag=True, default=False)
+@click.option('--max_depth', type=int, default=None)
+@click.option('--n_trees', type=int, default=None)
+@click.option('--eval_file', default=None)
+@click.option('--dry_run/--save', default=False)
+def export_command(model_path, multi_label, max_depth, n_trees, eval_file, dry_run):
+    model = RandomForestModel(model_dir_name=model_path, is_multi_label=multi_label)
+    model.load()
+
+    examples, y_true = None, None
+    if eval_file:
+        examples = load_examples(file=eval_file, shuffle=False)
+        y_true = [[example.label] if multi_label else example.label for example in examples]
+
+    report = model.export_forest(max_depth=max_depth, n_trees=n_trees, examples=examples, y_true=y_true)
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if not dry_run:
+        model.save()
+        click.echo(f'exported forest is saved to {model_path}')
+
+if __name__ == '__main__':
+    export_command()
@@ -9,11 +9,12 @@ from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse, RedirectResponse
 from sqlalchemy import create_engine
 
-from celery_worker import label_data, dump_result
+from celery_worker import label_data, dump_result, train_model
 from models.model_creator import ModelCreator, ModelTypeNotFound, ParamterMissingError
 from settings import DatabaseConfig, TaskConfig, TaskList, TaskSampleResult, AbortionConfig, DumpConfig, TrainingConfig
 from utils.database_core import scrap_data_to_dict, get_tasks_query_recent, \
-    get_sample_query, create_state_table, insert2state, query_state_by_id, get_table_info, send_break_signal_to_state
+    get_sample_query, create_state_table, insert2state, query_state_by_id, get_table_info, send_break_signal_to_state, \
+    add_state_columns, create_training_result_table, insert2training_result, query_training_result_by_id
 from utils.helper import get_logger, get_config
 from utils.selections import ModelType
 
@@ -26,12 +27,14 @@ This service is created by department of Research and Development 2 to help Audi
 
 #### Item    
 
-1. create_task : a post api which create a labeling task via the information in the request body.    
+1. create_task : a post api which create a labeling task via the information in the request body, set `MODEL_TYPE` to `cascade_model` and list the stages in `CASCADE` to run keyword or rule models before a supervised model.    
 2. task_list : return the recent tasks and tasks information.     
 3. check_status : return a single task status and results if success via task_id.   
 4. sample_result : return the labeling results from database via task_id and table information.    
 5. abort_task : break the task.   
 6. dump_tasks : dump tasks to ZIP.   
+7. model_training : start a training job and return its `job_id`, set `vectorizer` of `MODEL_INFO` to `hashing` to train on hashed features, `CHAR_NGRAM_MODEL` trains a light linear model of author names.   
+8. training_status : return the stage, metrics and artifact path of a training job via job_id.   
 
 #### Users   
 For eland staff only.  
@@ -58,6 +61,8 @@ async def create_task(create_request_body: TaskConfig):
         _exist_tables = [i[0] for i in engine.execute('SHOW TABLES').fetchall()]
         if 'state' not in _exist_tables:
             create_state_table(_logger, schema=DatabaseConfig.OUTPUT_SCHEMA)
+        else:
+            add_state_columns(_logger, schema=DatabaseConfig.OUTPUT_SCHEMA)
         engine.close()
     except Exception as e:
         err_info = {
@@ -300,9 +305,60 @@ def model_training(training_config: TrainingConfig):
         err_msg = f'{training_config.MODEL_TYPE.lower()} is not trainable'
         return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(err_msg))
 
-    model_path = model.fit(examples=training_config.TRAINING_SET, y_true=training_config.TRAINING_Y)
-    err_msg = f'{model.__class__.__name__} model_path is in {model_path}'
-    return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(err_msg))
+    try:
+        create_training_result_table(_logger, schema=DatabaseConfig.OUTPUT_SCHEMA)
+        job_id = uuid.uuid1().hex
+        insert2training_result(job_id, 'PENDING', training_config.MODEL_TYPE,
+                               training_config.MODEL_INFO.get('model_path'), datetime.now(),
+                               _logger, schema=DatabaseConfig.OUTPUT_SCHEMA)
+        # the model is fitted by a worker of the training queue, the api only hands the job over
+        train_model.apply_async(kwargs={"job_id": job_id,
+                                        "model_type": training_config.MODEL_TYPE,
+                                        "model_info": training_config.MODEL_INFO,
+                                        "examples": training_config.TRAINING_SET,
+                                        "y_true": training_config.TRAINING_Y,
+                                        "validation_set": training_config.VALIDATION_SET,
+                                        "validation_y": training_config.VALIDATION_Y},
+                                task_id=job_id, queue=configuration.TRAINING_QUEUE)
+    except Exception as e:
+        err_info = {
+            "error_code": 500,
+            "error_message": f"failed to start a training job, additional error message: {e}"
+        }
+        _logger.error(err_info)
+        return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(err_info))
+
+    err_info = {
+        "error_code": 200,
+        "error_message": {"job_id": job_id, "model_type": training_config.MODEL_TYPE,
+                          "model_path": training_config.MODEL_INFO.get('model_path')}
+    }
+    return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(err_info))
+
+@app.get('/api/tasks/training/{job_id}', description='Input a job_id and output the stage of the training job, '
+                                                     'the metrics and the artifact path are returned once it is done')
+async def training_status(job_id: str):
+    try:
+        result = query_training_result_by_id(job_id)
+        if result:
+            err_info = {
+                "error_code": 200,
+                "error_message": result
+            }
+        else:
+            err_info = {
+                "error_code": 404,
+                "error_message": f"{job_id} is not found, plz re-check the job_id"
+            }
+        return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(err_info))
+
+    except Exception as e:
+        err_info = {
+            "error_code": 500,
+            "error_message": f'Addition error message:{e}',
+        }
+        _logger.error(f'{e}')
+        return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(err_info))
 
 
 if __name__ == '__main__':
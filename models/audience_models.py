@@ -1,14 +1,18 @@
 
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Iterable, List, Tuple
+from typing import Callable, Iterable, List, Tuple, Dict, Optional, Union
+
+import numpy as np
+from scipy.sparse import csr_matrix
 
 import settings
 from utils.helper import get_logger
 from utils.input_example import InputExample
+from utils.text_normalizer import TextNormalizer
 
 
-from utils.selections import ModelType, PredictTarget
+from utils.selections import ModelType, PredictTarget, TrainingStage
 
 MODEL_ROOT = Path(settings.MODEL_PATH_FIELD_DIRECTORY)
 
@@ -17,11 +21,13 @@ class RuleBaseModel(ABC):
                  case_sensitive: bool = False,
                  logger_name: str = "AudienceModel",
                  target: PredictTarget = PredictTarget.CONTENT,
+                 normalizer: Optional[TextNormalizer] = None,
                  verbose: bool = False):
         self.name = name
         self.model_type = model_type
         self.case_sensitive = case_sensitive
         self.target = target
+        self.normalizer = normalizer if normalizer is not None else TextNormalizer(case_sensitive=case_sensitive)
         self.logger = get_logger(logger_name, verbose=verbose)
 
     @abstractmethod
@@ -39,6 +45,74 @@ class RuleBaseModel(ABC):
         """evaluate with validation set, return the report"""
         pass
 
+    @abstractmethod
+    def match_counts(self, text: str, telemetry=None) -> Dict[int, int]:
+        """count the matched rules of every label in a single normalized string, return label ids and counts"""
+        pass
+
+    @abstractmethod
+    def decide(self, text: str, telemetry=None) -> int:
+        """return the label id if exactly one label is matched in a single normalized string, otherwise -1"""
+        pass
+
+    @abstractmethod
+    def create_telemetry(self):
+        """create an empty ``RuleTelemetry`` of the rules of the model"""
+        pass
+
+    def decide_batch(self, texts: Iterable[str], normalized: bool = False, telemetry=None) -> np.ndarray:
+        """
+        the decide mode of ``predict_batch``, a row is only labeled when exactly one label is matched,
+        scanning a row stops as soon as a second label is matched and the rules are not counted
+        Args:
+            texts: the target column, e.g. ``df['author'].values``
+            normalized: texts are already normalized by ``self.normalizer``, e.g. by ``get_normalized_column``
+            telemetry: an optional ``RuleTelemetry`` from ``create_telemetry``, which collects the rule hits
+        Returns:
+            the label index of each row, -1 if nothing or more than one label is matched
+        """
+        if not normalized:
+            texts = self.normalizer.normalize(texts)
+        if telemetry is not None:
+            telemetry.rows += len(texts)
+        return np.fromiter((self.decide(text, telemetry=telemetry) for text in texts), dtype=np.int64,
+                           count=len(texts))
+
+    def predict_batch(self, texts: Iterable[str], normalized: bool = False,
+                      telemetry=None) -> Tuple[csr_matrix, np.ndarray]:
+        """
+        predict a whole column of strings at once
+        Args:
+            texts: the target column, e.g. ``df['author'].values``
+            normalized: texts are already normalized by ``self.normalizer``, e.g. by ``get_normalized_column``
+            telemetry: an optional ``RuleTelemetry`` from ``create_telemetry``, which collects the rule hits
+        Returns:
+            a csr matrix of matched counts (rows x labels) which is aligned with the input rows,
+            and the index of the label with the highest count of each row, -1 if nothing is matched
+        """
+        if not normalized:
+            texts = self.normalizer.normalize(texts)
+        if telemetry is not None:
+            telemetry.rows += len(texts)
+        indptr = [0]
+        indices = []
+        data = []
+        for text in texts:
+            for label_id, count in sorted(self.match_counts(text, telemetry=telemetry).items()):
+                indices.append(label_id)
+                data.append(count)
+            indptr.append(len(indices))
+
+        counts = csr_matrix((np.asarray(data, dtype=np.int32),
+                             np.asarray(indices, dtype=np.int32),
+                             np.asarray(indptr, dtype=np.int64)),
+                            shape=(len(indptr) - 1, len(self.labels)))
+        winners = np.full(counts.shape[0], -1, dtype=np.int64)
+        matched_rows = np.flatnonzero(counts.getnnz(axis=1))
+        if matched_rows.size:
+            winners[matched_rows] = np.asarray(counts[matched_rows].argmax(axis=1)).ravel()
+        return counts, winners
+
 
 
 class SupervisedModel(ABC):
@@ -48,6 +122,12 @@ class SupervisedModel(ABC):
         self.feature = feature if isinstance(feature, PredictTarget) else PredictTarget(feature)
         self.is_multi_label = True
         self.na_tag = na_tag
+        # called with the stage of ``fit`` whenever it moves on, e.g. to report the progress of a training job
+        self.progress_callback: Optional[Callable[[TrainingStage], None]] = None
+
+    def report_progress(self, stage: TrainingStage):
+        if self.progress_callback is not None:
+            self.progress_callback(stage)
 
     @abstractmethod
     def fit(self, examples: Iterable[InputExample], y_true):
@@ -55,8 +135,11 @@ class SupervisedModel(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def predict(self, examples: Iterable[InputExample]) -> List[Tuple[Tuple]]:
-        """predict the results of output, return labels and probs"""
+    def predict(self, examples: Iterable[InputExample]) -> Tuple[Union[np.ndarray, List], Union[np.ndarray, List]]:
+        """
+        predict the results of output, return labels and probs, the arrays of rows x classes are numpy arrays,
+        the term weight model returns the labels and the matched terms of every row as lists instead
+        """
         raise NotImplementedError
 
     @abstractmethod
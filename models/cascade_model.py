@@ -0,0 +1,155 @@
+import time
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from models.incremental_model import IncrementalModel
+from models.ngram_model import CharNgramModel
+from models.rf_model import RandomForestModel
+from models.tw_model import TermWeightModel
+from utils.input_example import ExampleBatch
+from utils.model_registry import SUPERVISED_MODELS, get_model
+from utils.pattern_cache import RULE_BASE_MODELS, load_compiled_model
+from utils.selections import PredictTarget
+from utils.text_normalizer import get_normalized_column
+
+
+class CascadeModel(object):
+    """
+    a chain of models over the rows of a batch, every stage only sees the rows which the previous stages left
+    undecided, a rule-based stage labels a row in the decide mode, i.e. only if exactly one label is matched,
+    and a supervised stage labels a row if exactly one label is predicted with a probability of at least
+    `MIN_PROBA`, so the cheap keyword and regex stages go first and the supervised models only pay for the rest,
+    the rows and the decided rows of every stage are counted over all batches of a task
+    Args:
+        stages: the `CASCADE` of a task, a stage is a dict of `MODEL_TYPE` and either the `PATTERN` of a
+            rule-based model or the `MODEL_PATH` of a supervised model, a rule-based stage may set its own
+            `PREDICT_TYPE`, a supervised stage may set `MIN_PROBA` and the `FEATURE`, `IS_MULTI_LABEL` and `NA_TAG`
+            its model was trained with
+        predict_type: the target column of the rule-based stages which have no `PREDICT_TYPE`
+        rule_telemetry: collect the rule hits of the rule-based stages
+    """
+    def __init__(self, stages: List[Dict], predict_type: str = PredictTarget.CONTENT.value,
+                 rule_telemetry: bool = False):
+        if not stages:
+            raise ValueError('a cascade needs at least one stage')
+        self.stages = []
+        for stage in stages:
+            model_type = stage.get('MODEL_TYPE', '').lower()
+            if model_type in RULE_BASE_MODELS:
+                if not stage.get('PATTERN'):
+                    raise ValueError(f'the {model_type} stage of the cascade has no `PATTERN`')
+                model = load_compiled_model(model_type, stage['PATTERN'])
+                self.stages.append({'model_type': model_type,
+                                    'pattern': stage['PATTERN'],
+                                    'predict_type': stage.get('PREDICT_TYPE') or predict_type,
+                                    'telemetry': model.create_telemetry() if rule_telemetry else None})
+            elif model_type in SUPERVISED_MODELS:
+                if not stage.get('MODEL_PATH'):
+                    raise ValueError(f'the {model_type} stage of the cascade has no `MODEL_PATH`')
+                self.stages.append({'model_type': model_type,
+                                    'model_path': stage['MODEL_PATH'],
+                                    'min_proba': float(stage.get('MIN_PROBA') or 0.0),
+                                    'model_params': {'feature': stage.get('FEATURE'),
+                                                     'is_multi_label': stage.get('IS_MULTI_LABEL'),
+                                                     'na_tag': stage.get('NA_TAG')}})
+            else:
+                raise ValueError(f'{model_type} can not be a stage of the cascade')
+        self.rows = 0
+        self.stage_rows = [0] * len(self.stages)
+        self.stage_decided = [0] * len(self.stages)
+        self.stage_seconds = [0.0] * len(self.stages)
+
+    def predict_batch(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Args:
+            df: a batch of the input table, with the columns of an ``InputExample``
+        Returns:
+            the label of every row, an empty string if no stage decided it
+        """
+        labels = np.full(len(df), '', dtype=object)
+        rows = np.arange(len(df))
+        self.rows += len(df)
+        for stage_id, stage in enumerate(self.stages):
+            if not rows.size:
+                break
+            start = time.perf_counter()
+            if stage['model_type'] in RULE_BASE_MODELS:
+                stage_labels = self._decide_rules(stage, df, rows)
+            else:
+                stage_labels = self._decide_supervised(stage, df, rows)
+            decided = stage_labels != ''
+            labels[rows[decided]] = stage_labels[decided]
+            self.stage_rows[stage_id] += rows.size
+            self.stage_decided[stage_id] += int(np.count_nonzero(decided))
+            self.stage_seconds[stage_id] += time.perf_counter() - start
+            rows = rows[~decided]
+        return labels
+
+    @staticmethod
+    def _decide_rules(stage: Dict, df: pd.DataFrame, rows: np.ndarray) -> np.ndarray:
+        model = load_compiled_model(stage['model_type'], stage['pattern'])
+        column = 'author' if stage['predict_type'] == PredictTarget.AUTHOR_NAME.value else stage['predict_type']
+        # the column is normalized once per batch and shared by every stage which reads it
+        texts = get_normalized_column(df, column, model.normalizer).values[rows]
+        label_ids = model.decide_batch(texts, normalized=True, telemetry=stage['telemetry'])
+        stage_labels = np.full(len(rows), '', dtype=object)
+        decided = label_ids != -1
+        stage_labels[decided] = np.asarray(model.labels, dtype=object)[label_ids[decided]]
+        return stage_labels
+
+    @staticmethod
+    def _decide_supervised(stage: Dict, df: pd.DataFrame, rows: np.ndarray) -> np.ndarray:
+        model = get_model(stage['model_type'], stage['model_path'], **stage['model_params'])
+        examples = ExampleBatch(id_=df['id'].values[rows], s_area_id=df['s_area_id'].values[rows],
+                                author=df['author'].values[rows], title=df['title'].values[rows],
+                                content=df['content'].values[rows], post_time=df['post_time'].iloc[rows])
+        stage_labels = np.full(len(rows), '', dtype=object)
+        if isinstance(model, TermWeightModel):
+            # the term weight model has no probabilities, a row is decided by a single matched label
+            for index, _labels in enumerate(model.predict(examples)[0]):
+                if len(_labels) == 1 and _labels[0] != model.na_tag:
+                    stage_labels[index] = _labels[0]
+            return stage_labels
+
+        predict_labels, predict_logits = model.predict(examples)
+        if isinstance(model, RandomForestModel):
+            classes = model.mlb.classes_ if model.is_multi_label else model.classes_
+        elif isinstance(model, IncrementalModel):
+            classes = model.labels
+        elif isinstance(model, CharNgramModel):
+            classes = model.classes
+        else:
+            raise ValueError(f'{stage["model_type"]} can not be a stage of the cascade')
+        best = np.argmax(predict_logits, axis=1)
+        decided = predict_logits[np.arange(len(rows)), best] >= stage['min_proba']
+        if model.is_multi_label:
+            decided &= np.asarray(predict_labels).sum(axis=1) == 1
+        best_labels = np.asarray(classes, dtype=object)[best]
+        if model.na_tag:
+            decided &= best_labels != model.na_tag
+        stage_labels[decided] = best_labels[decided]
+        return stage_labels
+
+    def summary(self) -> Dict:
+        """
+        Returns:
+            {"rows": n, "undecided": n, "stages": [{"model_type": t, "rows": n, "decided": n, "coverage": r,
+            "seconds": s}]}, the coverage is the decided share of the rows which reached the stage, a rule-based
+            stage with telemetry also reports its ``rule_telemetry``
+        """
+        stages = []
+        for stage, rows, decided, seconds in zip(self.stages, self.stage_rows, self.stage_decided,
+                                                 self.stage_seconds):
+            entry = {'model_type': stage['model_type'],
+                     'rows': rows,
+                     'decided': decided,
+                     'coverage': round(decided / rows, 6) if rows else 0.0,
+                     'seconds': round(seconds, 6)}
+            if stage.get('model_path'):
+                entry['model_path'] = stage['model_path']
+            if stage.get('telemetry') is not None:
+                entry['rule_telemetry'] = stage['telemetry'].summary()
+            stages.append(entry)
+        return {'rows': self.rows, 'undecided': self.rows - sum(self.stage_decided), 'stages': stages}
@@ -0,0 +1,143 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import classification_report, accuracy_score
+from sklearn.preprocessing import MultiLabelBinarizer
+
+from models.audience_models import SupervisedModel, MODEL_ROOT
+from utils.input_example import InputExample, example_field
+from utils.model_helper import load_joblib
+from utils.segmenter import get_segmenter
+from utils.selections import PredictTarget, TrainingStage
+
+CHECKPOINT_PATTERN = re.compile(r'^v(\d+)$')
+
+
+class IncrementalModel(SupervisedModel):
+    """
+    a one-vs-rest linear model over a hashed feature space, the hashing vectorizer keeps no vocabulary,
+    so new labeled data is folded into the latest checkpoint by ``partial_fit`` without retraining the old data,
+    every ``fit`` saves a new checkpoint `v<version>` under the model directory
+    """
+    def __init__(self, model_dir_name, is_multi_label=False, feature=PredictTarget.CONTENT,
+                 n_features: int = 2 ** 20, n_epochs: int = 5, **kwargs):
+        super().__init__(model_dir_name, feature=feature, **kwargs)
+        self.is_multi_label = is_multi_label
+        self.n_features = n_features
+        self.n_epochs = n_epochs
+        self.vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=True,
+                                            token_pattern=r'(?u)\b\w+\b')
+        self.classifiers: Dict[str, SGDClassifier] = {}
+        self.version = 0
+        self.checkpoint_file_name = 'model.pkl'
+
+    @property
+    def labels(self) -> List[str]:
+        return list(self.classifiers.keys())
+
+    def latest_version(self) -> int:
+        model_dir = MODEL_ROOT / self.model_dir_name
+        if not model_dir.exists():
+            return 0
+        versions = []
+        for path in model_dir.iterdir():
+            match = CHECKPOINT_PATTERN.match(path.name)
+            if match and (path / self.checkpoint_file_name).exists():
+                versions.append(int(match.group(1)))
+        return max(versions, default=0)
+
+    def load(self, version: Optional[int] = None, mmap_mode: Optional[str] = None):
+        """load a checkpoint, the latest one by default"""
+        version = version if version is not None else self.latest_version()
+        checkpoint = load_joblib(MODEL_ROOT / self.model_dir_name / f'v{version}' / self.checkpoint_file_name,
+                                 mmap_mode=mmap_mode)
+        if checkpoint['n_features'] != self.n_features:
+            self.n_features = checkpoint['n_features']
+            self.vectorizer.set_params(n_features=self.n_features)
+        self.classifiers = checkpoint['classifiers']
+        self.is_multi_label = checkpoint['is_multi_label']
+        self.version = version
+
+    def convert_feature(self, examples):
+        self.report_progress(TrainingStage.SEGMENTATION)
+        contents = [str(content) for content in example_field(examples, self.feature.value)]
+        if self.feature in {PredictTarget.CONTENT, PredictTarget.TITLE}:
+            sentences = get_segmenter().segment_batch(contents)
+        elif self.feature in {PredictTarget.AUTHOR_NAME, }:
+            sentences = [list(content) for content in contents]
+        else:
+            raise ValueError(f"Unavailable feature type {self.feature}")
+        seg_contents = [" ".join(sentence) for sentence in sentences]
+        self.report_progress(TrainingStage.VECTORIZATION)
+        return self.vectorizer.transform(seg_contents)
+
+    def fit(self, examples: List[InputExample], y_true):
+        """
+        fold the examples into the latest checkpoint, or train a new model if there is none,
+        a label which is new to the checkpoint gets its own classifier trained on the new data only
+        Returns:
+            the model directory, the new checkpoint is saved as `v<version>` in it
+        """
+        if not self.classifiers and self.latest_version():
+            self.load()
+
+        y_true = [[y] if isinstance(y, str) else list(y) for y in y_true]
+        x_features = self.convert_feature(examples)
+        self.report_progress(TrainingStage.FITTING)
+        labels = self.labels + sorted({y for _y_true in y_true for y in _y_true} - set(self.classifiers.keys()))
+        for label in labels:
+            if label not in self.classifiers:
+                self.classifiers[label] = SGDClassifier(loss='log', penalty='elasticnet', l1_ratio=0.15,
+                                                        learning_rate='optimal')
+            tmp_y = np.asarray([int(label in _y_true) for _y_true in y_true])
+            # a few passes over the new data only, the old data is summarized by the current coefficients
+            for epoch in range(self.n_epochs):
+                order = np.random.permutation(len(tmp_y))
+                self.classifiers[label].partial_fit(x_features[order], tmp_y[order], classes=[0, 1])
+        self.report_progress(TrainingStage.SAVING)
+        return self.save()
+
+    def predict(self, examples) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            the labels, an indicator array of rows x labels for the multi-label model, otherwise the label of
+            every row, and the probabilities of rows x labels, the columns follow ``self.labels``
+        """
+        if not self.classifiers:
+            raise ValueError(f"模型尚未被訓練，或模型尚未被讀取。若模型已被訓練與儲存，請嘗試執行 ' load() ' 方法讀取模型。")
+        x_features = self.convert_feature(examples)
+        predict_logits = np.column_stack([clf.predict_proba(x_features)[:, 1] for clf in self.classifiers.values()])
+        if self.is_multi_label:
+            predict_labels = (predict_logits > 0.5).astype(int)
+        else:
+            predict_labels = np.asarray(self.labels).take(np.argmax(predict_logits, axis=1))
+        return predict_labels, predict_logits
+
+    def eval(self, examples, y_true):
+        if not self.classifiers:
+            raise ValueError(f"模型尚未被訓練，或模型尚未被讀取。若模型已被訓練與儲存，請嘗試執行 ' load() ' 方法讀取模型。")
+        predict_labels, predict_logits = self.predict(examples)
+        if self.is_multi_label:
+            mlb = MultiLabelBinarizer(classes=self.labels)
+            y_true = mlb.fit_transform([[y] if isinstance(y, str) else y for y in y_true])
+            report = classification_report(y_true, predict_labels, output_dict=True, zero_division=1,
+                                           target_names=self.labels)
+            report['accuracy'] = accuracy_score(y_true, predict_labels)
+        else:
+            y_true = [y if isinstance(y, str) else y[0] for y in y_true]
+            report = classification_report(y_true, predict_labels, output_dict=True, zero_division=1)
+        return report
+
+    def save(self):
+        self.version = self.latest_version() + 1
+        checkpoint_dir = MODEL_ROOT / self.model_dir_name / f'v{self.version}'
+        checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        joblib.dump({'classifiers': self.classifiers,
+                     'is_multi_label': self.is_multi_label,
+                     'n_features': self.n_features},
+                    checkpoint_dir / self.checkpoint_file_name)
+        return self.model_dir_name
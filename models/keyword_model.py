@@ -1,5 +1,5 @@
 from collections import defaultdict
-from typing import Iterable, Dict, List, Tuple
+from typing import Iterable, Iterator, Dict, List, Tuple, Optional
 
 from ahocorapy.keywordtree import KeywordTree
 from sklearn.metrics import classification_report, accuracy_score
@@ -7,91 +7,98 @@ from sklearn.preprocessing import MultiLabelBinarizer
 
 
 from models.audience_models import RuleBaseModel
-from utils.input_example import InputExample
+from utils.input_example import ExampleBatch, InputExample
 from utils.selections import ModelType, PredictTarget, KeywordMatchType, Errors
+from utils.rule_telemetry import RuleTelemetry
+from utils.text_normalizer import TextNormalizer
 
 
 class KeywordModel(RuleBaseModel):
+    # bump it whenever the compiled structures change, so cached artifacts are rebuilt
+    compiled_version = 3
+
     def __init__(self, label_keywords: Dict[str, List[Tuple[str, KeywordMatchType]]] = None,
                  name: str = None,
                  model_type: ModelType = ModelType.KEYWORD_MODEL.value,
                  case_sensitive: bool = False,
                  target=PredictTarget.CONTENT.value,
+                 normalizer: Optional[TextNormalizer] = None,
                  verbose: bool = False):
         super().__init__(name=name if name is not None else "KeywordModel", model_type=model_type,
-                         case_sensitive=case_sensitive, target=target, logger_name="KeywordModel", verbose=verbose)
+                         case_sensitive=case_sensitive, target=target, normalizer=normalizer,
+                         logger_name="KeywordModel", verbose=verbose)
         self.logger.debug("model Init")
-        self.label_match_any_trees = dict()
-        self.label_match_start = defaultdict(list)
-        self.label_match_end = defaultdict(list)
-        self.label_match_full = defaultdict(list)
+        self.label_match_any_tree = None
+        self.label_match_any_keywords: Dict[str, List[int]] = defaultdict(list)
+        self.keywords: List[Tuple[int, str, str]] = []
+        self.label_keywords: Dict[str, List[Tuple[str, KeywordMatchType]]] = {}
+        self.label_match_full: Dict[str, List[int]] = defaultdict(list)
+        self.label_match_start_trie = dict()
+        self.label_match_end_trie = dict()
         self.labels = []
         if label_keywords:
             self.load(label_keywords)
 
     def load(self, label_keywords: Dict[str, List[Tuple[str, KeywordMatchType]]]):
-        for label, keywords in label_keywords.items():
+        self.label_keywords.update(label_keywords)
+        for label in label_keywords.keys():
             if label not in self.labels:
                 self.labels.append(label)
-            self.label_match_any_trees[label] = KeywordTree(case_insensitive=(not self.case_sensitive))
-            for keyword, match_types in keywords:
-                if isinstance(match_types, KeywordMatchType):
+
+        # every label shares one automaton, a matched keyword is mapped back to its labels by keyword id
+        self.label_match_any_tree = KeywordTree()
+        self.label_match_any_keywords.clear()
+        self.keywords.clear()
+        self.label_match_full.clear()
+        self.label_match_start_trie.clear()
+        self.label_match_end_trie.clear()
+        for label_id, label in enumerate(self.labels):
+            for keyword, match_types in self.label_keywords[label]:
+                if isinstance(match_types, str):
                     match_types = [match_types]
-                _keyword = keyword if self.case_sensitive else keyword.lower()
-                if KeywordMatchType.PARTIALLY in match_types:
-                    self.label_match_any_trees[label].add(_keyword)
-                if KeywordMatchType.START in match_types:
-                    self.label_match_start[label].append(_keyword)
-                if KeywordMatchType.END in match_types:
-                    self.label_match_end[label].append(_keyword)
-                if KeywordMatchType.ABSOLUTELY in match_types:
-                    self.label_match_full[label].append(_keyword)
-            self.label_match_any_trees[label].finalize()
-        self.logger.debug(f"label match any trees: {len(self.label_match_any_trees)}")
-        self.logger.debug(f"label match start: {len(self.label_match_start)}")
-        self.logger.debug(f"label match end: {len(self.label_match_end)}")
+                _keyword = self.normalizer.normalize_keyword(keyword)
+                for match_type in match_types:
+                    # the texts are stripped, so the whitespaces at an anchored edge of a keyword would never match
+                    _match_keyword = _strip_anchored(_keyword, match_type) if self.normalizer.strip else _keyword
+                    if not _match_keyword:
+                        self.logger.warning(f"the {match_type} keyword {keyword!r} of {label} is empty and is skipped")
+                        continue
+                    keyword_id = len(self.keywords)
+                    self.keywords.append((label_id, _match_keyword, match_type))
+                    if match_type == KeywordMatchType.PARTIALLY:
+                        if _match_keyword not in self.label_match_any_keywords:
+                            self.label_match_any_tree.add(_match_keyword)
+                        self.label_match_any_keywords[_match_keyword].append(keyword_id)
+                    elif match_type == KeywordMatchType.START:
+                        _trie_add(self.label_match_start_trie, _match_keyword, keyword_id)
+                    elif match_type == KeywordMatchType.END:
+                        _trie_add(self.label_match_end_trie, _match_keyword[::-1], keyword_id)
+                    elif match_type == KeywordMatchType.ABSOLUTELY:
+                        self.label_match_full[_match_keyword].append(keyword_id)
+        self.label_match_any_tree.finalize()
+        self.logger.debug(f"label match any keywords: {len(self.label_match_any_keywords)}")
+        self.logger.debug(f"label match start trie: {len(self.label_match_start_trie)}")
+        self.logger.debug(f"label match end trie: {len(self.label_match_end_trie)}")
         self.logger.debug(f"label match full: {len(self.label_match_full)}")
-        self.mlb = MultiLabelBinarizer(classes=list(label_keywords.keys()))
-        self.mlb.fit([[label] for label in list(label_keywords.keys())])
+        self.mlb = MultiLabelBinarizer(classes=self.labels)
+        self.mlb.fit([[label] for label in self.labels])
 
     def predict(self, input_examples: Iterable[InputExample],
-                target: PredictTarget = None):
+                target: PredictTarget = None, telemetry: Optional[RuleTelemetry] = None):
 
         target = target if target is not None else self.target
-        x = parse_predict_target(input_examples=input_examples, target=target,
-                                 case_sensitive=self.case_sensitive)
+        x = self.normalizer.normalize(parse_predict_target(input_examples=input_examples, target=target))
+        if telemetry is not None:
+            telemetry.rows += len(x)
         matched_labels = []
         match_count_list = []
         for _predict_str in x:
             _match_count_list = []
             _matched_labels = []
-            for label in self.labels:
-                _matched_count = 0
-
-                # start matching rules
-                if self.label_match_any_trees[label].search(_predict_str.lower()):
-                    # matched_result[label].append(1)
-                    _matched_count += 1
-                    # break
-                for keyword in self.label_match_full[label]:
-                    if keyword == _predict_str:
-                        # matched_result[label].append(1)
-                        _matched_count += 1
-                        # break
-                for keyword in self.label_match_start[label]:
-                    if _predict_str.startswith(keyword):
-                        # matched_result[label].append(1)
-                        _matched_count += 1
-                        # break
-
-                for keyword in self.label_match_end[label]:
-                    if _predict_str.endswith(keyword):
-                        # matched_result[label].append(1)
-                        _matched_count += 1
-                        # break
-                if _matched_count > 0:
-                    _match_count_list.append((label, _matched_count))
-                    _matched_labels.append(label)
+            for label_id, _matched_count in sorted(self.match_counts(_predict_str, telemetry=telemetry).items()):
+                label = self.labels[label_id]
+                _match_count_list.append((label, _matched_count))
+                _matched_labels.append(label)
             if len(_matched_labels) > 0:
                 matched_labels.append(tuple(_matched_labels))
                 match_count_list.append(_match_count_list)
@@ -103,6 +110,73 @@ class KeywordModel(RuleBaseModel):
         else:
             return None, None
 
+    def create_telemetry(self) -> RuleTelemetry:
+        return RuleTelemetry([(self.labels[label_id], f'{match_type}:{keyword}')
+                              for label_id, keyword, match_type in self.keywords])
+
+    def match_counts(self, text: str, telemetry: Optional[RuleTelemetry] = None) -> Dict[int, int]:
+        """
+        count the matched rules of every label in a single string
+        Args:
+            text: a string normalized by ``self.normalizer``
+            telemetry: counts the hits of every keyword if given
+        Returns:
+            a dict of label id and matched count, labels without any match are left out
+        """
+        label_counts = defaultdict(int)
+
+        # a single pass of the shared automaton finds the PARTIALLY matches of all labels,
+        # each label is counted once no matter how many of its keywords are found
+        partially_matched = set()
+        found_keywords = set()
+        for keyword, _ in self.label_match_any_tree.search_all(text):
+            for keyword_id in self.label_match_any_keywords[keyword]:
+                partially_matched.add(self.keywords[keyword_id][0])
+            if telemetry is not None:
+                found_keywords.add(keyword)
+            elif len(partially_matched) == len(self.labels):
+                break
+        for label_id in partially_matched:
+            label_counts[label_id] += 1
+
+        # ABSOLUTELY, START and END are looked up in O(len(text)) whatever the size of the dictionaries
+        indexed_keyword_ids = [*self.label_match_full.get(text, []),
+                               *_trie_walk(self.label_match_start_trie, text),
+                               *_trie_walk(self.label_match_end_trie, reversed(text))]
+        for keyword_id in indexed_keyword_ids:
+            label_counts[self.keywords[keyword_id][0]] += 1
+
+        if telemetry is not None:
+            for keyword in found_keywords:
+                for keyword_id in self.label_match_any_keywords[keyword]:
+                    telemetry.hits[keyword_id] += 1
+            for keyword_id in indexed_keyword_ids:
+                telemetry.hits[keyword_id] += 1
+        return label_counts
+
+    def decide(self, text: str, telemetry: Optional[RuleTelemetry] = None) -> int:
+        decided_label_id = -1
+        # only the keywords found before an ambiguous row is rejected are counted by the telemetry
+        seen_keyword_ids = set()
+        for keyword_id in self._matched_keyword_ids(text):
+            if telemetry is not None and keyword_id not in seen_keyword_ids:
+                seen_keyword_ids.add(keyword_id)
+                telemetry.hits[keyword_id] += 1
+            label_id = self.keywords[keyword_id][0]
+            if decided_label_id == -1:
+                decided_label_id = label_id
+            elif label_id != decided_label_id:
+                return -1
+        return decided_label_id
+
+    def _matched_keyword_ids(self, text: str) -> Iterator[int]:
+        # the cheap lookups go first, so an ambiguous row may be rejected before the automaton scans it
+        yield from self.label_match_full.get(text, [])
+        yield from _trie_walk(self.label_match_start_trie, text)
+        yield from _trie_walk(self.label_match_end_trie, reversed(text))
+        for keyword, _ in self.label_match_any_tree.search_all(text):
+            yield from self.label_match_any_keywords[keyword]
+
     def eval(self, examples: List[InputExample], y_true):
         for index, y in enumerate(y_true):
             y_true[index] = y
@@ -119,18 +193,50 @@ class KeywordModel(RuleBaseModel):
         else:
             raise ValueError(f"模型尚未被訓練，或模型尚未被讀取。若模型已被訓練與儲存，請嘗試執行 ' load() ' 方法讀取模型。")
 
-def parse_predict_target(input_examples: Iterable[InputExample], target: PredictTarget = PredictTarget.CONTENT.value,
-                         case_sensitive: bool = False) -> List[str]:
-    return [_parse_predict_target(input_example, target=target, case_sensitive=case_sensitive)
-            for input_example in input_examples]
+def _strip_anchored(keyword: str, match_type: KeywordMatchType) -> str:
+    """strip the whitespaces of the edges a keyword is anchored to, a start keyword may still end with a space"""
+    if match_type == KeywordMatchType.START:
+        return keyword.lstrip()
+    if match_type == KeywordMatchType.END:
+        return keyword.rstrip()
+    if match_type == KeywordMatchType.ABSOLUTELY:
+        return keyword.strip()
+    return keyword
+
+
+def _trie_add(trie: Dict, keyword: str, keyword_id: int):
+    node = trie
+    for char in keyword:
+        node = node.setdefault(char, {})
+    # the ``None`` key holds the ids of the keywords ending at this node
+    node.setdefault(None, []).append(keyword_id)
+
+def _trie_walk(trie: Dict, text: Iterable[str]) -> Iterator[int]:
+    """yield the ids of every keyword in the trie which is a prefix of text"""
+    node = trie
+    yield from node.get(None, [])
+    for char in text:
+        node = node.get(char)
+        if node is None:
+            return
+        yield from node.get(None, [])
+
+# the targets which ``_parse_predict_target`` reads from an example
+BATCH_PREDICT_TARGETS = {PredictTarget.CONTENT.value, PredictTarget.AUTHOR_NAME.value, PredictTarget.S_AREA_ID.value}
+
+def parse_predict_target(input_examples: Iterable[InputExample],
+                         target: PredictTarget = PredictTarget.CONTENT.value) -> List[str]:
+    # a batch hands over the whole column, an unknown target is still rejected by the row parser
+    if isinstance(input_examples, ExampleBatch) and target in BATCH_PREDICT_TARGETS:
+        return list(input_examples.column(target))
+    return [_parse_predict_target(input_example, target=target) for input_example in input_examples]
 
-def _parse_predict_target(input_example: InputExample, target: PredictTarget = PredictTarget.CONTENT.value,
-                          case_sensitive: bool = False) -> str:
+def _parse_predict_target(input_example: InputExample, target: PredictTarget = PredictTarget.CONTENT.value) -> str:
     if target == PredictTarget.CONTENT.value:
-        return input_example.content if case_sensitive else input_example.content.lower()
+        return input_example.content
     elif target == PredictTarget.AUTHOR_NAME.value:
-        return input_example.author if case_sensitive else input_example.author.lower()
+        return input_example.author
     elif target == PredictTarget.S_AREA_ID.value:
-        return input_example.s_area_id if case_sensitive else input_example.s_area_id.lower()
+        return input_example.s_area_id
     else:
         raise ValueError(Errors.UNKNOWN_PREDICT_TARGET_TYPE.value)
@@ -1,10 +1,12 @@
 from ast import literal_eval
 
+from models.incremental_model import IncrementalModel
 from models.keyword_model import KeywordModel
+from models.ngram_model import CharNgramModel
 from models.rf_model import RandomForestModel
 from models.rule_model import RuleModel
 from models.tw_model import TermWeightModel
-from utils.selections import ModelType
+from utils.selections import ModelType, PredictTarget, VectorizerType
 
 class ModelTypeNotFound(Exception):
     pass
@@ -44,16 +46,53 @@ class ModelCreator():
             model_path = kwargs.get('model_path')
             if not model_path:
                 raise ParamterMissingError(f'model_path')
-            return RandomForestModel(model_dir_name=model_path)
+            return RandomForestModel(model_dir_name=model_path, **_vectorizer_params(kwargs),
+                                     **parse_model_params(kwargs))
 
         elif type_attribute == ModelType.TERM_WEIGHT_MODEL.value:
             model_path = kwargs.get('model_path')
             if not model_path:
                 raise ParamterMissingError(f'model_path')
-            return TermWeightModel(model_dir_name=model_path)
+            _params = parse_model_params(kwargs)
+            # the term weight model is always multi-label
+            _params.pop('is_multi_label', None)
+            return TermWeightModel(model_dir_name=model_path, **_vectorizer_params(kwargs), **_params)
+
+        elif type_attribute == ModelType.INCREMENTAL_MODEL.value:
+            model_path = kwargs.get('model_path')
+            if not model_path:
+                raise ParamterMissingError(f'model_path')
+            return IncrementalModel(model_dir_name=model_path, **parse_model_params(kwargs))
+
+        elif type_attribute == ModelType.CHAR_NGRAM_MODEL.value:
+            model_path = kwargs.get('model_path')
+            if not model_path:
+                raise ParamterMissingError(f'model_path')
+            params = {'n_features': int(kwargs.get('n_features'))} if kwargs.get('n_features') else {}
+            return CharNgramModel(model_dir_name=model_path, **params, **parse_model_params(kwargs))
 
         else:
             raise ModelTypeNotFound(f'{type_attribute} is unknown')
 
 
-
+def _vectorizer_params(kwargs):
+    # `vectorizer` of MODEL_INFO is tfidf or hashing, `n_features` only applies to hashing
+    params = {'vectorizer_type': VectorizerType(kwargs.get('vectorizer') or VectorizerType.TFIDF.value).value}
+    if kwargs.get('n_features'):
+        params['n_features'] = int(kwargs.get('n_features'))
+    return params
+
+
+def parse_model_params(kwargs):
+    """
+    the `feature`, `is_multi_label` and `na_tag` of MODEL_INFO, of a supervised stage of a cascade or of a preload
+    spec, a flag given as a string, e.g. "True" of a json body, is parsed as well
+    """
+    params = {}
+    if kwargs.get('feature'):
+        params['feature'] = PredictTarget(kwargs.get('feature'))
+    if kwargs.get('is_multi_label') is not None:
+        params['is_multi_label'] = str(kwargs.get('is_multi_label')).lower() in ('true', '1')
+    if kwargs.get('na_tag'):
+        params['na_tag'] = kwargs.get('na_tag')
+    return params
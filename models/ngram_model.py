@@ -0,0 +1,134 @@
+from typing import Iterable, List, Optional, Tuple
+
+import joblib
+import numpy as np
+from scipy.special import expit
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import classification_report, accuracy_score
+from sklearn.preprocessing import MultiLabelBinarizer
+from sklearn.utils.extmath import softmax
+
+from models.audience_models import SupervisedModel, MODEL_ROOT
+from utils.char_ngram_hasher import CharNgramHasher
+from utils.input_example import InputExample, example_field
+from utils.model_helper import load_joblib
+from utils.selections import PredictTarget, TrainingStage
+from utils.text_normalizer import TextNormalizer
+
+
+class CharNgramModel(SupervisedModel):
+    """
+    a linear model over the hashed character n-grams of a short text such as an author name, a whole column is
+    hashed by numpy and scored by a single sparse product with the coefficients, there is no segmentation and no
+    vocabulary, the artifact is a float32 array of n_features x labels which is memory-mapped when loaded,
+    a single-label model is a softmax over the labels, a multi-label one has a sigmoid per label
+    """
+    def __init__(self, model_dir_name, is_multi_label=False, feature=PredictTarget.AUTHOR_NAME,
+                 n_features: int = 2 ** 18, ngram_range: Tuple[int, int] = (1, 3), max_length: int = 32,
+                 C: float = 1.0, **kwargs):
+        super().__init__(model_dir_name, feature=feature, **kwargs)
+        self.is_multi_label = is_multi_label
+        self.hasher = CharNgramHasher(ngram_range=ngram_range, n_features=n_features, max_length=max_length)
+        # names are matched case and width insensitive, the same as the keyword dictionaries
+        self.normalizer = TextNormalizer()
+        self.C = C
+        self.classes: Optional[np.ndarray] = None
+        self.coef: Optional[np.ndarray] = None
+        self.intercept: Optional[np.ndarray] = None
+        self.model_path = self.model_dir_name / 'model.pkl'
+        self.coef_path = self.model_dir_name / 'coef.npy'
+
+    def load(self, mmap_mode: Optional[str] = None):
+        checkpoint = load_joblib(MODEL_ROOT / self.model_path)
+        self.classes = checkpoint['classes']
+        self.intercept = checkpoint['intercept']
+        self.is_multi_label = checkpoint['is_multi_label']
+        self.hasher = CharNgramHasher(**checkpoint['hasher'])
+        self.coef = np.load(MODEL_ROOT / self.coef_path, mmap_mode=mmap_mode)
+
+    def fit(self, examples: List[InputExample], y_true):
+        y_true = [[y] if isinstance(y, str) else list(y) for y in y_true]
+        self.report_progress(TrainingStage.VECTORIZATION)
+        x_features = self.hasher.transform(self.normalizer.normalize(example_field(examples, self.feature.value)))
+        self.report_progress(TrainingStage.FITTING)
+        if self.is_multi_label:
+            mlb = MultiLabelBinarizer()
+            y_indicator = mlb.fit_transform(y_true)
+            self.classes = mlb.classes_
+            coef, intercept = [], []
+            for column in range(y_indicator.shape[1]):
+                tmp_y = y_indicator[:, column]
+                if tmp_y.min() == tmp_y.max():
+                    # a label which is always or never given gets a constant score
+                    coef.append(np.zeros(self.hasher.n_features))
+                    intercept.append(10.0 if tmp_y[0] else -10.0)
+                    continue
+                classifier = LogisticRegression(C=self.C, max_iter=1000).fit(x_features, tmp_y)
+                coef.append(classifier.coef_[0])
+                intercept.append(classifier.intercept_[0])
+            coef, intercept = np.vstack(coef), np.asarray(intercept)
+        else:
+            classifier = LogisticRegression(C=self.C, max_iter=1000).fit(x_features, [y[0] for y in y_true])
+            self.classes = classifier.classes_
+            coef, intercept = classifier.coef_, classifier.intercept_
+            if len(self.classes) == 2:
+                # the binary model scores the second class only, a softmax over (0, score) is the same sigmoid
+                coef = np.vstack([np.zeros_like(coef[0]), coef[0]])
+                intercept = np.asarray([0.0, intercept[0]])
+        self.coef = np.ascontiguousarray(coef.T, dtype=np.float32)
+        self.intercept = intercept.astype(np.float64)
+        self.report_progress(TrainingStage.SAVING)
+        return self.save()
+
+    def predict_batch(self, texts: Iterable[str], normalized: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        predict a whole column of strings at once
+        Args:
+            texts: the target column, e.g. ``df['author'].values``
+            normalized: texts are already normalized by ``self.normalizer``, e.g. by ``get_normalized_column``
+        Returns:
+            the labels, an indicator array of rows x labels for the multi-label model, otherwise the label of
+            every row, and the probabilities of rows x labels, the columns follow ``self.classes``
+        """
+        if self.coef is None:
+            raise ValueError(f"模型尚未被訓練，或模型尚未被讀取。若模型已被訓練與儲存，請嘗試執行 ' load() ' 方法讀取模型。")
+        texts = list(texts) if normalized else self.normalizer.normalize(texts)
+        scores = np.asarray(self.hasher.transform(texts) @ self.coef, dtype=np.float64) + self.intercept
+        if self.is_multi_label:
+            predict_logits = expit(scores)
+            predict_labels = (predict_logits > 0.5).astype(int)
+        else:
+            predict_logits = softmax(scores, copy=False)
+            predict_labels = self.classes.take(np.argmax(predict_logits, axis=1))
+        return predict_labels, predict_logits
+
+    def predict(self, examples) -> Tuple[np.ndarray, np.ndarray]:
+        return self.predict_batch(example_field(examples, self.feature.value))
+
+    def eval(self, examples, y_true):
+        if self.coef is None:
+            raise ValueError(f"模型尚未被訓練，或模型尚未被讀取。若模型已被訓練與儲存，請嘗試執行 ' load() ' 方法讀取模型。")
+        predict_labels, predict_logits = self.predict(examples)
+        if self.is_multi_label:
+            mlb = MultiLabelBinarizer(classes=list(self.classes))
+            y_true = mlb.fit_transform([[y] if isinstance(y, str) else y for y in y_true])
+            report = classification_report(y_true, predict_labels, output_dict=True, zero_division=1,
+                                           target_names=list(self.classes))
+            report['accuracy'] = accuracy_score(y_true, predict_labels)
+        else:
+            y_true = [y if isinstance(y, str) else y[0] for y in y_true]
+            report = classification_report(y_true, predict_labels, output_dict=True, zero_division=1)
+        return report
+
+    def save(self):
+        model_dir = MODEL_ROOT / self.model_dir_name
+        model_dir.mkdir(parents=True, exist_ok=True)
+        joblib.dump({'classes': self.classes,
+                     'intercept': self.intercept,
+                     'is_multi_label': self.is_multi_label,
+                     'hasher': {'ngram_range': self.hasher.ngram_range,
+                                'n_features': self.hasher.n_features,
+                                'max_length': self.hasher.max_length}},
+                    MODEL_ROOT / self.model_path)
+        np.save(MODEL_ROOT / self.coef_path, self.coef)
+        return self.model_dir_name
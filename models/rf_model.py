@@ -1,8 +1,11 @@
-from typing import Optional, List
+import time
+from pathlib import Path
+from typing import Dict, Optional, List, Tuple, Union
 
-import jieba
 import joblib
 import numpy as np
+from joblib import Parallel, delayed
+from scipy.sparse import csr_matrix
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics import classification_report
@@ -10,13 +13,24 @@ from sklearn.multiclass import OneVsRestClassifier
 from sklearn.preprocessing import MultiLabelBinarizer
 
 from models.audience_models import SupervisedModel, MODEL_ROOT
+from utils.hashed_vectorizer import HashedTfidfVectorizer
+from utils.input_example import example_field
 from utils.model_helper import load_joblib, get_multi_accuracy
-from utils.selections import PredictTarget
+from utils.segmenter import get_segmenter
+from utils.selections import PredictTarget, TrainingStage, VectorizerType
 
 
 class RandomForestModel(SupervisedModel):
-    def __init__(self, model_dir_name, is_multi_label=False, feature=PredictTarget.CONTENT, **kwargs):
+    def __init__(self, model_dir_name, is_multi_label=False, feature=PredictTarget.CONTENT,
+                 chunk_size: int = 10000, n_jobs: int = 1,
+                 vectorizer_type: str = VectorizerType.TFIDF.value, n_features: int = 2 ** 18, **kwargs):
         super().__init__(model_dir_name, feature=feature, **kwargs)
+        # the hashing vectorizer keeps no vocabulary, only an idf array of ``n_features`` is saved
+        self.vectorizer_type = VectorizerType(vectorizer_type)
+        self.n_features = n_features
+        # ``predict`` splits the rows into chunks of ``chunk_size`` and runs ``n_jobs`` of them at once
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
         self.available_features = {
             PredictTarget.TITLE,
             PredictTarget.CONTENT,
@@ -29,30 +43,56 @@ class RandomForestModel(SupervisedModel):
         self.vectorizer_path = self.model_dir_name / 'vectorizer.pkl'
         self.mlb: Optional[MultiLabelBinarizer] = None
         self.mlb_path = self.model_dir_name / 'mlb.pkl'
+        # the trees exported as flat arrays by ``export_forest``, ``predict`` runs on them once they exist
+        self.forest_dir_name = self.model_dir_name / 'forest'
+        self.forest: Optional[CompactForest] = None
 
-    def load(self):
-        self.model = load_joblib(MODEL_ROOT / self.model_path)
-        self.vectorizer = load_joblib(MODEL_ROOT / self.vectorizer_path)
+    @property
+    def classes_(self) -> np.ndarray:
+        return self.forest.classes if self.forest is not None else self.model.classes_
+
+    def load(self, mmap_mode: Optional[str] = None):
+        """
+        load the exported forest arrays, the pickled estimator is only unpickled if there are no arrays
+        or they are older than the estimator, with ``mmap_mode`` the arrays are memory-mapped and shared
+        between processes
+        """
+        forest_file = MODEL_ROOT / self.forest_dir_name / 'value.npy'
+        model_file = MODEL_ROOT / self.model_path
+        if forest_file.exists() and \
+                (not model_file.exists() or forest_file.stat().st_mtime >= model_file.stat().st_mtime):
+            self.forest = CompactForest.load(MODEL_ROOT / self.forest_dir_name, mmap_mode=mmap_mode)
+            self.model = None
+        else:
+            self.model = load_joblib(model_file, mmap_mode=mmap_mode)
+            self.forest = None
+        self.vectorizer = load_joblib(MODEL_ROOT / self.vectorizer_path, mmap_mode=mmap_mode)
         if self.is_multi_label:
-            self.mlb = load_joblib(MODEL_ROOT / self.mlb_path)
+            self.mlb = load_joblib(MODEL_ROOT / self.mlb_path, mmap_mode=mmap_mode)
 
     def convert_feature(self, examples,
                         update_vectorizer=False,
                         max_features=5000, min_df=2, stop_words='english'):
-        seg_contents = []
-        for example in examples:
-            content = getattr(example, self.feature.value)
-            if self.feature in {PredictTarget.CONTENT, PredictTarget.TITLE}:
-                sentence = jieba.lcut(str(content))
-            elif self.feature in {PredictTarget.AUTHOR, }:
-                sentence = list(content)
-            else:
-                raise ValueError(f"Unavailable feature type {self.feature}")
-            seg_contents.append(" ".join(sentence))
+        if update_vectorizer:
+            self.report_progress(TrainingStage.SEGMENTATION)
+        contents = [str(content) for content in example_field(examples, self.feature.value)]
+        if self.feature in {PredictTarget.CONTENT, PredictTarget.TITLE}:
+            sentences = get_segmenter().segment_batch(contents)
+        elif self.feature in {PredictTarget.AUTHOR_NAME, }:
+            sentences = [list(content) for content in contents]
+        else:
+            raise ValueError(f"Unavailable feature type {self.feature}")
+        seg_contents = [" ".join(sentence) for sentence in sentences]
 
         if update_vectorizer:
+            self.report_progress(TrainingStage.VECTORIZATION)
             if self.vectorizer is None:
-                self.vectorizer = TfidfVectorizer(max_features=max_features, min_df=min_df, stop_words=stop_words)
+                if self.vectorizer_type == VectorizerType.HASHING:
+                    self.vectorizer = HashedTfidfVectorizer(n_features=self.n_features, min_df=min_df,
+                                                            stop_words=stop_words, n_jobs=self.n_jobs)
+                else:
+                    self.vectorizer = TfidfVectorizer(max_features=max_features, min_df=min_df,
+                                                      stop_words=stop_words)
             x_features = self.vectorizer.fit_transform(seg_contents)
         else:
             if self.vectorizer:
@@ -76,22 +116,46 @@ class RandomForestModel(SupervisedModel):
         else:
             y_true = np.asarray(y_true).ravel()
             self.model = classifier
+        self.report_progress(TrainingStage.FITTING)
         self.model.fit(x_train_features, y_true)
+        self.forest = None
+        self.report_progress(TrainingStage.SAVING)
         return self.save()
 
-    def predict(self, examples):
+    def predict(self, examples) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        the forest is only evaluated once by ``predict_proba``, the labels are derived from the probabilities
+        in the same way as ``predict`` of the estimator
+        Returns:
+            the labels, an indicator array of rows x classes for the multi-label model, otherwise the class of
+            every row, and the probabilities of rows x classes, the columns follow ``self.model.classes_``
+        """
         x_features = self.convert_feature(examples)
-        predict_labels = self.model.predict(x_features)
-        predict_logits = self.model.predict_proba(x_features)
-        predict_logits = [tuple([elem for elem in zip(self.model.classes_, r)]) for r in predict_logits]
+        predict_logits = self.predict_proba(x_features)
+        if self.is_multi_label:
+            # every one-vs-rest forest votes for its label with a probability above 0.5
+            predict_labels = (predict_logits > 0.5).astype(int)
+        else:
+            predict_labels = self.classes_.take(np.argmax(predict_logits, axis=1), axis=0)
         return predict_labels, predict_logits
 
+    def predict_proba(self, x_features) -> np.ndarray:
+        n_rows = x_features.shape[0]
+        predict_proba = self.forest.predict_proba if self.forest is not None else self.model.predict_proba
+        if n_rows <= self.chunk_size:
+            return predict_proba(x_features)
+        # the trees release the GIL, so the chunks run in threads and share the model
+        chunks = Parallel(n_jobs=self.n_jobs, prefer='threads')(
+            delayed(predict_proba)(x_features[start:start + self.chunk_size])
+            for start in range(0, n_rows, self.chunk_size))
+        return np.vstack(chunks)
+
     def eval(self, examples, y_true):
 
         for index, y in enumerate(y_true):
             y_true[index] = y
 
-        if self.model and self.vectorizer:
+        if (self.model or self.forest is not None) and self.vectorizer:
             predict_labels, predict_logits = self.predict(examples)
             if self.is_multi_label:
                 y_true = self.mlb.transform(y_true)
@@ -108,11 +172,260 @@ class RandomForestModel(SupervisedModel):
         tmp_model_dir = MODEL_ROOT / self.model_dir_name
         if not tmp_model_dir.exists():
             tmp_model_dir.mkdir(parents=True, exist_ok=True)
-        joblib.dump(self.model, MODEL_ROOT / self.model_path)
+        if self.model is not None:
+            joblib.dump(self.model, MODEL_ROOT / self.model_path)
         joblib.dump(self.vectorizer, MODEL_ROOT / self.vectorizer_path)
         if self.is_multi_label:
             joblib.dump(self.mlb, MODEL_ROOT / self.mlb_path)
+        # the exported arrays are written after the estimator so that they are not older than it
+        if self.forest is not None:
+            self.forest.save(MODEL_ROOT / self.forest_dir_name)
 
         return self.model_dir_name
 
+    def export_forest(self, max_depth: Optional[int] = None, n_trees: Optional[int] = None,
+                      examples=None, y_true=None) -> Dict:
+        """
+        export the trees of the estimator to flat arrays, optionally pruned, the model has to be saved
+        to keep the result, a saved forest is loaded without unpickling the estimator and is shared by mmap,
+        the numpy walk is not as fast as the compiled one of sklearn on deep trees, the timings of the
+        validation set tell whether the pruned forest pays off
+        Args:
+            max_depth: cut every tree below this depth, the nodes at the depth become leaves
+            n_trees: only keep the first n trees of every forest
+            examples: a validation set, the accuracy of the estimator and of the pruned forest are compared if given
+            y_true: the labels of the validation set
+        Returns:
+            the number of trees and nodes before and after, and the accuracy delta and the seconds of ``eval``
+        """
+        if self.model is None:
+            raise ValueError(f"模型尚未被訓練，或模型尚未被讀取。若模型已被訓練與儲存，請嘗試執行 ' load() ' 方法讀取模型。")
+        forest = CompactForest.from_estimator(self.model)
+        report = {'trees_before': len(forest.roots), 'nodes_before': len(forest.feature)}
+        if examples is not None:
+            self.forest = None
+            start = time.perf_counter()
+            report['accuracy_before'] = self.eval(examples, list(y_true))['accuracy']
+            report['seconds_before'] = time.perf_counter() - start
+
+        self.forest = forest.prune(max_depth=max_depth, n_trees=n_trees)
+
+        report['trees_after'] = len(self.forest.roots)
+        report['nodes_after'] = len(self.forest.feature)
+        if examples is not None:
+            start = time.perf_counter()
+            report['accuracy_after'] = self.eval(examples, list(y_true))['accuracy']
+            report['seconds_after'] = time.perf_counter() - start
+            report['accuracy_delta'] = report['accuracy_after'] - report['accuracy_before']
+        return report
+
+
+class CompactForest(object):
+    """
+    the trees of a random forest, or of the one-vs-rest forests of a multi-label model, as flat node arrays,
+    the nodes of every tree are concatenated and the children point to the global node ids, a whole batch of
+    sparse rows walks down every tree at once, the arrays are saved as ``.npy`` files and may be memory-mapped,
+    the node tables of the walk are only built when the first batch is evaluated
+    Args:
+        classes: the classes of the estimator
+        split_features: the sorted columns of the input which any node splits on
+        feature: the feature of every split node, as a position in ``split_features``
+        threshold: the threshold of every split node, a row goes left if its value is not above it
+        children_left: the left child of every node, -1 for a leaf
+        children_right: the right child of every node, -1 for a leaf
+        value: the normalized class distribution of every node, a single column of the positive class
+            for the one-vs-rest forests
+        roots: the root node of every tree
+        tree_columns: the first output column which every tree adds its leaf value to
+    """
+    array_names = ('split_features', 'feature', 'threshold', 'children_left', 'children_right', 'value',
+                   'roots', 'tree_columns')
+
+    def __init__(self, classes: np.ndarray, split_features: np.ndarray, feature: np.ndarray, threshold: np.ndarray,
+                 children_left: np.ndarray, children_right: np.ndarray, value: np.ndarray,
+                 roots: np.ndarray, tree_columns: np.ndarray):
+        self.classes = classes
+        self.split_features = split_features
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.tree_columns = tree_columns
+        # the trees added to every output column, the probabilities are their average
+        self.n_columns = len(classes)
+        self.column_trees = np.zeros(self.n_columns)
+        for column in self.tree_columns:
+            self.column_trees[column:column + self.value.shape[1]] += 1
+        self._children: Optional[np.ndarray] = None
+        self._feature: Optional[np.ndarray] = None
+        self._threshold: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_estimator(cls, estimator: Union[RandomForestClassifier, OneVsRestClassifier]) -> 'CompactForest':
+        trees = []
+        if isinstance(estimator, OneVsRestClassifier):
+            if len(estimator.estimators_) < 2:
+                raise ValueError('a one-vs-rest model of a single label can not be exported')
+            for column, forest in enumerate(estimator.estimators_):
+                if hasattr(forest, 'estimators_'):
+                    trees.extend((column, tree.tree_, 1) for tree in forest.estimators_)
+                else:
+                    # a label which is always or never given is predicted by a constant
+                    trees.append((column, float(forest.y_[0]), None))
+        else:
+            trees.extend((0, tree.tree_, None) for tree in estimator.estimators_)
+
+        feature, threshold, children_left, children_right, value, roots, tree_columns = [], [], [], [], [], [], []
+        n_nodes = 0
+        for column, tree, value_column in trees:
+            roots.append(n_nodes)
+            tree_columns.append(column)
+            if isinstance(tree, float):
+                feature.append(np.zeros(1, dtype=np.int32))
+                threshold.append(np.zeros(1))
+                children_left.append(np.full(1, -1, dtype=np.int32))
+                children_right.append(np.full(1, -1, dtype=np.int32))
+                value.append(np.asarray([[tree]]))
+                n_nodes += 1
+                continue
+            is_leaf = tree.children_left == -1
+            feature.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            threshold.append(tree.threshold.astype(np.float64))
+            children_left.append(np.where(is_leaf, -1, tree.children_left + n_nodes).astype(np.int32))
+            children_right.append(np.where(is_leaf, -1, tree.children_right + n_nodes).astype(np.int32))
+            # the class distribution of a node is normalized as ``predict_proba`` of the tree does
+            proba = tree.value[:, 0, :].astype(np.float64)
+            normalizer = proba.sum(axis=1)
+            normalizer[normalizer == 0.0] = 1.0
+            proba = proba / normalizer[:, np.newaxis]
+            value.append(proba[:, [value_column]] if value_column is not None else proba)
+            n_nodes += tree.node_count
+        feature = np.concatenate(feature)
+        split_features = np.unique(feature[np.concatenate(children_left) != -1])
+        return cls(classes=np.asarray(estimator.classes_), split_features=split_features.astype(np.int32),
+                   feature=np.searchsorted(split_features, feature).astype(np.int32),
+                   threshold=np.concatenate(threshold),
+                   children_left=np.concatenate(children_left), children_right=np.concatenate(children_right),
+                   value=np.concatenate(value), roots=np.asarray(roots, dtype=np.int64),
+                   tree_columns=np.asarray(tree_columns, dtype=np.int32))
+
+    @classmethod
+    def load(cls, forest_dir: Path, mmap_mode: Optional[str] = 'r') -> 'CompactForest':
+        classes = np.load(forest_dir / 'classes.npy')
+        arrays = {name: np.load(forest_dir / f'{name}.npy', mmap_mode=mmap_mode) for name in cls.array_names}
+        return cls(classes=classes, **arrays)
+
+    def save(self, forest_dir: Path):
+        forest_dir.mkdir(parents=True, exist_ok=True)
+        np.save(forest_dir / 'classes.npy', np.asarray(self.classes))
+        for name in self.array_names:
+            np.save(forest_dir / f'{name}.npy', getattr(self, name))
+
+    def node_depth(self) -> np.ndarray:
+        depth = np.zeros(len(self.feature), dtype=np.int32)
+        frontier = np.asarray(self.roots, dtype=np.int64)
+        level = 0
+        while frontier.size:
+            depth[frontier] = level
+            frontier = frontier[self.children_left[frontier] != -1]
+            frontier = np.concatenate([self.children_left[frontier], self.children_right[frontier]])
+            level += 1
+        return depth
+
+    def prune(self, max_depth: Optional[int] = None, n_trees: Optional[int] = None) -> 'CompactForest':
+        """
+        a smaller forest without the trees after the first ``n_trees`` of every forest and the nodes below
+        ``max_depth``, a split node at ``max_depth`` becomes a leaf of its class distribution
+        """
+        tree_ids = np.arange(len(self.roots))
+        keep_trees = np.ones(len(self.roots), dtype=bool)
+        if n_trees is not None:
+            # the trees of a forest are consecutive, the rank of a tree is counted from the first one of its column
+            first_tree = np.searchsorted(self.tree_columns, self.tree_columns, side='left')
+            keep_trees = tree_ids - first_tree < n_trees
+
+        tree_of_node = np.repeat(tree_ids, np.diff(np.append(self.roots, len(self.feature))))
+        keep = keep_trees[tree_of_node]
+        is_cut = np.zeros(len(self.feature), dtype=bool)
+        if max_depth is not None:
+            depth = self.node_depth()
+            keep &= depth <= max_depth
+            is_cut = depth == max_depth
+
+        new_ids = np.cumsum(keep) - 1
+        is_leaf = (np.asarray(self.children_left) == -1) | is_cut
+        children_left = np.where(is_leaf, -1, new_ids[np.maximum(self.children_left, 0)])[keep]
+        children_right = np.where(is_leaf, -1, new_ids[np.maximum(self.children_right, 0)])[keep]
+        return CompactForest(classes=self.classes,
+                             split_features=np.asarray(self.split_features),
+                             feature=np.asarray(self.feature)[keep],
+                             threshold=np.asarray(self.threshold)[keep],
+                             children_left=children_left.astype(np.int32),
+                             children_right=children_right.astype(np.int32),
+                             value=np.asarray(self.value)[keep],
+                             roots=new_ids[self.roots[keep_trees]].astype(np.int64),
+                             tree_columns=np.asarray(self.tree_columns)[keep_trees])
+
+    def build(self):
+        """the node tables of ``apply``, a leaf is its own child on both sides so a finished walk stays put"""
+        node_ids = np.arange(len(self.feature))
+        is_leaf = np.asarray(self.children_left) == -1
+        self._children = np.empty(2 * len(node_ids), dtype=np.int64)
+        self._children[0::2] = np.where(is_leaf, node_ids, self.children_left)
+        self._children[1::2] = np.where(is_leaf, node_ids, self.children_right)
+        self._feature = np.where(is_leaf, 0, self.feature).astype(np.int64)
+        self._threshold = np.where(is_leaf, np.inf, self.threshold)
+
+    def apply(self, x_features, block_size: int = 2 ** 22) -> np.ndarray:
+        """
+        Args:
+            x_features: the sparse rows
+            block_size: the values of a block of rows which is made dense at once
+        Returns:
+            the leaf of every row in every tree, rows x trees
+        """
+        if self._children is None:
+            self.build()
+        n_rows, n_trees = x_features.shape[0], len(self.roots)
+        if len(self.split_features) == 0:
+            return np.tile(np.asarray(self.roots, dtype=np.int64), (n_rows, 1))
+        # only the split features are read, the values are compared in float32 as the sklearn trees do
+        x = csr_matrix(x_features, dtype=np.float32)[:, self.split_features]
+        width = len(self.split_features)
+        block_rows = max(1, block_size // width)
+        leaves = np.empty(n_rows * n_trees, dtype=np.int64)
+        for start in range(0, n_rows, block_rows):
+            block = x[start:start + block_rows]
+            dense = block.toarray().ravel()
+            # every (row, tree) walks down one level per pass
+            nodes = np.tile(np.asarray(self.roots, dtype=np.int64), block.shape[0])
+            offsets = np.repeat(np.arange(block.shape[0], dtype=np.int64) * width, n_trees)
+            slots = np.arange(start * n_trees, (start + block.shape[0]) * n_trees)
+            while nodes.size:
+                go_right = dense[offsets + self._feature[nodes]] > self._threshold[nodes]
+                next_nodes = self._children[2 * nodes + go_right]
+                done = next_nodes == nodes
+                n_done = np.count_nonzero(done)
+                # the finished walks are only dropped once they are a good part of the pass
+                if n_done == nodes.size or n_done > 0.1 * nodes.size:
+                    leaves[slots[done]] = nodes[done]
+                    keep = ~done
+                    nodes, offsets, slots = next_nodes[keep], offsets[keep], slots[keep]
+                else:
+                    nodes = next_nodes
+        return leaves.reshape(n_rows, n_trees)
+
+    def predict_proba(self, x_features) -> np.ndarray:
+        """the average of the leaf values of the trees, the same as ``predict_proba`` of the estimator"""
+        leaves = self.apply(x_features)
+        width = self.value.shape[1]
+        proba = np.zeros((leaves.shape[0], self.n_columns))
+        # added tree by tree in the order of the estimator, so that the sums are the same to the last bit
+        for tree_id, column in enumerate(self.tree_columns):
+            proba[:, column:column + width] += self.value[leaves[:, tree_id]]
+        proba /= self.column_trees
+        return proba
+
 
@@ -1,59 +1,91 @@
 import re
-from typing import Iterable, Dict, List
+import time
+from typing import Iterable, Dict, List, Optional, Pattern, Tuple, Set
 
+from ahocorapy.keywordtree import KeywordTree
 from sklearn.metrics import classification_report, accuracy_score
 from sklearn.preprocessing import MultiLabelBinarizer
 
 from models.audience_models import RuleBaseModel
-from utils.input_example import InputExample
+from utils.input_example import ExampleBatch, InputExample
 
+from utils.rule_telemetry import RuleTelemetry
 from utils.selections import ModelType, PredictTarget, Errors
+from utils.text_normalizer import TextNormalizer
 
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+# patterns which refer to their own groups can not be wrapped into an alternation, since group numbers shift
+UNCOMBINABLE_PATTERN = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
 
 
 class RuleModel(RuleBaseModel):
+    # bump it whenever the compiled structures change, so cached artifacts are rebuilt
+    compiled_version = 4
+
     def __init__(self, model_rules: Dict[str, List[str]] = None,
                  name: str = None,
                  model_type: ModelType = ModelType.RULE_MODEL,
                  target: PredictTarget = PredictTarget.CONTENT,
+                 normalizer: Optional[TextNormalizer] = None,
                  verbose: bool = False):
+        # regex patterns are not width folded, full-width characters in a pattern are kept as they are
+        normalizer = normalizer if normalizer is not None else TextNormalizer(fold_width=False)
         super().__init__(name=name if name is not None else "RuleModel", model_type=model_type, target=target,
-                         logger_name="RuleModel", verbose=verbose)
+                         normalizer=normalizer, logger_name="RuleModel", verbose=verbose)
         self.logger.debug("model Init")
         self.label_patterns = None
         self.labels = []
+        self.rules: List[Tuple[int, Pattern]] = []
+        self.label_gates: List[Optional[Pattern]] = []
+        self.label_gated_rule_ids: List[List[int]] = []
+        self.label_ungated_rule_ids: List[List[int]] = []
+        self.rule_literals: List[Optional[str]] = []
+        self.literal_rule_ids: Dict[str, List[int]] = {}
+        self.literal_tree = None
+        self.label_gate_unfiltered: List[bool] = []
         if model_rules:
             self.load(model_rules)
 
     def load(self, label_patterns: Dict[str, List[str]] = None):
         self.label_patterns = label_patterns
         self.labels = [label for label in self.label_patterns.keys()]
+        self.rules.clear()
+        self.label_gates.clear()
+        self.label_gated_rule_ids.clear()
+        self.label_ungated_rule_ids.clear()
+        for label_id, patterns in enumerate(self.label_patterns.values()):
+            gate, gated_rule_ids, ungated_rule_ids = self._compile_label_rules(label_id, patterns)
+            self.label_gates.append(gate)
+            self.label_gated_rule_ids.append(gated_rule_ids)
+            self.label_ungated_rule_ids.append(ungated_rule_ids)
+        self._build_prefilter()
         self.logger.debug(f"labels size: {len(self.labels)}")
+        self.logger.debug(f"rules size: {len(self.rules)}")
+        self.logger.debug(f"prefiltered rules size: {sum(1 for literal in self.rule_literals if literal)}")
         self.mlb = MultiLabelBinarizer(classes=list(label_patterns.keys()))
         self.mlb.fit([[label] for label in list(label_patterns.keys())])
         # print(self.mlb.classes)
 
     def predict(self, input_examples: Iterable[InputExample],
-                target=None):
+                target=None, telemetry: Optional[RuleTelemetry] = None):
         target = target if target is not None else self.target
-        x = parse_predict_target(input_examples=input_examples, target=target,
-                                 case_sensitive=self.case_sensitive)
+        x = self.normalizer.normalize(parse_predict_target(input_examples=input_examples, target=target))
+        if telemetry is not None:
+            telemetry.rows += len(x)
         matched_labels = []
         match_count_list = []
         for _predict_str in x:
             _match_count_list = []
             _matched_labels = []
-            for label, patterns in self.label_patterns.items():
-                _matched_count = 0
-
-                for pattern in patterns:
-                    if re.search(pattern=pattern, string=_predict_str.lower()):
-                        _matched_count += 1
-
-
-                if _matched_count > 0:
-                    _match_count_list.append((label, _matched_count))
-                    _matched_labels.append(label)
+            for label_id, _matched_count in sorted(self.match_counts(_predict_str, telemetry=telemetry).items()):
+                label = self.labels[label_id]
+                _match_count_list.append((label, _matched_count))
+                _matched_labels.append(label)
 
             if len(_matched_labels) > 0:
                 matched_labels.append(tuple(_matched_labels))
@@ -66,6 +98,130 @@ class RuleModel(RuleBaseModel):
         else:
             return None, None
 
+    def _compile_label_rules(self, label_id: int, patterns: List[str]) -> Tuple[Optional[Pattern], List[int], List[int]]:
+        """
+        compile the patterns of a label, the combinable ones are also joined into a single alternation,
+        which scans the string once and tells whether any of them is matched
+        Returns:
+            the alternation (None if less than two patterns are combinable),
+            the rule ids behind the alternation and the rule ids which have to be searched one by one
+        """
+        gated_rule_ids = []
+        ungated_rule_ids = []
+        for pattern in patterns:
+            compiled = re.compile(pattern)
+            rule_id = len(self.rules)
+            self.rules.append((label_id, compiled))
+            # patterns with inline flags are left out as well, a global flag would leak into the other patterns
+            if UNCOMBINABLE_PATTERN.search(pattern) or compiled.flags & ~re.UNICODE:
+                ungated_rule_ids.append(rule_id)
+            else:
+                gated_rule_ids.append(rule_id)
+
+        gate = None
+        if len(gated_rule_ids) > 1:
+            try:
+                gate = re.compile('|'.join(f'(?:{self.rules[rule_id][1].pattern})' for rule_id in gated_rule_ids))
+            except re.error:
+                gate = None
+        if gate is None:
+            ungated_rule_ids = gated_rule_ids + ungated_rule_ids
+            gated_rule_ids = []
+        return gate, gated_rule_ids, ungated_rule_ids
+
+    def _build_prefilter(self):
+        """
+        a rule can only be matched if its required literal occurs in the string, one pass of an automaton over
+        the literals of every rule tells which rules are worth searching, rules without literals are always searched
+        """
+        self.rule_literals = [max(extract_required_literals(rule.pattern), key=len, default=None)
+                              for _, rule in self.rules]
+        self.literal_rule_ids = {}
+        for rule_id, literal in enumerate(self.rule_literals):
+            if literal:
+                self.literal_rule_ids.setdefault(literal, []).append(rule_id)
+        self.literal_tree = None
+        if self.literal_rule_ids:
+            self.literal_tree = KeywordTree()
+            for literal in self.literal_rule_ids.keys():
+                self.literal_tree.add(literal)
+            self.literal_tree.finalize()
+        self.label_gate_unfiltered = [any(not self.rule_literals[rule_id] for rule_id in gated_rule_ids)
+                                      for gated_rule_ids in self.label_gated_rule_ids]
+
+    def _candidate_rule_ids(self, text: str) -> Set[int]:
+        candidates = set()
+        if self.literal_tree is not None:
+            found_literals = set()
+            for literal, _ in self.literal_tree.search_all(text):
+                if literal not in found_literals:
+                    found_literals.add(literal)
+                    candidates.update(self.literal_rule_ids[literal])
+        return candidates
+
+    def _is_candidate(self, rule_id: int, candidates: Set[int]) -> bool:
+        return not self.rule_literals[rule_id] or rule_id in candidates
+
+    def create_telemetry(self) -> RuleTelemetry:
+        """the rules come first by rule id, followed by the alternation of every label"""
+        return RuleTelemetry([(self.labels[label_id], rule.pattern) for label_id, rule in self.rules] +
+                             [(label, '(alternation)') for label in self.labels])
+
+    def _search(self, rule_id: int, text: str, telemetry: Optional[RuleTelemetry] = None) -> bool:
+        if telemetry is None:
+            return self.rules[rule_id][1].search(text) is not None
+        start = time.perf_counter()
+        matched = self.rules[rule_id][1].search(text) is not None
+        telemetry.seconds[rule_id] += time.perf_counter() - start
+        telemetry.hits[rule_id] += matched
+        return matched
+
+    def _gate_search(self, label_id: int, text: str, candidate_labels: Set[int],
+                     telemetry: Optional[RuleTelemetry] = None) -> bool:
+        # the alternation can only be matched by a rule of the label whose literal occurs, or which has none
+        gate = self.label_gates[label_id]
+        if gate is None or not (self.label_gate_unfiltered[label_id] or label_id in candidate_labels):
+            return False
+        if telemetry is None:
+            return gate.search(text) is not None
+        gate_id = len(self.rules) + label_id
+        start = time.perf_counter()
+        matched = gate.search(text) is not None
+        telemetry.seconds[gate_id] += time.perf_counter() - start
+        telemetry.hits[gate_id] += matched
+        return matched
+
+    def match_counts(self, text: str, telemetry: Optional[RuleTelemetry] = None) -> Dict[int, int]:
+        label_counts = {}
+        candidates = self._candidate_rule_ids(text)
+        candidate_labels = {self.rules[rule_id][0] for rule_id in candidates}
+        for label_id in range(len(self.labels)):
+            _matched_count = 0
+            # the single patterns are only counted once the alternation tells one of them is matched
+            if self._gate_search(label_id, text, candidate_labels, telemetry):
+                for rule_id in self.label_gated_rule_ids[label_id]:
+                    if self._is_candidate(rule_id, candidates) and self._search(rule_id, text, telemetry):
+                        _matched_count += 1
+            for rule_id in self.label_ungated_rule_ids[label_id]:
+                if self._is_candidate(rule_id, candidates) and self._search(rule_id, text, telemetry):
+                    _matched_count += 1
+            if _matched_count > 0:
+                label_counts[label_id] = _matched_count
+        return label_counts
+
+    def decide(self, text: str, telemetry: Optional[RuleTelemetry] = None) -> int:
+        decided_label_id = -1
+        candidates = self._candidate_rule_ids(text)
+        candidate_labels = {self.rules[rule_id][0] for rule_id in candidates}
+        for label_id in range(len(self.labels)):
+            if self._gate_search(label_id, text, candidate_labels, telemetry) or \
+                    any(self._is_candidate(rule_id, candidates) and self._search(rule_id, text, telemetry)
+                        for rule_id in self.label_ungated_rule_ids[label_id]):
+                if decided_label_id != -1:
+                    return -1
+                decided_label_id = label_id
+        return decided_label_id
+
     def eval(self, examples: List[InputExample], y_true):
         for index, y in enumerate(y_true):
             y_true[index] = y
@@ -82,18 +238,65 @@ class RuleModel(RuleBaseModel):
         else:
             raise ValueError(f"模型尚未被訓練，或模型尚未被讀取。若模型已被訓練與儲存，請嘗試執行 ' load() ' 方法讀取模型。")
 
-def parse_predict_target(input_examples: Iterable[InputExample], target: PredictTarget = PredictTarget.CONTENT.value,
-                         case_sensitive: bool = False) -> List[str]:
-    return [_parse_predict_target(input_example, target=target, case_sensitive=case_sensitive)
-            for input_example in input_examples]
+def extract_required_literals(pattern: str) -> List[str]:
+    """
+    the literal strings which every match of the pattern has to contain
+    Args:
+        pattern: a regex pattern
+    Returns:
+        maximal runs of literal characters outside of alternations and optional parts,
+        empty if there is none or the pattern ignores case
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return []
+    if parsed.state.flags & (re.IGNORECASE | re.LOCALE):
+        return []
+    return _required_literals(parsed)
+
+def _required_literals(items) -> List[str]:
+    literals = []
+    current = []
+    repeat_ops = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT,
+                  getattr(sre_constants, 'POSSESSIVE_REPEAT', sre_constants.MAX_REPEAT)}
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            current.append(chr(av))
+            continue
+        if current:
+            literals.append(''.join(current))
+            current = []
+        if op == sre_constants.SUBPATTERN:
+            _, add_flags, _, sub_items = av
+            if not add_flags & re.IGNORECASE:
+                literals.extend(_required_literals(sub_items))
+        elif op in repeat_ops:
+            min_repeat, _, sub_items = av
+            if min_repeat >= 1:
+                literals.extend(_required_literals(sub_items))
+        elif op == getattr(sre_constants, 'ATOMIC_GROUP', None):
+            literals.extend(_required_literals(av))
+    if current:
+        literals.append(''.join(current))
+    return literals
+
+# the targets which ``_parse_predict_target`` reads from an example
+BATCH_PREDICT_TARGETS = {PredictTarget.CONTENT.value, PredictTarget.AUTHOR_NAME.value, PredictTarget.S_AREA_ID.value}
+
+def parse_predict_target(input_examples: Iterable[InputExample],
+                         target: PredictTarget = PredictTarget.CONTENT.value) -> List[str]:
+    # a batch hands over the whole column, an unknown target is still rejected by the row parser
+    if isinstance(input_examples, ExampleBatch) and target in BATCH_PREDICT_TARGETS:
+        return list(input_examples.column(target))
+    return [_parse_predict_target(input_example, target=target) for input_example in input_examples]
 
-def _parse_predict_target(input_example: InputExample, target: PredictTarget = PredictTarget.CONTENT.value,
-                          case_sensitive: bool = False) -> str:
+def _parse_predict_target(input_example: InputExample, target: PredictTarget = PredictTarget.CONTENT.value) -> str:
     if target == PredictTarget.CONTENT.value:
-        return input_example.content if case_sensitive else input_example.content.lower()
+        return input_example.content
     elif target == PredictTarget.AUTHOR_NAME.value:
-        return input_example.author if case_sensitive else input_example.author.lower()
+        return input_example.author
     elif target == PredictTarget.S_AREA_ID.value:
-        return input_example.s_area_id if case_sensitive else input_example.s_area_id.lower()
+        return input_example.s_area_id
     else:
         raise ValueError(Errors.UNKNOWN_PREDICT_TARGET_TYPE)
@@ -1,12 +1,15 @@
 import csv
+import hashlib
 import logging
 from collections import defaultdict
 from enum import Enum
 from pathlib import Path
 from typing import List, Optional, Iterable, Dict, Tuple
 
-import jieba
 import numpy
+from joblib import Parallel, delayed
+from ahocorapy.keywordtree import KeywordTree
+from scipy.sparse import csr_matrix
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import SGDClassifier
 from sklearn.metrics import accuracy_score, classification_report
@@ -14,8 +17,10 @@ from sklearn.preprocessing import MultiLabelBinarizer
 
 
 from models.audience_models import SupervisedModel, MODEL_ROOT
-from utils.input_example import InputExample
-from utils.selections import PredictTarget
+from utils.hashed_vectorizer import HashedTfidfVectorizer
+from utils.input_example import InputExample, example_field
+from utils.segmenter import get_segmenter
+from utils.selections import PredictTarget, TrainingStage, VectorizerType
 
 
 class TermWeightModel(SupervisedModel):
@@ -24,13 +29,38 @@ class TermWeightModel(SupervisedModel):
         TERM = "term"
         WEIGHT = "weight"
 
-    def __init__(self, model_dir_name, feature=PredictTarget.CONTENT, na_tag=None, **kwargs):
+    def __init__(self, model_dir_name, feature=PredictTarget.CONTENT, na_tag=None, n_jobs: int = -1,
+                 compact_min_weight: Optional[float] = None, compact_top_k: Optional[int] = None,
+                 vectorizer_type: str = VectorizerType.TFIDF.value, n_features: int = 2 ** 18, **kwargs):
         super().__init__(model_dir_name=model_dir_name, feature=feature, na_tag=na_tag, **kwargs)
+        # the hashing vectorizer has no vocabulary, the terms are recovered by hashing the training tokens
+        self.vectorizer_type = VectorizerType(vectorizer_type)
+        self.n_features = n_features
+        # processes of the one-vs-rest fits in ``fit``, -1 uses every core
+        self.n_jobs = n_jobs
+        # the dictionary is compacted by ``compact`` after ``fit`` if either of them is set
+        self.compact_min_weight = compact_min_weight
+        self.compact_top_k = compact_top_k
         self.dict_file_name = "term_dict.csv"
-        self.label_term_weights: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
+        self.index_dir_name = "term_index"
+        self.digest_file_name = "term_dict.sha1"
+        self._label_term_weights: Optional[Dict[str, List[Tuple[str, float]]]] = defaultdict(list)
         self.mlb: Optional[MultiLabelBinarizer] = None
         self.vectorizer = None
         self.threshold = 0.3
+        self.term_index: Optional[TermWeightIndex] = None
+
+    @property
+    def label_term_weights(self) -> Dict[str, List[Tuple[str, float]]]:
+        # a model loaded from the binary index only builds the python dictionary when it is asked for
+        if self._label_term_weights is None:
+            self._label_term_weights = self.term_index.label_term_weights()
+        return self._label_term_weights
+
+    @label_term_weights.setter
+    def label_term_weights(self, label_term_weights: Dict[str, List[Tuple[str, float]]]):
+        self._label_term_weights = label_term_weights
+        self.term_index = None
 
     def fit(self, examples: List[InputExample], y_true):
 
@@ -47,24 +77,32 @@ class TermWeightModel(SupervisedModel):
         self.mlb = MultiLabelBinarizer(classes=classes)
         self.mlb.fit(y_true)
         # start training
-        ovr_class_features = defaultdict(list)
-        for label in self.mlb.classes_:
-            tmp_y = []
-            tmp_x_examples = []
-            for idx, _y_true in enumerate(y_true):
-                if isinstance(_y_true, list):
-                    for y in _y_true:
-                        tmp_y.append(y if y == label else "other")
-                        tmp_x_examples.append(examples[idx])
-                else:
-                    tmp_y.append(_y_true)
-                    tmp_x_examples.append(examples[idx])
-
-            x_train = self.convert_feature(examples, update_vectorizer=True)
+        # the corpus is segmented and vectorized once, every one-vs-rest fit reads the same matrix
+        self.report_progress(TrainingStage.SEGMENTATION)
+        seg_contents = self.segment(examples)
+        x_train = self.vectorize(seg_contents, update_vectorizer=True)
+        if isinstance(self.vectorizer, HashedTfidfVectorizer):
+            # only the hashed columns of the training terms are weighted, the terms of a column share its weight,
+            # the signs of the hashing are dropped so that a weight keeps the direction of its terms
+            columns, feature_list = self.vectorizer.feature_terms(seg_contents)
+            x_train = abs(x_train[:, columns])
+        else:
             feature_list = self.vectorizer.get_feature_names()
-            label_term_dict = class_feature_importance(x_train, tmp_y, feature_list)
-            ovr_class_features[label] = label_term_dict.get(label)
+        ovr_y = [[label if label in _y_true else "other" for _y_true in y_true] for label in self.mlb.classes_]
+        # the arrays of the sparse matrix are memory-mapped into the worker processes instead of copied
+        self.report_progress(TrainingStage.FITTING)
+        label_term_dicts = Parallel(n_jobs=self.n_jobs)(
+            delayed(class_feature_importance)(x_train, tmp_y, feature_list) for tmp_y in ovr_y)
+        ovr_class_features = defaultdict(list)
+        for label, label_term_dict in zip(self.mlb.classes_, label_term_dicts):
+            term_weights = label_term_dict.get(label)
+            if term_weights and isinstance(self.vectorizer, HashedTfidfVectorizer):
+                term_weights = [(term, weight) for terms, weight in term_weights for term in terms]
+            ovr_class_features[label] = term_weights
         self.label_term_weights = ovr_class_features
+        if self.compact_min_weight is not None or self.compact_top_k is not None:
+            self.compact(min_weight=self.compact_min_weight, top_k=self.compact_top_k)
+        self.report_progress(TrainingStage.SAVING)
         return self.save()
 
     def predict(self, examples: List[InputExample]):
@@ -72,28 +110,21 @@ class TermWeightModel(SupervisedModel):
         :param examples:
         :return:
         """
-        if not self.label_term_weights:
-            raise ValueError(f"模型尚未被讀取，請嘗試執行 ' load() ' 方法讀取模型。")
-        matched_keyword = []
+        if self.term_index is None:
+            if not self.label_term_weights:
+                raise ValueError(f"模型尚未被讀取，請嘗試執行 ' load() ' 方法讀取模型。")
+            self.term_index = TermWeightIndex.from_label_term_weights(self.label_term_weights)
+        contents = example_field(examples, self.feature.value)
+        term_counts = self.term_index.count_terms(contents)
+        scores, counts = self.term_index.class_scores(term_counts)
+        # a class is labeled when its average weight over every matched occurrence exceeds the threshold
+        avg_scores = numpy.divide(scores, counts, out=numpy.zeros_like(scores), where=counts > 0)
+        matched = (scores != 0) & (avg_scores > self.threshold)
+
+        matched_keyword = self.term_index.matched_terms(term_counts)
         result_labels = []
-        for example in examples:
-            content: str = getattr(example, self.feature.value)
-            match_kw = defaultdict(list)
-            _result_label = []
-            for cls, keywords in self.label_term_weights.items():
-                total_matched_count = 0
-                total_matched_score = 0
-                for keyword, weight in keywords:
-                    if count := content.count(keyword):
-                        match_kw[cls].append((keyword, weight, count))
-                for elem in match_kw.get(cls, []):
-                    total_matched_count += elem[2]
-                    total_matched_score += elem[1] * elem[2]
-                if total_matched_score and total_matched_score:
-                    avg_score = total_matched_score / total_matched_count
-                    if avg_score > self.threshold:
-                        _result_label.append(cls)
-            matched_keyword.append(match_kw)
+        for row in matched:
+            _result_label = [self.term_index.classes[class_id] for class_id in numpy.flatnonzero(row)]
             if self.na_tag and len(_result_label) == 0:
                 _result_label.append(self.na_tag)
             result_labels.append(_result_label)
@@ -102,7 +133,7 @@ class TermWeightModel(SupervisedModel):
     def eval(self, examples: List[InputExample], y_true):
         if isinstance(y_true[0], str):
             y_true = [[y] for y in y_true]
-        if self.label_term_weights and self.mlb:
+        if (self.term_index is not None or self.label_term_weights) and self.mlb:
             predict_labels, first_matched_keyword = self.predict(examples)
             if isinstance(y_true[0], str):
                 y_true = [[y] for y in y_true]
@@ -116,53 +147,133 @@ class TermWeightModel(SupervisedModel):
         else:
             raise ValueError(f"模型尚未被訓練，或模型尚未被讀取。若模型已被訓練與儲存，請嘗試執行 ' load() ' 方法讀取模型。")
 
+    def prepare(self):
+        """build the automaton and the matrices of the index ahead of the first ``predict``"""
+        if self.term_index is None:
+            self.term_index = TermWeightIndex.from_label_term_weights(self.label_term_weights)
+        if self.term_index.tree is None:
+            self.term_index.build()
+
+    def compact(self, min_weight: Optional[float] = None, top_k: Optional[int] = None,
+                examples: Optional[List[InputExample]] = None, y_true=None) -> Dict:
+        """
+        drop the terms which barely change the prediction, the model has to be saved to keep the result
+        Args:
+            min_weight: drop the terms of a label whose weight is not above it, defaults to ``self.threshold``
+                if ``top_k`` is not given either, since such a term can only pull the average score down
+            top_k: only keep the k terms with the highest weights of every label
+            examples: a validation set, the accuracy before and after the compaction are compared if given
+            y_true: the labels of the validation set
+        Returns:
+            the number of dictionary entries before and after, and the accuracy delta reported by ``eval``
+        """
+        if self.term_index is None:
+            self.term_index = TermWeightIndex.from_label_term_weights(self.label_term_weights)
+        min_weight = self.threshold if min_weight is None and top_k is None else min_weight
+        report = {'entries_before': len(self.term_index.entry_weights)}
+        if examples is not None:
+            report['accuracy_before'] = self.eval(examples, list(y_true))['accuracy']
+
+        compacted = self.term_index.compact(min_weight=min_weight, top_k=top_k)
+        self.term_index = compacted
+        self._label_term_weights = None
+
+        report['entries_after'] = len(compacted.entry_weights)
+        if examples is not None:
+            report['accuracy_after'] = self.eval(examples, list(y_true))['accuracy']
+            report['accuracy_delta'] = report['accuracy_after'] - report['accuracy_before']
+        return report
+
     def save(self):
         tmp_model_dir = MODEL_ROOT / self.model_dir_name
         if not tmp_model_dir.exists():
             tmp_model_dir.mkdir(parents=True, exist_ok=True)
-        output_file = (tmp_model_dir / self.dict_file_name).__str__()
-        # logger.debug()(output_file)
+        # the csv is kept next to the binary index for editing by hand, the index records the digest of the csv
+        # it is saved with, so an edited csv is detected no matter what the modification times are
+        self.export_csv()
+        if self.term_index is None:
+            self.term_index = TermWeightIndex.from_label_term_weights(self.label_term_weights)
+        self.term_index.save(tmp_model_dir / self.index_dir_name)
+        # written last, an index without the digest is never read
+        with open(tmp_model_dir / self.index_dir_name / self.digest_file_name, 'w') as digest_file:
+            digest_file.write(_file_sha1(tmp_model_dir / self.dict_file_name))
+        return self.model_dir_name
+
+    def export_csv(self, output_file: Optional[Path] = None):
+        output_file = output_file if output_file is not None else MODEL_ROOT / self.model_dir_name / self.dict_file_name
         with open(output_file, 'w') as csv_file:
             writer = csv.writer(csv_file)
             writer.writerow([self.DictHeaders.LABEL.value, self.DictHeaders.TERM.value, self.DictHeaders.WEIGHT.value])
             for label, term_weights in self.label_term_weights.items():
-                for term, score in term_weights:
+                for term, score in term_weights or []:
                     writer.writerow([label, term, score])
-        return self.model_dir_name
 
-    def load(self, label_term_weights: Dict[str, List[Tuple[str, float]]] = None):
-        self.label_term_weights.clear()
-        if label_term_weights is None:
-            with open(MODEL_ROOT / self.model_dir_name / self.dict_file_name, newline='') as csv_file:
-                for row in csv.DictReader(csv_file):
-                    label: str = row.get(self.DictHeaders.LABEL.value)
-                    term: str = row.get(self.DictHeaders.TERM.value)
-                    weight: float = float(row.get(self.DictHeaders.WEIGHT.value))
-                    self.label_term_weights[label].append((term, weight))
-        else:
+    def import_csv(self, input_file: Optional[Path] = None):
+        input_file = input_file if input_file is not None else MODEL_ROOT / self.model_dir_name / self.dict_file_name
+        label_term_weights = defaultdict(list)
+        with open(input_file, newline='') as csv_file:
+            for row in csv.DictReader(csv_file):
+                label: str = row.get(self.DictHeaders.LABEL.value)
+                term: str = row.get(self.DictHeaders.TERM.value)
+                weight: float = float(row.get(self.DictHeaders.WEIGHT.value))
+                label_term_weights[label].append((term, weight))
+        self.label_term_weights = label_term_weights
+
+    def load(self, label_term_weights: Dict[str, List[Tuple[str, float]]] = None, mmap_mode: Optional[str] = 'r'):
+        """
+        load the dictionary from the argument, otherwise from the binary index of the model directory,
+        the csv is read instead if there is no index yet or the csv differs from the one the index is saved with
+        """
+        if label_term_weights is not None:
             self.label_term_weights = label_term_weights
+            self.term_index = TermWeightIndex.from_label_term_weights(self.label_term_weights)
+        else:
+            model_dir = MODEL_ROOT / self.model_dir_name
+            digest_file = model_dir / self.index_dir_name / self.digest_file_name
+            csv_file = model_dir / self.dict_file_name
+            if digest_file.exists() and \
+                    (not csv_file.exists() or digest_file.read_text().strip() == _file_sha1(csv_file)):
+                self.term_index = TermWeightIndex.load(model_dir / self.index_dir_name, mmap_mode=mmap_mode)
+                self._label_term_weights = None
+            else:
+                self.import_csv(csv_file)
+                self.term_index = TermWeightIndex.from_label_term_weights(self.label_term_weights)
 
-        self.mlb = MultiLabelBinarizer(classes=list(self.label_term_weights.keys()))
-        self.mlb.fit([[label] for label in list(self.label_term_weights.keys())])
+        self.mlb = MultiLabelBinarizer(classes=self.term_index.classes)
+        self.mlb.fit([[label] for label in self.term_index.classes])
+
+    def segment(self, examples) -> List[str]:
+        """the space separated tokens of the feature of every example"""
+        contents = [str(content) for content in example_field(examples, self.feature.value)]
+        if self.feature in {PredictTarget.CONTENT, PredictTarget.TITLE}:
+            sentences = get_segmenter().segment_batch(contents, cut_all=True)
+        elif self.feature in {PredictTarget.AUTHOR_NAME, }:
+            sentences = [list(content) for content in contents]
+        else:
+            raise ValueError(f"Unavailable feature type {self.feature}")
+        return [" ".join(sentence) for sentence in sentences]
 
     def convert_feature(self, examples,
                         update_vectorizer=False,
                         max_features=10000, min_df=None, stop_words='english'):
-        min_df = round(max_features * 0.005) if min_df is None else min_df
-        seg_contents = []
-        for example in examples:
-            content = getattr(example, self.feature.value)
-            if self.feature in {PredictTarget.CONTENT, PredictTarget.TITLE}:
-                sentence = jieba.lcut(str(content), cut_all=True)
-            elif self.feature in {PredictTarget.AUTHOR, }:
-                sentence = list(content)
-            else:
-                raise ValueError(f"Unavailable feature type {self.feature}")
-            seg_contents.append(" ".join(sentence))
+        if update_vectorizer:
+            self.report_progress(TrainingStage.SEGMENTATION)
+        return self.vectorize(self.segment(examples), update_vectorizer=update_vectorizer,
+                              max_features=max_features, min_df=min_df, stop_words=stop_words)
 
+    def vectorize(self, seg_contents: List[str],
+                  update_vectorizer=False,
+                  max_features=10000, min_df=None, stop_words='english'):
+        min_df = round(max_features * 0.005) if min_df is None else min_df
         if update_vectorizer:
+            self.report_progress(TrainingStage.VECTORIZATION)
             if self.vectorizer is None:
-                self.vectorizer = TfidfVectorizer(max_features=max_features, min_df=min_df, stop_words=stop_words)
+                if self.vectorizer_type == VectorizerType.HASHING:
+                    self.vectorizer = HashedTfidfVectorizer(n_features=self.n_features, min_df=min_df,
+                                                            stop_words=stop_words, n_jobs=self.n_jobs)
+                else:
+                    self.vectorizer = TfidfVectorizer(max_features=max_features, min_df=min_df,
+                                                      stop_words=stop_words)
             x_features = self.vectorizer.fit_transform(seg_contents)
         else:
             if self.vectorizer:
@@ -172,9 +283,211 @@ class TermWeightModel(SupervisedModel):
         return x_features
 
 
-def class_feature_importance(x, y, feature_list, use_scaler=True) -> Dict[str, List[Tuple[str, float]]]:
+class TermWeightIndex(object):
+    """
+    every term of every class compiled into a single automaton, the occurrences of all terms are counted
+    in one pass of a string, and the class scores of a whole batch are computed by matrix products,
+    the index is kept as flat arrays which are saved as ``.npy`` files and may be memory-mapped,
+    the automaton and the matrices are only built when the first batch is counted
+    Args:
+        classes: the labels
+        term_bytes: the interned terms, utf-8 encoded and concatenated
+        term_offsets: the start of every term in ``term_bytes``, with the end of the last one appended
+        entry_classes: the class id of every (class, term, weight) entry of the dictionary
+        entry_terms: the term id of every entry
+        entry_weights: the weight of every entry
+    """
+    array_names = ('term_bytes', 'term_offsets', 'entry_classes', 'entry_terms', 'entry_weights')
+
+    def __init__(self, classes: List[str], term_bytes: numpy.ndarray, term_offsets: numpy.ndarray,
+                 entry_classes: numpy.ndarray, entry_terms: numpy.ndarray, entry_weights: numpy.ndarray):
+        self.classes = classes
+        self.term_bytes = term_bytes
+        self.term_offsets = term_offsets
+        self.entry_classes = entry_classes
+        self.entry_terms = entry_terms
+        self.entry_weights = entry_weights
+        self._terms: Optional[List[str]] = None
+        self.tree = None
+
+    @classmethod
+    def from_label_term_weights(cls, label_term_weights: Dict[str, List[Tuple[str, float]]]) -> 'TermWeightIndex':
+        terms: List[str] = []
+        term_ids: Dict[str, int] = {}
+        # the entry id keeps the order of the dictionary
+        entry_classes, entry_terms, entry_weights = [], [], []
+        for class_id, term_weights in enumerate(label_term_weights.values()):
+            for term, weight in term_weights or []:
+                if not term:
+                    continue
+                if term not in term_ids:
+                    term_ids[term] = len(terms)
+                    terms.append(term)
+                entry_classes.append(class_id)
+                entry_terms.append(term_ids[term])
+                entry_weights.append(weight)
+        term_bytes, term_offsets = _intern_terms(terms)
+        index = cls(classes=list(label_term_weights.keys()),
+                    term_bytes=term_bytes,
+                    term_offsets=term_offsets,
+                    entry_classes=numpy.asarray(entry_classes, dtype=numpy.int32),
+                    entry_terms=numpy.asarray(entry_terms, dtype=numpy.int32),
+                    entry_weights=numpy.asarray(entry_weights, dtype=numpy.float64))
+        index._terms = terms
+        return index
+
+    @classmethod
+    def load(cls, index_dir: Path, mmap_mode: Optional[str] = 'r') -> 'TermWeightIndex':
+        classes = numpy.load(index_dir / 'classes.npy').tolist()
+        arrays = {name: numpy.load(index_dir / f'{name}.npy', mmap_mode=mmap_mode) for name in cls.array_names}
+        return cls(classes=classes, **arrays)
+
+    def save(self, index_dir: Path):
+        index_dir.mkdir(parents=True, exist_ok=True)
+        numpy.save(index_dir / 'classes.npy', numpy.asarray(self.classes, dtype=str))
+        for name in self.array_names:
+            numpy.save(index_dir / f'{name}.npy', getattr(self, name))
+
+    def compact(self, min_weight: Optional[float] = None, top_k: Optional[int] = None) -> 'TermWeightIndex':
+        """
+        a smaller index without the entries which barely change the scores
+        Args:
+            min_weight: only keep the entries whose weight is above it
+            top_k: only keep the k entries with the highest weights of every class
+        Returns:
+            a new index, the terms which are no longer used by any class are dropped from the term table
+        """
+        keep = numpy.ones(len(self.entry_weights), dtype=bool)
+        if min_weight is not None:
+            keep &= numpy.asarray(self.entry_weights) > min_weight
+        if top_k is not None:
+            # rank the entries of every class by descending weight, ties keep the order of the dictionary
+            order = numpy.lexsort((-numpy.asarray(self.entry_weights), self.entry_classes))
+            class_starts = numpy.searchsorted(self.entry_classes[order], self.entry_classes[order], side='left')
+            ranks = numpy.empty(len(order), dtype=numpy.int64)
+            ranks[order] = numpy.arange(len(order)) - class_starts
+            keep &= ranks < top_k
+        entry_ids = numpy.flatnonzero(keep)
+
+        used_terms, entry_terms = numpy.unique(self.entry_terms[entry_ids], return_inverse=True)
+        terms = [self.terms[term_id] for term_id in used_terms.tolist()]
+        term_bytes, term_offsets = _intern_terms(terms)
+        compacted = TermWeightIndex(classes=list(self.classes),
+                                    term_bytes=term_bytes,
+                                    term_offsets=term_offsets,
+                                    entry_classes=numpy.asarray(self.entry_classes[entry_ids], dtype=numpy.int32),
+                                    entry_terms=numpy.asarray(entry_terms, dtype=numpy.int32),
+                                    entry_weights=numpy.asarray(self.entry_weights[entry_ids], dtype=numpy.float64))
+        compacted._terms = terms
+        return compacted
+
+    @property
+    def terms(self) -> List[str]:
+        if self._terms is None:
+            term_bytes = self.term_bytes.tobytes()
+            offsets = self.term_offsets.tolist()
+            self._terms = [term_bytes[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+        return self._terms
+
+    def label_term_weights(self) -> Dict[str, List[Tuple[str, float]]]:
+        label_term_weights = defaultdict(list)
+        for label in self.classes:
+            label_term_weights[label] = []
+        terms = self.terms
+        for class_id, term_id, weight in zip(self.entry_classes.tolist(), self.entry_terms.tolist(),
+                                             self.entry_weights.tolist()):
+            label_term_weights[self.classes[class_id]].append((terms[term_id], weight))
+        return label_term_weights
+
+    def build(self):
+        terms = self.terms
+        self.term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        # the entries of a term are entry_order[term_entry_offsets[term_id]:term_entry_offsets[term_id + 1]]
+        self.entry_order = numpy.argsort(self.entry_terms, kind='stable')
+        self.term_entry_offsets = numpy.searchsorted(self.entry_terms[self.entry_order],
+                                                     numpy.arange(len(terms) + 1))
+        # terms x classes, the summed weights and the number of entries of a term in every class
+        shape = (len(terms), len(self.classes))
+        self.term_class_weights = csr_matrix((numpy.asarray(self.entry_weights), (self.entry_terms, self.entry_classes)),
+                                             shape=shape)
+        self.term_class_entries = csr_matrix((numpy.ones(len(self.entry_terms)), (self.entry_terms, self.entry_classes)),
+                                             shape=shape)
+        tree = KeywordTree()
+        for term in terms:
+            tree.add(term)
+        tree.finalize()
+        self.tree = tree
+
+    def count_terms(self, contents: Iterable[str]) -> csr_matrix:
+        """
+        count the non-overlapping occurrences of every term like ``str.count``
+        Returns:
+            a csr matrix of rows x terms
+        """
+        if self.tree is None:
+            self.build()
+        indptr = [0]
+        indices = []
+        data = []
+        for content in contents:
+            counts = defaultdict(int)
+            last_ends = {}
+            # the matches of a term come in the order of their start index, a match overlapping
+            # the previous counted one is skipped
+            for term, start in self.tree.search_all('' if content is None else str(content)):
+                if start >= last_ends.get(term, 0):
+                    counts[term] += 1
+                    last_ends[term] = start + len(term)
+            for term, count in counts.items():
+                indices.append(self.term_ids[term])
+                data.append(count)
+            indptr.append(len(indices))
+        return csr_matrix((numpy.asarray(data, dtype=numpy.float64),
+                           numpy.asarray(indices, dtype=numpy.int32),
+                           numpy.asarray(indptr, dtype=numpy.int64)),
+                          shape=(len(indptr) - 1, len(self.terms)))
+
+    def class_scores(self, term_counts: csr_matrix) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Returns:
+            the weighted score and the matched count of every class, both are dense arrays of rows x classes
+        """
+        scores = (term_counts @ self.term_class_weights).toarray()
+        counts = (term_counts @ self.term_class_entries).toarray()
+        return scores, counts
+
+    def matched_terms(self, term_counts: csr_matrix) -> List[Dict[str, List[Tuple[str, float, int]]]]:
+        """the matched (term, weight, count) of every class of every row, in the order of the dictionary"""
+        matched_keyword = []
+        terms = self.terms
+        for row_id in range(term_counts.shape[0]):
+            start, end = term_counts.indptr[row_id], term_counts.indptr[row_id + 1]
+            entries = []
+            for term_id, count in zip(term_counts.indices[start:end], term_counts.data[start:end]):
+                for entry_id in self.entry_order[self.term_entry_offsets[term_id]:self.term_entry_offsets[term_id + 1]]:
+                    entries.append((entry_id, int(count)))
+            match_kw = defaultdict(list)
+            for entry_id, count in sorted(entries):
+                match_kw[self.classes[self.entry_classes[entry_id]]].append(
+                    (terms[self.entry_terms[entry_id]], self.entry_weights[entry_id].item(), count))
+            matched_keyword.append(match_kw)
+        return matched_keyword
+
+
+def _intern_terms(terms: List[str]) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """concatenate the utf-8 encoded terms, return the bytes and the offsets of every term"""
+    encoded = [term.encode('utf-8') for term in terms]
+    term_offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(term) for term in encoded], out=term_offsets[1:])
+    return numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8), term_offsets
+
+
+def class_feature_importance(x, y, feature_list, use_scaler=True, n_jobs=1,
+                             random_state=0) -> Dict[str, List[Tuple[str, float]]]:
+    # the shuffling is seeded, so a label gets the same weights whichever process of ``fit`` trains it
     clf = SGDClassifier(loss='log', penalty='elasticnet', l1_ratio=0.9, learning_rate='optimal', n_iter_no_change=10,
-                        shuffle=True, n_jobs=3, fit_intercept=True, class_weight='balanced')
+                        shuffle=True, n_jobs=n_jobs, fit_intercept=True, class_weight='balanced',
+                        random_state=random_state)
     clf.fit(x, y)
     label_fea_importance = {}
     if len(clf.classes_) == 2:
@@ -193,4 +506,9 @@ def class_feature_importance(x, y, feature_list, use_scaler=True) -> Dict[str, L
     return label_fea_importance
 
 
-
+def _file_sha1(file: Path) -> str:
+    digest = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
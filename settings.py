@@ -781,6 +781,24 @@ class DevelopConfig(BaseSettings):
     CELERY_ACKS_LATE: bool = True
     CELERY_SERIALIZER: str = 'pickle'
     DUMP_ZIP: bool = False
+    # `<model_type>:<model_path>` of the supervised models loaded when a worker process starts, with the params of
+    # the cascade stages using it as a query, e.g. `char_ngram_model:name_model?feature=author_name&na_tag=other`
+    MODEL_REGISTRY_PRELOAD: List[str] = []
+    MODEL_REGISTRY_MEMORY_BUDGET: int = 2048
+    # seconds a model version is trusted before its files are checked again, a retrained model is served after it
+    MODEL_REGISTRY_VERSION_TTL: float = 60.0
+    # training jobs are cpu bound and run on their own queue, away from the labeling workers
+    TRAINING_QUEUE: str = 'training'
+    # jieba processes of the segmenter, 0 uses every core, and the documents sent to a process at once
+    SEGMENT_PROCESSES: int = 0
+    SEGMENT_CHUNK_SIZE: int = 256
+    SEGMENT_USER_DICT: Optional[str] = None
+    # segmented tokens are cached on disk by content, mode and dictionary version, with an LRU of entries in memory,
+    # the file keeps at most SEGMENT_CACHE_MAX_ROWS documents and is written to cache/ unless SEGMENT_CACHE_PATH is set
+    SEGMENT_CACHE: bool = False
+    SEGMENT_CACHE_PATH: Optional[str] = None
+    SEGMENT_CACHE_LRU_SIZE: int = 100000
+    SEGMENT_CACHE_MAX_ROWS: int = 1000000
 
 class ProductionConfig(DevelopConfig):
     API_HOST: str = '0.0.0.0'
@@ -817,6 +835,11 @@ class TaskConfig(BaseModel):
     COUNTDOWN: int = 5
     QUEUE: str = "queue1"
     SITE_CONFIG: Optional[Dict] = None
+    RULE_TELEMETRY: bool = True
+    # the stages of a `cascade_model` task, e.g. [{"MODEL_TYPE": "keyword_model", "PATTERN": {...}},
+    # {"MODEL_TYPE": "random_forest_model", "MODEL_PATH": "...", "MIN_PROBA": 0.6, "FEATURE": "content",
+    # "IS_MULTI_LABEL": false, "NA_TAG": null}]
+    CASCADE: Optional[List[Dict]] = None
 
 class AbortionConfig(BaseModel):
     TASK_ID: str = 'string'
@@ -833,6 +856,8 @@ class TrainingConfig(BaseModel):
     #TRAINING_SCHEMA: str = os.getenv('TRAINING_SCHEMA')
     TRAINING_SET: List[InputExample] = None
     TRAINING_Y: List[List[str]] = None
+    VALIDATION_SET: Optional[List[InputExample]] = None
+    VALIDATION_Y: Optional[List[List[str]]] = None
     MODEL_TYPE: str = ModelType.RANDOM_FOREST_MODEL.name
     MODEL_INFO: Dict[str, Union[str, Dict]] = {"model_path": "model_path",
                                                "keyword_patterns": None,
@@ -1,3 +1,5 @@
+from unittest import mock
+
 from fastapi.testclient import TestClient
 from label_api import app
 
@@ -43,6 +45,28 @@ class TestAPIs(object):
         response = self.client.get(f"/api/tasks/e138514e307a11eca07b04ea56825bad/sample")
         assert response.status_code == 200
 
+    def test_training(self):
+        with mock.patch("label_api.create_training_result_table"), \
+                mock.patch("label_api.insert2training_result") as insert, mock.patch("label_api.train_model") as task:
+            response = self.client.post("/api/tasks/training/",
+                                        json={"MODEL_TYPE": "CHAR_NGRAM_MODEL",
+                                              "MODEL_INFO": {"model_path": "6_training_job"},
+                                              "TRAINING_SET": [],
+                                              "TRAINING_Y": []})
+        job_id = response.json()["error_message"]["job_id"]
+        assert insert.call_args.args[:4] == (job_id, "PENDING", "CHAR_NGRAM_MODEL", "6_training_job")
+        assert task.apply_async.call_args.kwargs["task_id"] == job_id
+        assert task.apply_async.call_args.kwargs["kwargs"]["model_info"] == {"model_path": "6_training_job"}
+
+    def test_training_status(self):
+        row = {"job_id": "job", "stat": "PROGRESS", "stage": "fitting"}
+        with mock.patch("label_api.query_training_result_by_id", return_value=row):
+            response = self.client.get("/api/tasks/training/job")
+        assert response.json() == {"error_code": 200, "error_message": row}
+        with mock.patch("label_api.query_training_result_by_id", return_value=None):
+            response = self.client.get("/api/tasks/training/job")
+        assert response.json()["error_code"] == 404
+
 
 
 
@@ -1,7 +1,9 @@
 from unittest import TestCase
 
+from models.incremental_model import IncrementalModel
 from models.keyword_model import KeywordModel
 from models.model_creator import ModelCreator
+from models.ngram_model import CharNgramModel
 from models.rf_model import RandomForestModel
 from models.rule_model import RuleModel
 from models.tw_model import TermWeightModel
@@ -34,5 +36,10 @@ class TestModelCreator(TestCase):
         self.assertIsInstance(ModelCreator.create_model(ModelType.TERM_WEIGHT_MODEL.name, **self.model_information),
                               TermWeightModel)
 
+    def test_create_incremental_model(self):
+        self.assertIsInstance(ModelCreator.create_model(ModelType.INCREMENTAL_MODEL.name, **self.model_information),
+                              IncrementalModel)
 
-
+    def test_create_char_ngram_model(self):
+        self.assertIsInstance(ModelCreator.create_model(ModelType.CHAR_NGRAM_MODEL.name, **self.model_information),
+                              CharNgramModel)
@@ -1,16 +1,22 @@
 import os
+import tempfile
 from datetime import datetime
-from unittest import TestCase
+from pathlib import Path
+from unittest import TestCase, mock
 
+import pandas as pd
 
 from definition import ROOT_DIR
-from models.rule_model import RuleModel
+from models.cascade_model import CascadeModel
+from models.rule_model import RuleModel, extract_required_literals
 from models.keyword_model import KeywordModel
+from models.ngram_model import CharNgramModel
 from utils.data_helper import load_examples
 from utils.run_label_task import read_from_dir
 from utils.selections import PredictTarget, KeywordMatchType, ModelType
 
-from utils.input_example import InputExample
+from utils import model_registry, pattern_cache
+from utils.input_example import ExampleBatch, InputExample
 
 post_male = "小弟我沒女友，在八卦版混了很久了在八卦版混，時常會有的福利就是偶爾會有人貼清涼養眼圖上班上久了，心情煩悶，看這些圖多多少少會有解鬱消悶的效果感謝八卦版大的貢獻所以在八卦版上，只要看到巨乳等關鍵字，我都是會直覺地點閱進入觀賞，以調劑身心。"
 post_female = "小妹的朋友上週領薪水這週就跟我哭哭說全身上下剩一千五明明是她自己限制自己一個月只能花幾千塊其他買保險跟存起來這樣有什麼好哭哭的就是自己強迫自己啊而且明明就是存起來哪是沒錢啊不懂欸"
@@ -62,6 +68,58 @@ class TestRuleBaseModel(TestCase):
         rs, prob = self.source_rule_base_model.predict([input_female], target=PredictTarget.S_AREA_ID.value)
         self.assertTrue(label in rs[0])
 
+    def test_predict_batch(self):
+        """
+        批次預測，回傳與輸入列對齊的命中次數矩陣
+        """
+        model = RuleModel({"young": ["工作.{0,3}([一兩三]|[1-3])年", "小弟"], "female": ["小妹"]})
+        counts, winners = model.predict_batch([post_young, post_male, post_female, "Alice"])
+        self.assertEqual(counts.shape, (4, 2))
+        self.assertEqual(counts.toarray().tolist(), [[2, 0], [1, 0], [0, 1], [0, 0]])
+        self.assertEqual(winners.tolist(), [0, 0, 1, -1])
+
+    def test_predict_example_batch(self):
+        """
+        以欄位陣列批次輸入，預測結果與逐筆 InputExample 相同
+        """
+        examples = [input_young, input_female]
+        batch = ExampleBatch.from_examples(examples)
+        for model, target in [(self.content_rule_base_model, PredictTarget.CONTENT.value),
+                              (self.name_rule_base_model, PredictTarget.AUTHOR_NAME.value),
+                              (self.source_rule_base_model, PredictTarget.S_AREA_ID.value)]:
+            self.assertEqual(model.predict(batch, target=target)[0], model.predict(examples, target=target)[0])
+        self.assertEqual(batch[1].author_name, "Alice")
+        self.assertEqual(batch[1].to_example(), input_female)
+
+    def test_predict_combined_rules(self):
+        """
+        合併後的規則命中次數與逐條比對相同
+        """
+        model = RuleModel({"young": ["工作.{0,3}([一兩三]|[1-3])年", "小弟", "信用卡", "(.)\\1", "(?i)KITTY"]})
+        counts, winners = model.predict_batch([post_young, "hello kitty", "abc"])
+        self.assertEqual(counts.toarray().tolist(), [[4], [2], [0]])
+
+    def test_extract_required_literals(self):
+        """
+        抽取規則必定包含的字串作為預先篩選
+        """
+        self.assertEqual(extract_required_literals("工作.{0,3}([一兩三]|[1-3])年"), ["工作", "年"])
+        self.assertEqual(extract_required_literals("大學(生|畢業)"), ["大學"])
+        self.assertEqual(extract_required_literals("bob|tom"), [])
+        self.assertEqual(extract_required_literals("(?i)KITTY"), [])
+
+    def test_telemetry(self):
+        """
+        統計每條規則的命中次數
+        """
+        model = RuleModel({"young": ["工作.{0,3}([一兩三]|[1-3])年", "小弟"], "female": ["小妹"]})
+        telemetry = model.create_telemetry()
+        model.predict_batch([post_young, post_male, post_female, "Alice"], telemetry=telemetry)
+        summary = telemetry.summary()
+        self.assertEqual(summary['rows'], 4)
+        self.assertEqual(summary['labels']['young']['小弟']['hits'], 2)
+        self.assertEqual(summary['labels']['female']['小妹']['hits'], 1)
+
 class TestKeyWordBaseModel(TestCase):
     source_rules = {"female": [("woman_talk", KeywordMatchType.END), ("_talk", KeywordMatchType.PARTIALLY)]}
     patterns = read_from_dir(ModelType.KEYWORD_MODEL.value, PredictTarget.AUTHOR_NAME.value)
@@ -75,7 +133,162 @@ class TestKeyWordBaseModel(TestCase):
         rs, prob = self.source_rule_base_model.predict([input_female], target=PredictTarget.S_AREA_ID.value)
         self.assertTrue(label in rs[0])
 
+    def test_predict_multi_label(self):
+        """
+        一次比對所有標籤的部分符合關鍵字
+        """
+        model = KeywordModel({"female": [("女友", KeywordMatchType.PARTIALLY), ("小妹", KeywordMatchType.PARTIALLY)],
+                              "male": [("小弟", KeywordMatchType.PARTIALLY), ("八卦版", KeywordMatchType.PARTIALLY)]})
+        input_male = InputExample(id_="2", s_area_id="2", author="Bob", title="", content=post_male,
+                                  post_time=datetime.now())
+        rs, prob = model.predict([input_male, input_young], target=PredictTarget.CONTENT.value)
+        self.assertEqual(rs, [("female", "male"), ("male",)])
+        self.assertEqual(prob, [[("female", 1), ("male", 1)], [("male", 1)]])
+
+    def test_predict_start_end_absolutely(self):
+        """
+        開頭、結尾與完全符合關鍵字
+        """
+        model = KeywordModel({"female": [("alice", KeywordMatchType.ABSOLUTELY), ("al", KeywordMatchType.START),
+                                         ("ali", KeywordMatchType.START), ("ce", KeywordMatchType.END)],
+                              "male": [("bob", KeywordMatchType.END), ("alic", KeywordMatchType.ABSOLUTELY)]})
+        rs, prob = model.predict([input_young, input_female], target=PredictTarget.AUTHOR_NAME.value)
+        self.assertEqual(rs, [("female",), ("female",)])
+        self.assertEqual(prob, [[("female", 4)], [("female", 4)]])
+
+    def test_predict_normalized(self):
+        """
+        全形與大小寫在比對前一次正規化
+        """
+        model = KeywordModel({"female": [("ALICE", KeywordMatchType.ABSOLUTELY), ("ｗｏｍａｎ", KeywordMatchType.PARTIALLY)]})
+        counts, winners = model.predict_batch(["Ａｌｉｃｅ ", "ptt_Woman_talk", "bob"])
+        self.assertEqual(counts.toarray().tolist(), [[1], [1], [0]])
+        self.assertEqual(winners.tolist(), [0, 0, -1])
+
+    def test_predict_anchored_whitespace(self):
+        """
+        內文會去除前後空白，開頭、結尾與完全符合關鍵字的錨定端空白也一併去除
+        """
+        model = KeywordModel({"female": [(" alice ", KeywordMatchType.ABSOLUTELY), (" ali", KeywordMatchType.START),
+                                         ("ce ", KeywordMatchType.END), ("al ", KeywordMatchType.START)]})
+        counts, winners = model.predict_batch([" Alice ", "al ice", "bob"])
+        self.assertEqual(counts.toarray().tolist(), [[3], [2], [0]])
+        self.assertEqual(winners.tolist(), [0, 0, -1])
+
+    def test_decide_batch(self):
+        """
+        只保留恰好命中一個標籤的資料
+        """
+        model = KeywordModel({"female": [("女友", KeywordMatchType.PARTIALLY), ("小妹", KeywordMatchType.PARTIALLY)],
+                              "male": [("小弟", KeywordMatchType.PARTIALLY)]})
+        winners = model.decide_batch([post_male, post_female, post_young, "Bob"])
+        self.assertEqual(winners.tolist(), [-1, 0, 1, -1])
+
     def test_eval(self):
         self.source_rule_base_model = KeywordModel(self.patterns)
         self.source_rule_base_model.eval(data, y)
 
+
+class TestCascadeModel(TestCase):
+
+    def test_predict_batch(self):
+        """
+        關鍵字無法決定的資料才交給下一層的規則，並記錄每一層的覆蓋率
+        """
+        cascade = CascadeModel([{"MODEL_TYPE": "keyword_model",
+                                 "PATTERN": {"female": [("小妹", KeywordMatchType.PARTIALLY)],
+                                             "male": [("小弟", KeywordMatchType.PARTIALLY)]}},
+                                {"MODEL_TYPE": "rule_model", "PATTERN": {"male": ["八卦版"]}}])
+        df = pd.DataFrame({"id": ["1", "2", "3", "4"], "s_area_id": ["1"] * 4, "author": ["Alice", "Bob", "Bob", "Bob"],
+                           "title": [""] * 4, "content": [post_female, post_young, "八卦版", "Hi"],
+                           "post_time": [datetime.now()] * 4})
+        self.assertEqual(cascade.predict_batch(df).tolist(), ["female", "male", "male", ""])
+        summary = cascade.summary()
+        self.assertEqual([(stage["rows"], stage["decided"]) for stage in summary["stages"]], [(4, 2), (2, 1)])
+        self.assertEqual(summary["undecided"], 1)
+
+    def test_predict_batch_supervised(self):
+        """
+        關鍵字無法決定的資料交給依作者名稱訓練的模型，模型參數依各層設定讀取，並排除無標籤與低機率的預測
+        """
+        authors = ["小美媽咪", "阿明爸爸", "美美媽", "大明爸", "Amy媽咪", "Tom爸比", "版主", "小編"] * 2
+        labels = [["female"], ["male"], ["female"], ["male"], ["female"], ["male"], ["other"], ["other"]] * 2
+        examples = [InputExample(id_=str(i), s_area_id="1", author=author, title="", content="", post_time=None)
+                    for i, author in enumerate(authors)]
+        CharNgramModel(model_dir_name="4_cascade_ngram", n_features=2 ** 12, C=10.0).fit(examples, labels)
+        model_registry.clear_models()
+
+        keyword_stage = {"MODEL_TYPE": "keyword_model", "PATTERN": {"male": [("小弟", KeywordMatchType.PARTIALLY)]}}
+        ngram_stage = {"MODEL_TYPE": "char_ngram_model", "MODEL_PATH": "4_cascade_ngram", "MIN_PROBA": 0.5,
+                       "FEATURE": "author_name", "IS_MULTI_LABEL": False, "NA_TAG": "other"}
+        df = pd.DataFrame({"id": ["1", "2", "3"], "s_area_id": ["1"] * 3, "author": ["Bob", "Amy媽咪", "版主"],
+                           "title": [""] * 3, "content": [post_young, "Hi", "Hi"],
+                           "post_time": [datetime.now()] * 3})
+        cascade = CascadeModel([keyword_stage, ngram_stage])
+        self.assertEqual(cascade.predict_batch(df).tolist(), ["male", "female", ""])
+        self.assertEqual([(stage["rows"], stage["decided"]) for stage in cascade.summary()["stages"]],
+                         [(3, 1), (2, 1)])
+        model = model_registry.get_model("char_ngram_model", "4_cascade_ngram", feature="author_name",
+                                          is_multi_label=False, na_tag="other")
+        self.assertEqual(model.na_tag, "other")
+        self.assertEqual(model.feature, PredictTarget.AUTHOR_NAME)
+
+        strict = CascadeModel([keyword_stage, dict(ngram_stage, MIN_PROBA=1.0)])
+        self.assertEqual(strict.predict_batch(df).tolist(), ["male", "", ""])
+        model_registry.clear_models()
+
+
+class TestPatternCache(TestCase):
+    pattern = {"young": ["工作.{0,3}([一兩三]|[1-3])年"], "female": ["小妹"]}
+
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.patcher = mock.patch.object(pattern_cache, "PATTERN_CACHE_DIR", Path(self.cache_dir.name))
+        self.patcher.start()
+        pattern_cache.clear_compiled_models()
+
+    def tearDown(self) -> None:
+        pattern_cache.clear_compiled_models()
+        self.patcher.stop()
+        self.cache_dir.cleanup()
+
+    def test_cache_hit(self):
+        """
+        同一組規則只編譯一次，清除行程快取後從磁碟讀取
+        """
+        model = pattern_cache.load_compiled_model(ModelType.RULE_MODEL.value, self.pattern)
+        self.assertIs(pattern_cache.load_compiled_model(ModelType.RULE_MODEL.value, self.pattern), model)
+        self.assertTrue(pattern_cache.get_artifact_path(ModelType.RULE_MODEL.value, self.pattern).exists())
+        pattern_cache.clear_compiled_models()
+        with mock.patch.object(RuleModel, "__init__", side_effect=AssertionError("compiled again")):
+            loaded = pattern_cache.load_compiled_model(ModelType.RULE_MODEL.value, self.pattern)
+        self.assertIsNot(loaded, model)
+        self.assertEqual(loaded.predict_batch([post_young, post_female])[1].tolist(), [0, 1])
+
+    def test_pattern_change(self):
+        """
+        規則內容或標籤順序改變時，雜湊值與編譯檔路徑都會改變
+        """
+        changed = {"young": ["工作.{0,3}([一兩三]|[1-3])年"], "female": ["小妹", "女友"]}
+        reordered = {"female": ["小妹"], "young": ["工作.{0,3}([一兩三]|[1-3])年"]}
+        key = pattern_cache.pattern_hash(ModelType.RULE_MODEL.value, self.pattern)
+        self.assertEqual(key, pattern_cache.pattern_hash(ModelType.RULE_MODEL.value, dict(self.pattern)))
+        self.assertNotEqual(key, pattern_cache.pattern_hash(ModelType.RULE_MODEL.value, changed))
+        self.assertNotEqual(key, pattern_cache.pattern_hash(ModelType.RULE_MODEL.value, reordered))
+        model = pattern_cache.load_compiled_model(ModelType.RULE_MODEL.value, self.pattern)
+        self.assertIsNot(pattern_cache.load_compiled_model(ModelType.RULE_MODEL.value, changed), model)
+
+    def test_version_bump(self):
+        """
+        編譯格式版本更新後，舊的編譯檔不再被讀取
+        """
+        old_path = pattern_cache.get_artifact_path(ModelType.RULE_MODEL.value, self.pattern)
+        old_key = pattern_cache.pattern_hash(ModelType.RULE_MODEL.value, self.pattern)
+        model = pattern_cache.load_compiled_model(ModelType.RULE_MODEL.value, self.pattern)
+        with mock.patch.object(RuleModel, "compiled_version", RuleModel.compiled_version + 1):
+            new_path = pattern_cache.get_artifact_path(ModelType.RULE_MODEL.value, self.pattern)
+            self.assertNotEqual(pattern_cache.pattern_hash(ModelType.RULE_MODEL.value, self.pattern), old_key)
+            self.assertEqual(new_path.parent.name, f"v{RuleModel.compiled_version}")
+            self.assertIsNot(pattern_cache.load_compiled_model(ModelType.RULE_MODEL.value, self.pattern), model)
+            self.assertTrue(new_path.exists())
+        self.assertTrue(old_path.exists())
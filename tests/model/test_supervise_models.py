@@ -1,11 +1,17 @@
 import os
+import shutil
 from datetime import datetime
 from unittest import TestCase
 
 import numpy as np
+from scipy.sparse import random as sparse_random
+from sklearn.ensemble import RandomForestClassifier
 
 from definition import ROOT_DIR
-from models.rf_model import RandomForestModel
+from models.audience_models import MODEL_ROOT
+from models.incremental_model import IncrementalModel
+from models.ngram_model import CharNgramModel
+from models.rf_model import CompactForest, RandomForestModel
 from models.tw_model import TermWeightModel
 from utils.data_helper import load_examples
 from utils.input_example import InputExample
@@ -44,6 +50,41 @@ class TestRandomForestModel(TestCase):
     def test_fit(self):
         self.model.fit(examples=training_set, y_true=train_y)
 
+    def test_convert_feature_hashing(self):
+        """
+        雜湊特徵不需要詞彙表，只保存 idf 陣列，同一篇文章轉換的結果與訓練時相同
+        """
+        model = RandomForestModel(model_dir_name=self.model_path, vectorizer_type='hashing', n_features=2 ** 10)
+        feature = model.convert_feature([input_young, input_male, input_female], update_vectorizer=True, min_df=1)
+        self.assertEqual(feature.shape, (3, 2 ** 10))
+        self.assertEqual(model.vectorizer.idf_.shape, (2 ** 10,))
+        self.assertAlmostEqual(abs(model.convert_feature([input_male]) - feature[1]).max(), 0, places=6)
+
+    def test_compact_forest(self):
+        """
+        攤平成陣列的樹與 sklearn 的預測機率完全相同，剪枝後的樹不超過指定深度
+        """
+        x = sparse_random(300, 50, density=0.2, format='csr', random_state=0)
+        y = np.asarray(['male', 'female', 'young'])[np.random.RandomState(0).randint(3, size=300)]
+        estimator = RandomForestClassifier(n_estimators=10, random_state=0).fit(x, y)
+        forest = CompactForest.from_estimator(estimator)
+        self.assertTrue(np.array_equal(forest.predict_proba(x), estimator.predict_proba(x)))
+        self.assertLessEqual(forest.prune(max_depth=3).node_depth().max(), 3)
+
+    def test_predict_chunks(self):
+        """
+        分塊並以多執行緒預測，機率與不分塊相同，標籤為機率最大的類別
+        """
+        examples = [input_male, input_female, input_female_2, input_young] * 5
+        model = RandomForestModel(model_dir_name="1_random_forest_chunks", chunk_size=3, n_jobs=2)
+        model.fit(examples=examples, y_true=[[example.label or "young"] for example in examples])
+        x = model.convert_feature(examples)
+        labels, logits = model.predict(examples)
+        self.assertEqual(logits.shape, (len(examples), 3))
+        self.assertTrue(np.array_equal(logits, model.model.predict_proba(x)))
+        self.assertTrue(np.array_equal(labels, model.classes_[np.argmax(logits, axis=1)]))
+        self.assertTrue(np.array_equal(labels, model.model.predict(x)))
+
     def test_load(self):
         self.model.load()
 
@@ -65,7 +106,177 @@ class TestTermWeightModel(TestCase):
         self.model.load()
         self.model.eval(examples=testing_set, y_true=test_y)
 
+    def test_fit_hashing(self):
+        """
+        雜湊特徵訓練後以斷詞結果找回詞彙，同一欄位的詞彙共用該欄位的權重，包含雜湊碰撞的欄位
+        """
+        contents = ["小妹今天哭哭", "小弟在八卦版"] * 60
+        examples = [InputExample(id_=str(i), s_area_id="1", author="", title="", content=content, post_time=None)
+                    for i, content in enumerate(contents)]
+        y_true = [["女性"], ["男性"]] * 60
+        model = TermWeightModel(model_dir_name="2_term_weight_hashing", vectorizer_type='hashing', n_jobs=1)
+        model.fit(examples, y_true)
+        weights = {label: dict(term_weights) for label, term_weights in model.label_term_weights.items()}
+        self.assertEqual(set(weights["女性"]), {"小妹", "今天", "哭哭", "小弟", "八卦"})
+        self.assertEqual({term for term, weight in weights["女性"].items() if weight == 1}, {"小妹", "今天", "哭哭"})
+        self.assertEqual({term for term, weight in weights["男性"].items() if weight == 1}, {"小弟", "八卦"})
+
+        # two columns force the terms of both labels to collide
+        model = TermWeightModel(model_dir_name="2_term_weight_hashing", vectorizer_type='hashing', n_features=2,
+                                n_jobs=1)
+        model.fit(examples, y_true)
+        columns, column_terms = model.vectorizer.feature_terms(model.segment(examples[:2]))
+        self.assertEqual(sorted(term for terms in column_terms for term in terms), sorted(weights["女性"]))
+        collided = [terms for terms in column_terms if "小妹" in terms][0]
+        self.assertIn("小弟", collided)
+        for label, term_weights in model.label_term_weights.items():
+            self.assertEqual(sorted(term for term, _ in term_weights), sorted(weights["女性"]))
+            for terms in column_terms:
+                self.assertEqual(len({weight for term, weight in term_weights if term in terms}), 1)
+        self.assertEqual(dict(model.label_term_weights["女性"])["小妹"], 1)
+
+    def test_fit_parallel(self):
+        """
+        一對多的訓練平行執行時，每個標籤的詞彙權重與單一行程訓練的結果相同
+        """
+        contents = ["小妹今天哭哭", "小弟在八卦版", "上班族今天加班", "小妹在八卦版哭哭", "小弟今天加班"] * 60
+        examples = [InputExample(id_=str(i), s_area_id="1", author="", title="", content=content, post_time=None)
+                    for i, content in enumerate(contents)]
+        y_true = [["女性"], ["男性"], ["上班族"], ["女性"], ["男性", "上班族"]] * 60
+        label_term_dicts = []
+        for n_jobs in [1, 2]:
+            model = TermWeightModel(model_dir_name="2_term_weight_parallel", n_jobs=n_jobs)
+            model.fit(examples, y_true)
+            label_term_dicts.append({label: dict(term_weights)
+                                     for label, term_weights in model.label_term_weights.items()})
+        self.assertEqual(set(label_term_dicts[0]), {"女性", "男性", "上班族"})
+        self.assertEqual(label_term_dicts[0]["女性"]["小妹"], 1)
+        self.assertEqual(label_term_dicts[1], label_term_dicts[0])
+
+    def test_predict_term_counts(self):
+        """
+        詞彙出現次數與 str.count 相同，依平均權重決定標籤
+        """
+        model = TermWeightModel(model_dir_name=self.model_path, na_tag='一般')
+        model.load({"female": [("小妹", 0.9), ("哭哭", 0.5)], "male": [("小弟", 0.8), ("女友", 0.1)]})
+        labels, matched = model.predict([input_female, input_male, input_young])
+        self.assertEqual(labels, [["female"], ["male"], ["male"]])
+        self.assertEqual(matched[0]["female"], [("小妹", 0.9, 1), ("哭哭", 0.5, 2)])
+        self.assertEqual(matched[1]["male"], [("小弟", 0.8, 1), ("女友", 0.1, 1)])
+
+    def test_save_load_index(self):
+        """
+        以二進位詞表儲存並以 mmap 讀取，預測結果不變
+        """
+        model = TermWeightModel(model_dir_name="2_term_weight_index", na_tag='一般')
+        model.load({"female": [("小妹", 0.9), ("哭哭", 0.5)], "male": [("小弟", 0.8), ("女友", 0.1)]})
+        model.save()
+        loaded = TermWeightModel(model_dir_name="2_term_weight_index", na_tag='一般')
+        loaded.load()
+        self.assertIsInstance(loaded.term_index.entry_weights, np.memmap)
+        self.assertEqual(loaded.predict([input_female, input_male])[0], [["female"], ["male"]])
+        self.assertEqual(loaded.label_term_weights["male"], [("小弟", 0.8), ("女友", 0.1)])
+
+    def test_load_edited_csv(self):
+        """
+        詞表 csv 內容與建立索引時不同就改讀 csv，不依賴檔案修改時間
+        """
+        model = TermWeightModel(model_dir_name="2_term_weight_index", na_tag='一般')
+        model.load({"female": [("小妹", 0.9), ("哭哭", 0.5)], "male": [("小弟", 0.8), ("女友", 0.1)]})
+        model.save()
+        csv_file = MODEL_ROOT / "2_term_weight_index" / model.dict_file_name
+        index_time = os.stat(csv_file).st_mtime
+        with open(csv_file, 'a') as f:
+            f.write("male,八卦版,0.7\n")
+        # a csv restored from a backup may be older than the index
+        os.utime(csv_file, (index_time - 60, index_time - 60))
+        loaded = TermWeightModel(model_dir_name="2_term_weight_index", na_tag='一般')
+        loaded.load()
+        self.assertEqual(loaded.label_term_weights["male"], [("小弟", 0.8), ("女友", 0.1), ("八卦版", 0.7)])
+        loaded.save()
+        reloaded = TermWeightModel(model_dir_name="2_term_weight_index", na_tag='一般')
+        reloaded.load()
+        self.assertIsInstance(reloaded.term_index.entry_weights, np.memmap)
+
+    def test_compact(self):
+        """
+        刪除無法讓平均分數超過門檻的詞彙，或只保留每個標籤前 k 個詞彙
+        """
+        model = TermWeightModel(model_dir_name=self.model_path, na_tag='一般')
+        model.load({"female": [("小妹", 0.9), ("哭哭", 0.5), ("朋友", 0.2)], "male": [("小弟", 0.8), ("女友", 0.1)]})
+        report = model.compact(examples=[input_female, input_male], y_true=[["female"], ["male"]])
+        self.assertEqual((report['entries_before'], report['entries_after']), (5, 3))
+        self.assertEqual(report['accuracy_delta'], 0)
+        self.assertEqual(model.label_term_weights["male"], [("小弟", 0.8)])
+        model.compact(top_k=1)
+        self.assertEqual(model.label_term_weights["female"], [("小妹", 0.9)])
+
+class TestIncrementalModel(TestCase):
+    model_path = "5_incremental_model"
+
+    def setUp(self) -> None:
+        shutil.rmtree(MODEL_ROOT / self.model_path, ignore_errors=True)
+
+    def test_partial_fit(self):
+        """
+        新資料以 partial_fit 併入既有模型，新標籤另外訓練，舊標籤的分類器延續訓練
+        """
+        model = IncrementalModel(model_dir_name=self.model_path, n_features=2 ** 12)
+        model.fit([input_male, input_female] * 3, [["male"], ["female"]] * 3)
+        seen = model.classifiers["female"].t_
 
+        updated = IncrementalModel(model_dir_name=self.model_path, n_features=2 ** 12)
+        updated.fit([input_female_2, input_young] * 3, [["female"], ["young"]] * 3)
+        self.assertEqual(updated.labels, ["female", "male", "young"])
+        self.assertGreater(updated.classifiers["female"].t_, seen)
+        labels, logits = updated.predict([input_male, input_female, input_young])
+        self.assertEqual(logits.shape, (3, 3))
+        self.assertEqual(labels.tolist(), ["male", "female", "young"])
 
+    def test_checkpoints(self):
+        """
+        每次訓練儲存新的 v<n> 版本，預設讀取最新版本，也可以讀取指定版本
+        """
+        model = IncrementalModel(model_dir_name=self.model_path, n_features=2 ** 12)
+        model.fit([input_male, input_female] * 3, [["male"], ["female"]] * 3)
+        model.fit([input_young] * 3, [["young"]] * 3)
+        self.assertEqual(model.version, 2)
+        self.assertTrue((MODEL_ROOT / self.model_path / "v1" / model.checkpoint_file_name).exists())
 
+        latest = IncrementalModel(model_dir_name=self.model_path)
+        latest.load()
+        self.assertEqual((latest.version, latest.labels, latest.n_features), (2, ["female", "male", "young"], 2 ** 12))
+        self.assertTrue(np.allclose(latest.predict([input_male])[1], model.predict([input_male])[1]))
+        first = IncrementalModel(model_dir_name=self.model_path)
+        first.load(version=1)
+        self.assertEqual((first.version, first.labels), (1, ["female", "male"]))
+
+class TestCharNgramModel(TestCase):
+    model_path = "3_char_ngram_model"
+    model = CharNgramModel(model_dir_name=model_path)
+
+    def test_fit(self):
+        self.model.fit(examples=training_set, y_true=train_y)
+
+    def test_load(self):
+        self.model.load()
+
+    def test_eval(self):
+        self.model.load()
+        self.model.eval(examples=testing_set, y_true=test_y)
 
+    def test_predict_batch(self):
+        """
+        以整欄作者名稱一次預測，儲存後以 mmap 讀取的結果不變
+        """
+        names = ["小美媽咪", "阿明爸爸", "美美媽", "大明爸", "Amy媽咪", "Tom爸比"]
+        examples = [InputExample(id_=str(i), s_area_id="1", author=name, title="", content="", post_time=None)
+                    for i, name in enumerate(names)]
+        model = CharNgramModel(model_dir_name="3_char_ngram_batch", n_features=2 ** 12, C=10.0)
+        model.fit(examples, [["female"], ["male"]] * 3)
+        labels, logits = model.predict_batch(["ＡＭＹ媽咪", "阿明爸爸"])
+        self.assertEqual(labels.tolist(), ["female", "male"])
+        loaded = CharNgramModel(model_dir_name="3_char_ngram_batch")
+        loaded.load(mmap_mode='r')
+        self.assertIsInstance(loaded.coef, np.memmap)
+        self.assertTrue(np.allclose(loaded.predict(examples[:2])[1], model.predict(examples[:2])[1]))
@@ -0,0 +1,113 @@
+from unittest import TestCase, mock
+
+from models.audience_models import MODEL_ROOT
+from models.ngram_model import CharNgramModel
+from utils import model_registry
+from utils.input_example import InputExample
+from utils.selections import ModelType
+
+names = ["小美媽咪", "阿明爸爸", "美美媽", "大明爸", "Amy媽咪", "Tom爸比"]
+examples = [InputExample(id_=str(i), s_area_id="1", author=name, title="", content="", post_time=None)
+            for i, name in enumerate(names)]
+labels = [["female"], ["male"]] * 3
+
+
+def train(model_path: str) -> str:
+    return CharNgramModel(model_dir_name=model_path, n_features=2 ** 12, C=10.0).fit(examples, labels)
+
+
+class TestModelRegistry(TestCase):
+    model_type = ModelType.CHAR_NGRAM_MODEL.value
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        train("4_registry_a")
+        train("4_registry_b")
+
+    def setUp(self) -> None:
+        model_registry.clear_models()
+        model_registry.set_memory_budget(2048)
+
+    def tearDown(self) -> None:
+        model_registry.clear_models()
+        model_registry.set_memory_budget(2048)
+        model_registry.set_version_ttl(60.0)
+
+    def test_version_key(self):
+        """
+        同一版本的模型只讀取一次，鍵值包含模型檔案的版本
+        """
+        model = model_registry.get_model(self.model_type, "4_registry_a")
+        self.assertIs(model_registry.get_model(self.model_type, "4_registry_a"), model)
+        self.assertEqual(list(model_registry._registry.keys()),
+                         [(self.model_type, "4_registry_a", (), model_registry.model_version("4_registry_a"))])
+        self.assertEqual(model.predict_batch(["ＡＭＹ媽咪"])[0].tolist(), ["female"])
+
+    def test_stale_version(self):
+        """
+        模型重新訓練後讀取新版本，並移除舊版本
+        """
+        # the model is rewritten in place, which only the ttl notices
+        model_registry.set_version_ttl(0)
+        train("4_registry_c")
+        model = model_registry.get_model(self.model_type, "4_registry_c")
+        version = model_registry.model_version("4_registry_c")
+        train("4_registry_c")
+        self.assertNotEqual(model_registry.model_version("4_registry_c"), version)
+        reloaded = model_registry.get_model(self.model_type, "4_registry_c")
+        self.assertIsNot(reloaded, model)
+        self.assertEqual([key[:2] for key in model_registry._registry.keys()], [(self.model_type, "4_registry_c")])
+        self.assertEqual(list(model_registry._registry.keys())[0][3], model_registry.model_version("4_registry_c"))
+
+    def test_params_key(self):
+        """
+        同一模型以不同參數讀取時分別存放，參數會傳入模型
+        """
+        model = model_registry.get_model(self.model_type, "4_registry_a")
+        tagged = model_registry.get_model(self.model_type, "4_registry_a", feature="author_name", na_tag="male")
+        self.assertIsNot(tagged, model)
+        self.assertIs(model_registry.get_model(self.model_type, "4_registry_a", na_tag="male",
+                                               feature="author_name"), tagged)
+        self.assertIsNone(model.na_tag)
+        self.assertEqual(tagged.na_tag, "male")
+        self.assertEqual([key[2] for key in model_registry._registry.keys()],
+                         [(), (("feature", "author_name"), ("na_tag", "male"))])
+
+    def test_version_cache(self):
+        """
+        存活時間內不重新掃描模型檔案，模型目錄有檔案新增時立即重新計算版本
+        """
+        model = model_registry.get_model(self.model_type, "4_registry_a")
+        with mock.patch.object(model_registry, "model_version", side_effect=AssertionError("stat again")):
+            self.assertIs(model_registry.get_model(self.model_type, "4_registry_a"), model)
+        marker = MODEL_ROOT / "4_registry_a" / "marker.txt"
+        marker.write_text("1")
+        self.addCleanup(marker.unlink)
+        self.assertIsNot(model_registry.get_model(self.model_type, "4_registry_a"), model)
+
+    def test_preload_params(self):
+        """
+        預先讀取的設定可帶模型參數，串接模型以相同參數讀取時共用同一份模型
+        """
+        spec = "char_ngram_model:4_registry_a?feature=author_name&is_multi_label=false&na_tag=male"
+        self.assertEqual(model_registry.parse_model_spec(spec),
+                         (self.model_type, "4_registry_a",
+                          {"feature": "author_name", "is_multi_label": "false", "na_tag": "male"}))
+        model_registry.preload_models([spec])
+        model = model_registry.get_model(self.model_type, "4_registry_a", feature="author_name",
+                                         is_multi_label=False, na_tag="male")
+        self.assertEqual(len(model_registry._registry), 1)
+        self.assertEqual(model.na_tag, "male")
+
+    def test_evict_by_budget(self):
+        """
+        超過記憶體預算時移除最久未使用的模型，但保留最新讀取的模型
+        """
+        model_a = model_registry.get_model(self.model_type, "4_registry_a")
+        model_registry.get_model(self.model_type, "4_registry_b")
+        self.assertIs(model_registry.get_model(self.model_type, "4_registry_a"), model_a)
+        # b is now the least recently used
+        model_registry.set_memory_budget(0)
+        self.assertEqual([key[1] for key in model_registry._registry.keys()], ["4_registry_a"])
+        model_registry.get_model(self.model_type, "4_registry_b")
+        self.assertEqual([key[1] for key in model_registry._registry.keys()], ["4_registry_b"])
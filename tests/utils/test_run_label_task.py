@@ -0,0 +1,56 @@
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from unittest import TestCase, mock
+
+import pandas as pd
+
+from utils import pattern_cache
+from utils.helper import get_logger
+from utils.run_label_task import labeling
+from utils.selections import KeywordMatchType, ModelType
+
+
+class TestLabeling(TestCase):
+    """批次貼標的結果，輸出資料庫以 mock 取代"""
+    patterns = {ModelType.KEYWORD_MODEL.value: {"女性": [("小妹", KeywordMatchType.PARTIALLY)],
+                                                "男性": [("小弟", KeywordMatchType.PARTIALLY)]},
+                ModelType.RULE_MODEL.value: {"女性": ["小妹"], "男性": ["小弟"]}}
+
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        patchers = [mock.patch.object(pattern_cache, "PATTERN_CACHE_DIR", Path(self.cache_dir.name)),
+                    mock.patch("utils.run_label_task.create_engine"),
+                    mock.patch.object(pd.DataFrame, "to_sql", autospec=True)]
+        _, create_engine, self.to_sql = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        # every output table exists already, so no table is created
+        create_engine.return_value.connect.return_value.execute.return_value.fetchall.return_value = [("Comment",)]
+        pattern_cache.clear_compiled_models()
+        self.addCleanup(pattern_cache.clear_compiled_models)
+
+    def batch(self) -> pd.DataFrame:
+        return pd.DataFrame({"id": ["1", "2", "3"], "s_id": ["WH_F0183"] * 3, "s_area_id": ["1"] * 3,
+                             "author": ["Alice", "Bob", "Carol"], "title": [""] * 3,
+                             "content": ["今天天氣很好", "小妹今天哭哭", "小妹和小弟去八卦版"],
+                             "post_time": [datetime(2021, 1, 1)] * 3})
+
+    def test_labeling(self):
+        """
+        沒有命中的資料不貼標，只命中一個標籤的資料貼上該標籤，命中多個標籤的資料視為無法決定而不貼標
+        """
+        for model_type, pattern in self.patterns.items():
+            with self.subTest(model_type=model_type):
+                self.to_sql.reset_mock()
+                df = self.batch()
+                result_table_dict, output_number_row = labeling("task", df, model_type, "content", pattern,
+                                                                 get_logger("test_labeling"))
+                self.assertEqual(df["panel"].tolist(), ["", "女性", ""])
+                self.assertEqual(output_number_row, 1)
+                self.assertEqual(result_table_dict, {"Comment": {"WH_F0183_Alice", "WH_F0183_Bob",
+                                                                 "WH_F0183_Carol"}})
+                written = self.to_sql.call_args.args[0]
+                self.assertEqual(written[["id", "task_id", "source_author", "panel"]].values.tolist(),
+                                 [["2", "task", "WH_F0183_Bob", "/female"]])
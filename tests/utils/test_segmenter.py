@@ -0,0 +1,49 @@
+from unittest import TestCase, mock
+
+import jieba
+
+from utils.segmenter import Segmenter
+
+texts = ["小弟我出社會工作不到兩年，今天辦了人生第一張信用卡",
+         "小妹的朋友上週領薪水這週就跟我哭哭說全身上下剩一千五",
+         "在八卦版混了很久了",
+         "上班上久了，心情煩悶",
+         "明明就是存起來哪是沒錢啊不懂欸",
+         "感謝八卦版大的貢獻",
+         "今天天氣很好",
+         "小妹我男朋友上週領薪水",
+         "我都是會直覺地點閱進入觀賞"]
+
+
+class TestSegmenter(TestCase):
+
+    def setUp(self) -> None:
+        self.segmenter = Segmenter(processes=2, chunk_size=2)
+
+    def tearDown(self) -> None:
+        self.segmenter.close()
+
+    def test_order(self):
+        """
+        分塊送到多個行程斷詞，結果仍依輸入順序回傳
+        """
+        self.assertEqual(self.segmenter.segment_batch(texts), [jieba.lcut(text) for text in texts])
+        self.assertIsNotNone(self.segmenter._pool)
+        self.assertEqual(list(self.segmenter.iter_segment(iter(texts[::-1]))),
+                         [jieba.lcut(text) for text in texts[::-1]])
+
+    def test_cut_all(self):
+        """
+        全模式斷詞與 jieba.lcut(cut_all=True) 相同
+        """
+        self.assertEqual(self.segmenter.segment_batch(texts, cut_all=True),
+                         [jieba.lcut(text, cut_all=True) for text in texts])
+
+    def test_gevent(self):
+        """
+        在 gevent monkey patch 的行程中不啟動行程池，改在同一行程斷詞
+        """
+        with mock.patch("utils.segmenter._gevent_patched", return_value=True):
+            self.assertFalse(self.segmenter.parallel)
+            self.assertEqual(self.segmenter.segment_batch(texts), [jieba.lcut(text) for text in texts])
+        self.assertIsNone(self.segmenter._pool)
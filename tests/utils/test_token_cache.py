@@ -0,0 +1,78 @@
+import sqlite3
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from utils.token_cache import TokenCache
+
+
+class TestTokenCache(TestCase):
+
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.cache_dir.name) / "token_cache.sqlite3"
+
+    def tearDown(self) -> None:
+        self.cache_dir.cleanup()
+
+    def rows(self):
+        with sqlite3.connect(str(self.path)) as connection:
+            return connection.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+
+    def test_get_put_many(self):
+        """
+        未命中的文章回傳 None，寫入後其他行程也能從檔案讀取，
+        斷詞模式不同視為不同文章
+        """
+        cache = TokenCache(path=self.path)
+        self.assertEqual(cache.get_many(["今天天氣很好", "小妹"], "precise"), [None, None])
+        cache.put_many(["今天天氣很好", "小妹"], "precise", [["今天", "天氣", "很", "好"], ["小妹"]])
+        cache.close()
+
+        other = TokenCache(path=self.path)
+        self.assertEqual(other.get_many(["小妹", "小弟", "小妹"], "precise"), [["小妹"], None, ["小妹"]])
+        self.assertEqual(other.get_many(["小妹"], "full"), [None])
+        other.close()
+
+    def test_dictionary_version(self):
+        """
+        jieba 使用者辭典改變後，舊的斷詞結果不再被讀取
+        """
+        user_dict = Path(self.cache_dir.name) / "user_dict.txt"
+        user_dict.write_text("八卦版 10 n\n", encoding="utf-8")
+        cache = TokenCache(path=self.path, user_dict=str(user_dict))
+        cache.put_many(["在八卦版混"], "precise", [["在", "八卦版", "混"]])
+        cache.close()
+        self.assertEqual(TokenCache(path=self.path, user_dict=str(user_dict)).get_many(["在八卦版混"], "precise"),
+                         [["在", "八卦版", "混"]])
+        self.assertEqual(TokenCache(path=self.path).get_many(["在八卦版混"], "precise"), [None])
+
+        user_dict.write_text("八卦 10 n\n", encoding="utf-8")
+        changed = TokenCache(path=self.path, user_dict=str(user_dict))
+        self.assertNotEqual(changed.version, cache.version)
+        self.assertEqual(changed.get_many(["在八卦版混"], "precise"), [None])
+        changed.close()
+
+    def test_lru(self):
+        """
+        記憶體只保留最近使用的項目，被移出的項目從檔案讀回
+        """
+        cache = TokenCache(path=self.path, lru_size=2)
+        cache.put_many(["a", "b", "c"], "precise", [["a"], ["b"], ["c"]])
+        self.assertEqual(list(cache._lru.keys()), [cache.key("b", "precise"), cache.key("c", "precise")])
+        self.assertEqual(cache.get_many(["a"], "precise"), [["a"]])
+        self.assertEqual(list(cache._lru.keys()), [cache.key("c", "precise"), cache.key("a", "precise")])
+        cache.close()
+
+    def test_max_rows(self):
+        """
+        檔案超過列數上限時刪除最久未使用的文章
+        """
+        cache = TokenCache(path=self.path, lru_size=0, max_rows=3)
+        cache.put_many(["a", "b", "c"], "precise", [["a"], ["b"], ["c"]])
+        # a is read again, so b is the least recently used
+        cache.get_many(["a"], "precise")
+        cache.put_many(["d", "e"], "precise", [["d"], ["e"]])
+        self.assertEqual(self.rows(), 3)
+        self.assertEqual(cache.get_many(["a", "b", "c", "d", "e"], "precise"), [["a"], None, None, ["d"], ["e"]])
+        cache.close()
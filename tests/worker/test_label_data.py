@@ -0,0 +1,30 @@
+import json
+from unittest import TestCase, mock
+
+from celery_worker import label_data
+
+
+class TestLabelData(TestCase):
+    """貼標任務的錯誤處理，資料庫以 mock 取代"""
+
+    def setUp(self) -> None:
+        patchers = [mock.patch("celery_worker.check_break_status", return_value=None),
+                    mock.patch("celery_worker.update2state"),
+                    mock.patch("celery_worker.get_batch_by_timedelta")]
+        _, self.update_state, self.get_batch = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+    def test_invalid_pattern(self):
+        """
+        規則無法編譯時，任務狀態寫入失敗並拋出錯誤，不會讀取任何資料
+        """
+        kwargs_json = json.dumps({"MODEL_TYPE": "rule_model", "PATTERN": {"female": ["小妹("]},
+                                  "PREDICT_TYPE": "content", "START_TIME": "2020-01-01T00:00:00",
+                                  "END_TIME": "2020-01-02T00:00:00"})
+        with self.assertRaises(Exception):
+            label_data("task_invalid_pattern", kwargs_json)
+        self.assertEqual(self.update_state.call_count, 1)
+        self.assertEqual(self.update_state.call_args.args[0], "task_invalid_pattern")
+        self.assertFalse(self.update_state.call_args.kwargs["success"])
+        self.get_batch.assert_not_called()
@@ -0,0 +1,115 @@
+import json
+from datetime import datetime
+from unittest import TestCase, mock
+
+from celery_worker import train_model
+from models.audience_models import MODEL_ROOT
+from models.model_creator import ParamterMissingError
+from utils.database_core import insert2training_result, update2training_result_stage, update2training_result, \
+    query_training_result_by_id
+from utils.input_example import InputExample
+from utils.selections import TrainingStage
+
+
+class TestTrainModel(TestCase):
+    """訓練工作的狀態更新，資料庫以 mock 取代"""
+    names = ["小美媽咪", "阿明爸爸", "美美媽", "大明爸"]
+    examples = [InputExample(id_=str(i), s_area_id="1", author=name, title="", content="", post_time=None)
+                for i, name in enumerate(names)]
+    y_true = [["female"], ["male"]] * 2
+
+    def setUp(self) -> None:
+        patchers = [mock.patch("celery_worker.update2training_result_stage"),
+                    mock.patch("celery_worker.update2training_result"),
+                    mock.patch.object(train_model, "update_state")]
+        self.update_stage, self.update_result, self.update_state = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+    def test_success(self):
+        """
+        依序回報每個訓練階段，完成後寫入 SUCCESS、評估結果與模型路徑
+        """
+        artifact_path = train_model("job_success", "CHAR_NGRAM_MODEL", {"model_path": "6_training_job"},
+                                    self.examples, self.y_true, validation_set=self.examples,
+                                    validation_y=self.y_true)
+        stages = [TrainingStage.VECTORIZATION.value, TrainingStage.FITTING.value, TrainingStage.SAVING.value,
+                  TrainingStage.EVALUATION.value]
+        self.assertEqual([c.args[:3] for c in self.update_stage.call_args_list],
+                         [("job_success", "PROGRESS", stage) for stage in stages])
+        self.assertEqual([c.kwargs for c in self.update_state.call_args_list],
+                         [{"state": "PROGRESS", "meta": {"stage": stage}} for stage in stages])
+
+        self.update_result.assert_called_once()
+        kwargs = self.update_result.call_args.kwargs
+        self.assertNotIn("success", kwargs)
+        self.assertEqual(kwargs["artifact_path"], artifact_path)
+        self.assertEqual(artifact_path, str(MODEL_ROOT / "6_training_job"))
+        metrics = json.loads(kwargs["metrics"])
+        self.assertEqual((metrics["training_size"], metrics["validation_size"]), (4, 4))
+        self.assertIn("accuracy", metrics["report"])
+
+    def test_failure(self):
+        """
+        訓練失敗時寫入 FAILURE 與錯誤訊息，並將例外拋給 celery
+        """
+        with self.assertRaises(ParamterMissingError):
+            train_model("job_failure", "CHAR_NGRAM_MODEL", {}, self.examples, self.y_true)
+        self.update_stage.assert_not_called()
+        self.update_result.assert_called_once()
+        self.assertEqual(self.update_result.call_args.args[0], "job_failure")
+        self.assertFalse(self.update_result.call_args.kwargs["success"])
+        self.assertIn("model_path", self.update_result.call_args.kwargs["error_message"])
+
+
+class TestTrainingResult(TestCase):
+    """training_result 資料表的寫入與查詢，連線以 mock 取代"""
+
+    def setUp(self) -> None:
+        patcher = mock.patch("utils.database_core.connect_database")
+        self.connect_database = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cursor = self.connect_database.return_value.cursor.return_value
+        self.logger = mock.Mock()
+
+    def test_insert_pending(self):
+        """
+        新的訓練工作以 PENDING 寫入
+        """
+        create_time = datetime.now()
+        insert2training_result("job", "PENDING", "CHAR_NGRAM_MODEL", "6_training_job", create_time, self.logger)
+        sql, args = self.cursor.execute.call_args.args
+        self.assertTrue(sql.startswith("INSERT INTO training_result"))
+        self.assertEqual(args, ("job", "PENDING", "CHAR_NGRAM_MODEL", "6_training_job", create_time))
+        self.connect_database.return_value.commit.assert_called_once()
+
+    def test_update_stage(self):
+        """
+        更新訓練階段
+        """
+        update2training_result_stage("job", "PROGRESS", TrainingStage.FITTING.value, self.logger)
+        sql, args = self.cursor.execute.call_args.args
+        self.assertIn("SET stat = %s, stage = %s", sql)
+        self.assertEqual(args, ("PROGRESS", "fitting", "job"))
+
+    def test_update_result(self):
+        """
+        完成時寫入 SUCCESS 與評估結果，失敗時寫入 FAILURE 與錯誤訊息
+        """
+        update2training_result("job", self.logger, metrics='{"training_size": 4}', artifact_path="model_files/job")
+        sql, args = self.cursor.execute.call_args.args
+        self.assertIn('stat = "SUCCESS"', sql)
+        self.assertEqual(args[1:], ('{"training_size": 4}', "model_files/job", "job"))
+
+        update2training_result("job", self.logger, success=False, error_message="failed")
+        sql, args = self.cursor.execute.call_args.args
+        self.assertIn('stat = "FAILURE"', sql)
+        self.assertEqual(args[1:], ("failed", "job"))
+
+    def test_query(self):
+        """
+        以 job_id 查詢訓練工作
+        """
+        self.cursor.fetchone.return_value = {"job_id": "job", "stat": "SUCCESS", "stage": "saving"}
+        self.assertEqual(query_training_result_by_id("job")["stat"], "SUCCESS")
+        self.assertEqual(self.cursor.execute.call_args.args[1], ("job",))
@@ -0,0 +1,83 @@
+from typing import List, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+
+# FNV-1a over the code points of an n-gram, then the splitmix64 finalizer to spread the bits
+FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+FNV_PRIME = np.uint64(0x100000001B3)
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+# the code points of the start and the end of a text, so the first and the last characters have their own n-grams
+BEGIN_MARK = 2
+END_MARK = 3
+
+
+class CharNgramHasher(object):
+    """
+    the character n-grams of a whole column of short texts hashed by numpy, the texts are laid out as a matrix of
+    code points and every n-gram order is hashed for all rows at once, there is no python loop over the texts,
+    a gram adds +1 or -1 by the top bit of its hash, and a row is scaled by one over the square root of its grams
+    Args:
+        ngram_range: the smallest and the largest n, the n-grams above 1 include the start and the end of the text
+        n_features: columns of the hashed space
+        max_length: characters of a text which are hashed, the rest is cut off
+        chunk_size: texts hashed at once, which bounds the memory of the code point matrices
+    """
+    def __init__(self, ngram_range: Tuple[int, int] = (1, 3), n_features: int = 2 ** 18, max_length: int = 32,
+                 chunk_size: int = 50000):
+        self.ngram_range = tuple(ngram_range)
+        self.n_features = n_features
+        self.max_length = max_length
+        self.chunk_size = chunk_size
+
+    def transform(self, texts: List[str]) -> csr_matrix:
+        if len(texts) <= self.chunk_size:
+            return self._transform(texts)
+        return vstack([self._transform(texts[start:start + self.chunk_size])
+                       for start in range(0, len(texts), self.chunk_size)], format='csr')
+
+    def _transform(self, texts: List[str]) -> csr_matrix:
+        # numpy cuts every text to ``max_length`` and pads it with zeros
+        codes = np.asarray(texts, dtype=f'<U{self.max_length}')
+        n_rows = len(codes)
+        width = codes.dtype.itemsize // 4
+        codes = codes.view(np.uint32).reshape(n_rows, width)
+        lengths = np.count_nonzero(codes, axis=1)
+        marked = np.zeros((n_rows, width + 2), dtype=np.uint64)
+        marked[:, 0] = BEGIN_MARK
+        marked[:, 1:width + 1] = codes
+        marked[np.arange(n_rows), lengths + 1] = END_MARK
+
+        hashes, valid = [], []
+        for order in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            if order == 1:
+                # the marks are not unigrams
+                order_hashes = marked[:, 1:width + 1].copy()
+                order_valid = np.arange(width)[np.newaxis, :] < lengths[:, np.newaxis]
+            else:
+                span = width + 3 - order
+                order_hashes = np.full((n_rows, span), FNV_OFFSET)
+                for offset in range(order):
+                    order_hashes ^= marked[:, offset:offset + span]
+                    order_hashes *= FNV_PRIME
+                order_valid = np.arange(span)[np.newaxis, :] + order - 1 <= (lengths + 1)[:, np.newaxis]
+            order_hashes ^= np.uint64(order)
+            hashes.append(order_hashes)
+            valid.append(order_valid)
+        valid = np.concatenate(valid, axis=1)
+        # the grams are taken row by row, so they are already in the order of a csr matrix
+        grams = np.concatenate(hashes, axis=1)[valid]
+        grams ^= grams >> np.uint64(30)
+        grams *= MIX_1
+        grams ^= grams >> np.uint64(27)
+        grams *= MIX_2
+        grams ^= grams >> np.uint64(31)
+
+        counts = np.count_nonzero(valid, axis=1)
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        data = np.where(grams >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+        data /= np.sqrt(np.repeat(counts, counts)).astype(np.float32)
+        indices = (grams % np.uint64(self.n_features)).astype(np.int32)
+        return csr_matrix((data, indices, indptr), shape=(n_rows, self.n_features))
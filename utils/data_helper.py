@@ -1,11 +1,11 @@
 import random
 
-from collections import defaultdict
 from typing import Dict, Iterator
 
+import numpy as np
 import pandas as pd
 
-from utils.input_example import InputExample
+from utils.input_example import ExampleBatch, InputExample
 
 
 def load_examples(file: str, sample_count: int = None, shuffle: bool = True, labels=None):
@@ -17,24 +17,25 @@ def load_examples(file: str, sample_count: int = None, shuffle: bool = True, lab
         shuffle: 打亂順序
         labels: 使用標籤，若為None則使用全部
     Returns:
-
+        an ``ExampleBatch`` of the sampled rows
     """
     df = pd.read_csv(file, sep='\t', header=0, names=["content", "label"])
+    if labels is not None:
+        df = df[df['label'].isin(labels)]
 
-    examples = defaultdict(list)
-    for index, row in df.iterrows():
-        if labels is None or row['label'] in labels:
-            examples[row['label']].append(
-                InputExample(
-                    id_=index,
-                    s_area_id="",
-                    author="",
-                    title="",
-                    content=row["content"],
-                    post_time=None,
-                    label=row["label"])
-            )
-    return preprocess_example(examples=examples, sample_count=sample_count, shuffle=shuffle)
+    # the rows of every label are sampled as ``preprocess_example`` does, only their positions are moved around
+    positions = []
+    for label, rows in df.groupby('label', sort=False, dropna=False).indices.items():
+        if sample_count and len(rows) >= sample_count:
+            positions.extend(random.sample(list(rows), sample_count))
+        else:
+            positions.extend(rows)
+    if shuffle:
+        random.shuffle(positions)
+    df = df.iloc[positions]
+    empty = np.full(len(df), '', dtype=object)
+    return ExampleBatch(id_=df.index, s_area_id=empty, author=empty, title=empty, content=df['content'],
+                        label=df['label'])
 
 def preprocess_example(examples: Dict, sample_count: int = None, shuffle: bool = True) -> Iterator[InputExample]:
     dataset = []
@@ -146,6 +146,11 @@ def create_table(table_ID: str, logger: get_logger, schema=None):
         raise e
 
 
+# columns added to the state table after its first release, ``add_state_columns`` adds them to an older table
+STATE_ADDED_COLUMNS = {'rule_telemetry': 'LONGTEXT', 'cascade_coverage': 'LONGTEXT'}
+_state_columns_checked = set()
+
+
 def create_state_table(logger: get_logger, schema=None):
     insert_sql = f'CREATE TABLE IF NOT EXISTS `state`(' \
                  f'`task_id` VARCHAR(32) NOT NULL,' \
@@ -165,7 +170,9 @@ def create_state_table(logger: get_logger, schema=None):
                  f'`rate_of_label` INT(11),' \
                  f'`run_time` FLOAT(10),' \
                  f'`check_point` DATETIME,' \
-                 f'`error_message` LONGTEXT' \
+                 f'`error_message` LONGTEXT,' \
+                 f'`rule_telemetry` LONGTEXT,' \
+                 f'`cascade_coverage` LONGTEXT' \
                  f')ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin ' \
                  f'AUTO_INCREMENT=1 ;'
     func = connect_database
@@ -181,6 +188,29 @@ def create_state_table(logger: get_logger, schema=None):
         raise e
 
 
+def add_state_columns(logger: get_logger, schema=None):
+    """
+    add the columns of ``STATE_ADDED_COLUMNS`` which a state table created by an older version lacks,
+    the table is only checked once per process, a new table is created with every column by ``create_state_table``
+    """
+    if schema in _state_columns_checked:
+        return
+    connection = connect_database(schema=schema, output=True)
+    try:
+        cursor = connection.cursor()
+        cursor.execute('SHOW COLUMNS FROM state')
+        exist_columns = {row['Field'] for row in cursor.fetchall()}
+        for column, datatype in STATE_ADDED_COLUMNS.items():
+            if column not in exist_columns:
+                logger.info(f'adding column {column} to the state table...')
+                cursor.execute(f'ALTER TABLE state ADD COLUMN `{column}` {datatype}')
+        connection.commit()
+        connection.close()
+        _state_columns_checked.add(schema)
+    except Exception as e:
+        logger.error(e)
+        raise e
+
 
 def insert2state(task_id, status, model_type, predict_type,
                  date_range, target_table, time, result,
@@ -271,6 +301,115 @@ def update2state(task_id, result, logger: get_logger, input_row_length = None,
     except Exception as e:
         raise e
 
+def update2state_rule_telemetry(task_id, schema, rule_telemetry: str, logger: get_logger):
+    """write the json summary of the rule telemetry of a task, ``add_state_columns`` adds the column to an old table"""
+    connection = connect_database(schema=schema, output=True)
+    try:
+        cursor = connection.cursor()
+        logger.info('connecting to database...')
+        # the summary holds raw regex patterns, so it is passed as a parameter rather than formatted into the sql
+        cursor.execute('UPDATE state SET rule_telemetry = %s where task_id = %s', (rule_telemetry, task_id))
+        logger.info(f'successfully write rule telemetry into table.')
+        connection.commit()
+        connection.close()
+    except Exception as e:
+        raise e
+
+def update2state_cascade_coverage(task_id, schema, cascade_coverage: str, logger: get_logger):
+    """write the json summary of the stages of a cascade task, ``add_state_columns`` adds the column to an old table"""
+    connection = connect_database(schema=schema, output=True)
+    try:
+        cursor = connection.cursor()
+        logger.info('connecting to database...')
+        cursor.execute('UPDATE state SET cascade_coverage = %s where task_id = %s', (cascade_coverage, task_id))
+        logger.info(f'successfully write cascade coverage into table.')
+        connection.commit()
+        connection.close()
+    except Exception as e:
+        raise e
+
+
+def create_training_result_table(logger: get_logger, schema=None):
+    insert_sql = f'CREATE TABLE IF NOT EXISTS `training_result`(' \
+                 f'`job_id` VARCHAR(32) NOT NULL,' \
+                 f'`stat` VARCHAR(32) NOT NULL,' \
+                 f'`stage` VARCHAR(32),' \
+                 f'`model_type` VARCHAR(32) NOT NULL,' \
+                 f'`model_path` TEXT,' \
+                 f'`create_time` DATETIME NOT NULL,' \
+                 f'`finish_time` DATETIME,' \
+                 f'`metrics` LONGTEXT,' \
+                 f'`artifact_path` TEXT,' \
+                 f'`error_message` LONGTEXT,' \
+                 f'PRIMARY KEY (`job_id`)' \
+                 f')ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin ;'
+    connection = connect_database(schema=schema, output=True)
+    try:
+        with connection.cursor() as cursor:
+            logger.info('connecting to database...')
+            logger.info('creating table...')
+            cursor.execute(insert_sql)
+            logger.info(f'successfully created table.')
+        connection.close()
+    except Exception as e:
+        logger.error(e)
+        raise e
+
+def insert2training_result(job_id, status, model_type, model_path, time, logger: get_logger, schema=None):
+    connection = connect_database(schema=schema, output=True)
+    insert_sql = 'INSERT INTO training_result (job_id, stat, model_type, model_path, create_time) ' \
+                 'VALUES (%s, %s, %s, %s, %s)'
+    try:
+        cursor = connection.cursor()
+        logger.info('connecting to database...')
+        cursor.execute(insert_sql, (job_id, status, model_type, model_path, time))
+        logger.info(f'successfully insert training job into table.')
+        connection.commit()
+        connection.close()
+    except Exception as e:
+        raise e
+
+def update2training_result_stage(job_id, status, stage, logger: get_logger, schema=None):
+    connection = connect_database(schema=schema, output=True)
+    insert_sql = 'UPDATE training_result SET stat = %s, stage = %s where job_id = %s'
+    try:
+        cursor = connection.cursor()
+        cursor.execute(insert_sql, (status, stage, job_id))
+        logger.info(f'training job {job_id} moves to {stage}.')
+        connection.commit()
+        connection.close()
+    except Exception as e:
+        raise e
+
+def update2training_result(job_id, logger: get_logger, schema=None, success=True, metrics=None,
+                           artifact_path=None, error_message=None):
+    connection = connect_database(schema=schema, output=True)
+    if success:
+        insert_sql = 'UPDATE training_result SET stat = "SUCCESS", finish_time = %s, metrics = %s, ' \
+                     'artifact_path = %s where job_id = %s'
+        args = (datetime.now(), metrics, artifact_path, job_id)
+    else:
+        insert_sql = 'UPDATE training_result SET stat = "FAILURE", finish_time = %s, error_message = %s ' \
+                     'where job_id = %s'
+        args = (datetime.now(), error_message, job_id)
+    try:
+        cursor = connection.cursor()
+        logger.info('connecting to database...')
+        cursor.execute(insert_sql, args)
+        logger.info(f'successfully write training result into table.')
+        connection.commit()
+        connection.close()
+    except Exception as e:
+        raise e
+
+def query_training_result_by_id(job_id):
+    connection = connect_database(DatabaseConfig.OUTPUT_SCHEMA, output=True)
+    cur = connection.cursor()
+    cur.execute('SELECT * FROM training_result WHERE job_id = %s', (job_id,))
+    r = cur.fetchone()
+    connection.close()
+    return r
+
 
 def drop_table(table_name: str, logger: get_logger, schema=None) :
     """drop table name"""
@@ -488,6 +627,8 @@ def check_state_exist(logger):
     _exist_tables = [i[0] for i in engine.execute('SHOW TABLES').fetchall()]
     if 'state' not in _exist_tables:
         create_state_table(logger, schema=DatabaseConfig.OUTPUT_SCHEMA)
+    else:
+        add_state_columns(logger, schema=DatabaseConfig.OUTPUT_SCHEMA)
     engine.close()
 
 def alter_column_type(schema: str, table_name: str, column_name: str, datatype: str) -> None:
@@ -0,0 +1,99 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+from joblib import Parallel, delayed
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from sklearn.utils import murmurhash3_32
+
+
+class HashedTfidfVectorizer(object):
+    """
+    a tf-idf vectorizer over a signed hashed feature space, a term is mapped to its column by murmurhash,
+    so there is no vocabulary to fit, pickle or hold in memory, the only fitted state is the idf weights
+    kept as an array of ``n_features``, and ``transform`` is stateless and may be split across processes
+    Args:
+        n_features: columns of the hashed space
+        use_idf: weight the term frequencies by the idf of the fitted documents
+        min_df: columns found in fewer documents are dropped when fitted
+        stop_words: passed to the HashingVectorizer
+        n_jobs: processes of ``transform`` for batches larger than ``chunk_size``
+        chunk_size: documents hashed by a process at once
+    """
+    def __init__(self, n_features: int = 2 ** 18, use_idf: bool = True, min_df: int = 1, stop_words=None,
+                 n_jobs: int = 1, chunk_size: int = 10000):
+        self.n_features = n_features
+        self.use_idf = use_idf
+        self.min_df = min_df
+        self.stop_words = stop_words
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.idf_: Optional[np.ndarray] = None
+
+    @property
+    def hasher(self) -> HashingVectorizer:
+        return HashingVectorizer(n_features=self.n_features, alternate_sign=True, norm=None,
+                                 stop_words=self.stop_words, dtype=np.float32)
+
+    def _hash(self, docs: List[str]) -> csr_matrix:
+        hasher = self.hasher
+        if self.n_jobs == 1 or len(docs) <= self.chunk_size:
+            x = hasher.transform(docs)
+        else:
+            x = vstack(Parallel(n_jobs=self.n_jobs)(
+                delayed(hasher.transform)(docs[start:start + self.chunk_size])
+                for start in range(0, len(docs), self.chunk_size)), format='csr')
+        # terms of opposite signs may cancel out in a column
+        x.eliminate_zeros()
+        return x
+
+    def fit(self, docs: List[str]):
+        self._fit_idf(self._hash(docs))
+        return self
+
+    def fit_transform(self, docs: List[str]) -> csr_matrix:
+        x = self._hash(docs)
+        self._fit_idf(x)
+        return self._weight(x)
+
+    def transform(self, docs: List[str]) -> csr_matrix:
+        return self._weight(self._hash(docs))
+
+    def _fit_idf(self, x: csr_matrix):
+        df = np.bincount(x.indices, minlength=self.n_features)
+        if self.use_idf:
+            # the smoothed idf of TfidfVectorizer
+            idf = np.log((1 + x.shape[0]) / (1 + df)) + 1
+        else:
+            idf = np.ones(self.n_features)
+        idf[df < self.min_df] = 0
+        self.idf_ = idf.astype(np.float32)
+
+    def _weight(self, x: csr_matrix) -> csr_matrix:
+        if self.idf_ is not None:
+            x.data *= self.idf_[x.indices]
+            x.eliminate_zeros()
+        return normalize(x, norm='l2', copy=False)
+
+    def feature_terms(self, docs: List[str]) -> Tuple[np.ndarray, List[Tuple[str, ...]]]:
+        """
+        recover the terms of the columns by hashing the tokens of the documents again
+        Args:
+            docs: the fitted documents
+        Returns:
+            the sorted columns which any term is hashed to, and the terms of every column,
+            more than one term may collide in a column, the columns dropped by ``min_df`` are left out
+        """
+        analyzer = self.hasher.build_analyzer()
+        terms = set()
+        for doc in docs:
+            terms.update(analyzer(doc))
+        column_terms = {}
+        # the column of a term in HashingVectorizer
+        for term in sorted(terms):
+            column = abs(murmurhash3_32(term, seed=0, positive=False)) % self.n_features
+            column_terms.setdefault(column, []).append(term)
+        columns = np.asarray(sorted(column for column in column_terms.keys()
+                                    if self.idf_ is None or self.idf_[column] > 0), dtype=np.int64)
+        return columns, [tuple(column_terms[column]) for column in columns]
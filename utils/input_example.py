@@ -1,6 +1,14 @@
-from dataclasses import dataclass, astuple, field
+from dataclasses import dataclass, field, fields
 from datetime import datetime
-from typing import Optional
+from typing import Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+EXAMPLE_FIELDS = ('id_', 's_area_id', 'author', 'title', 'content', 'post_time', 'label')
+# the predict targets which are not named after their field
+FIELD_ALIASES = {'author_name': 'author'}
+
 
 @dataclass
 class InputExample:
@@ -13,4 +21,112 @@ class InputExample:
     label: Optional[str] = field(default=None)
 
     def __iter__(self):
-        return iter(astuple(self))
+        # ``astuple`` deep-copies every field, the values are handed out as they are
+        return (getattr(self, _field.name) for _field in fields(self))
+
+
+class ExampleRow(object):
+    """
+    a row of an ``ExampleBatch``, it reads the fields of an ``InputExample`` from the arrays of the batch
+    and holds nothing but the batch and the row index
+    """
+    __slots__ = ('batch', 'index')
+
+    def __init__(self, batch: 'ExampleBatch', index: int):
+        self.batch = batch
+        self.index = index
+
+    def __getattr__(self, name):
+        # only called for the names which are not slots
+        if name not in EXAMPLE_FIELDS and name not in FIELD_ALIASES:
+            raise AttributeError(f"'ExampleRow' object has no attribute '{name}'")
+        return self.batch.column(name)[self.index]
+
+    def __iter__(self) -> Iterator:
+        return (self.batch.column(name)[self.index] for name in EXAMPLE_FIELDS)
+
+    def __repr__(self):
+        return f'ExampleRow({", ".join(f"{name}={value!r}" for name, value in zip(EXAMPLE_FIELDS, self))})'
+
+    def to_example(self) -> InputExample:
+        return InputExample(*self)
+
+
+class ExampleBatch(object):
+    """
+    the fields of many examples as parallel arrays, a model reads a whole field by ``column`` without a python object
+    per row, iterating the batch or taking a row by an integer gives an ``ExampleRow``, a slice or an index array
+    gives a smaller batch
+    Args:
+        id_, s_area_id, author, title, content: a value of every row
+        post_time: the post time of every row, None for every row if not given
+        label: the label of every row, None for every row if not given
+    """
+    def __init__(self, id_: Iterable, s_area_id: Iterable, author: Iterable, title: Iterable, content: Iterable,
+                 post_time: Optional[Iterable] = None, label: Optional[Iterable] = None):
+        self.columns = {}
+        for name, values in zip(EXAMPLE_FIELDS, (id_, s_area_id, author, title, content, post_time, label)):
+            if values is not None:
+                self.columns[name] = _object_array(values)
+        n_rows = len(self.columns['id_'])
+        for name in EXAMPLE_FIELDS:
+            if name not in self.columns:
+                self.columns[name] = np.full(n_rows, None, dtype=object)
+            elif len(self.columns[name]) != n_rows:
+                raise ValueError(f'{name} has {len(self.columns[name])} rows, but id_ has {n_rows}')
+
+    @classmethod
+    def from_examples(cls, examples: Iterable[InputExample]) -> 'ExampleBatch':
+        examples = list(examples)
+        return cls(*([getattr(example, name) for example in examples] for name in EXAMPLE_FIELDS))
+
+    def column(self, name: str) -> np.ndarray:
+        """the array of a field, a predict target such as `author_name` is accepted as well"""
+        return self.columns[FIELD_ALIASES.get(name, name)]
+
+    def __len__(self):
+        return len(self.columns['id_'])
+
+    def __iter__(self) -> Iterator[ExampleRow]:
+        return (ExampleRow(self, index) for index in range(len(self)))
+
+    def __getitem__(self, item) -> Union[ExampleRow, 'ExampleBatch']:
+        if isinstance(item, (int, np.integer)):
+            index = item + len(self) if item < 0 else item
+            if not 0 <= index < len(self):
+                raise IndexError(f'row {item} is out of a batch of {len(self)} rows')
+            return ExampleRow(self, index)
+        return ExampleBatch(**{name: array[item] for name, array in self.columns.items()})
+
+    def __repr__(self):
+        return f'ExampleBatch(rows={len(self)})'
+
+
+def _object_array(values: Iterable) -> np.ndarray:
+    if isinstance(values, pd.Series):
+        # datetimes become Timestamps rather than the integers of datetime64[ns]
+        values = values.astype(object).to_numpy()
+    if isinstance(values, np.ndarray) and values.dtype == object:
+        return values
+    values = values if hasattr(values, '__len__') else list(values)
+    # an empty object array is filled, so that values of lists are not turned into a 2-d array
+    array = np.empty(len(values), dtype=object)
+    try:
+        array[:] = values
+    except ValueError:
+        for index, value in enumerate(values):
+            array[index] = value
+    return array
+
+
+def example_field(examples: Union[ExampleBatch, Iterable[InputExample]], name: str) -> Union[np.ndarray, List]:
+    """
+    the field of every example, a batch hands over its array, a list of examples is read row by row
+    Args:
+        examples: an ``ExampleBatch`` or ``InputExample``s
+        name: the field, or a predict target such as `author_name`
+    """
+    if isinstance(examples, ExampleBatch):
+        return examples.column(name)
+    name = FIELD_ALIASES.get(name, name)
+    return [getattr(example, name) for example in examples]
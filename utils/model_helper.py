@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Optional
 
 import joblib
 
@@ -13,9 +14,9 @@ def get_multi_accuracy(y_true, y_pre):
                 wrong += 1
     return right / (right + wrong)
 
-def load_joblib(path: Path):
+def load_joblib(path: Path, mmap_mode: Optional[str] = None):
     if path.exists():
-        return joblib.load(path)
+        return joblib.load(path, mmap_mode=mmap_mode)
     else:
         raise FileNotFoundError(f"{path.__str__()} not found. Please train your model first.")
 
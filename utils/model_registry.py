@@ -0,0 +1,163 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Tuple, Union
+from urllib.parse import parse_qsl
+
+from models.audience_models import MODEL_ROOT
+from models.incremental_model import IncrementalModel
+from models.model_creator import ModelCreator, parse_model_params
+from models.ngram_model import CharNgramModel
+from models.rf_model import RandomForestModel
+from models.tw_model import TermWeightModel
+from utils.helper import get_logger
+from utils.selections import ModelType
+
+SUPERVISED_MODELS = {
+    ModelType.RANDOM_FOREST_MODEL.value,
+    ModelType.TERM_WEIGHT_MODEL.value,
+    ModelType.INCREMENTAL_MODEL.value,
+    ModelType.CHAR_NGRAM_MODEL.value,
+}
+
+# loaded models of the current process, the most recently used one comes last
+_registry: OrderedDict = OrderedDict()
+_registry_lock = threading.RLock()
+_memory_budget = 2048 * 1024 * 1024
+# the version of every model directory and when it was computed, see ``current_version``
+_versions: Dict[str, Tuple[int, float, str]] = {}
+_version_ttl = 60.0
+
+_logger = get_logger('model_registry')
+
+
+def model_version(model_path: Union[str, Path]) -> str:
+    """
+    the version of a saved model, which changes whenever any file of the model directory is rewritten
+    Args:
+        model_path: the model directory relative to MODEL_ROOT
+    Returns:
+        a sha1 hex digest of the names, sizes and modification times of the files
+    """
+    model_dir = MODEL_ROOT / model_path
+    if not model_dir.exists():
+        raise FileNotFoundError(f"{model_dir.__str__()} not found. Please train your model first.")
+    digest = hashlib.sha1()
+    for file in sorted(path for path in model_dir.rglob('*') if path.is_file()):
+        stat = file.stat()
+        digest.update(f'{file.relative_to(model_dir)}:{stat.st_size}:{stat.st_mtime_ns};'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def current_version(model_path: Union[str, Path]) -> str:
+    """
+    the ``model_version`` of a model directory, cached per path, the files are only stat-ed again when the directory
+    itself is modified, i.e. a file is added, removed or renamed, or the cached version is older than
+    ``_version_ttl`` seconds, so a model rewritten in place is picked up within the ttl
+    """
+    model_dir = MODEL_ROOT / model_path
+    if not model_dir.exists():
+        raise FileNotFoundError(f"{model_dir.__str__()} not found. Please train your model first.")
+    dir_mtime = model_dir.stat().st_mtime_ns
+    now = time.monotonic()
+    cached = _versions.get(str(model_path))
+    if cached is not None and cached[0] == dir_mtime and now - cached[1] < _version_ttl:
+        return cached[2]
+    version = model_version(model_path)
+    _versions[str(model_path)] = (dir_mtime, now, version)
+    return version
+
+
+def model_size(model_path: Union[str, Path]) -> int:
+    """the bytes of the files of a saved model, an upper bound of the memory the loaded model takes"""
+    return sum(path.stat().st_size for path in (MODEL_ROOT / model_path).rglob('*') if path.is_file())
+
+
+def get_model(model_type: str, model_path: str,
+              **model_params) -> Union[RandomForestModel, TermWeightModel, IncrementalModel, CharNgramModel]:
+    """
+    get a loaded supervised model, it is only loaded from disk if the registry has no copy of the current version,
+    the plain numpy arrays of the artifacts are memory-mapped, i.e. the exported `forest/*.npy` of a random forest,
+    the term index, the char n-gram coefficients and the coefficients of the incremental classifiers, so forked
+    workers share their pages, a pickled random forest estimator is copied into every process, since sklearn
+    copies the node arrays of a tree when it is unpickled, and so is every vectorizer
+    Args:
+        model_type: random_forest_model, term_weight_model, incremental_model or char_ngram_model
+        model_path: the model directory relative to MODEL_ROOT
+        model_params: `feature`, `is_multi_label` and `na_tag` of the model, the same saved model loaded with other
+            params is another entry of the registry, so a preload spec has to carry the params of the stages using it
+    Returns:
+        a loaded supervised model
+    """
+    if model_type not in SUPERVISED_MODELS:
+        raise ValueError(f'{model_type} is not a supervised model type')
+
+    model_params = parse_model_params(model_params)
+    params_key = tuple(sorted((name, str(getattr(value, 'value', value))) for name, value in model_params.items()))
+    key = (model_type, str(model_path), params_key, current_version(model_path))
+    with _registry_lock:
+        if key in _registry:
+            _registry.move_to_end(key)
+            return _registry[key][0]
+
+        # an older version of the same model is replaced
+        for stale_key in [k for k in _registry.keys() if k[:3] == key[:3]]:
+            del _registry[stale_key]
+
+        model = ModelCreator.create_model(ModelType(model_type).name, model_path=model_path, **model_params)
+        model.load(mmap_mode='r')
+        if isinstance(model, TermWeightModel):
+            model.prepare()
+        _registry[key] = (model, model_size(model_path))
+        _logger.info(f'load {model_type} {model_path} version {key[3][:8]}')
+        _evict()
+        return model
+
+
+def _evict():
+    # the least recently used models are dropped until the registry fits the budget, the newest one is always kept
+    while len(_registry) > 1 and sum(size for _, size in _registry.values()) > _memory_budget:
+        (model_type, model_path, _, _), _ = _registry.popitem(last=False)
+        _logger.info(f'evict {model_type} {model_path}')
+
+
+def set_memory_budget(budget_mb: int):
+    global _memory_budget
+    with _registry_lock:
+        _memory_budget = budget_mb * 1024 * 1024
+        _evict()
+
+
+def set_version_ttl(seconds: float):
+    global _version_ttl
+    _version_ttl = seconds
+
+
+def parse_model_spec(model_spec: str) -> Tuple[str, str, Dict[str, str]]:
+    """
+    split a `<model_type>:<model_path>` spec of the preload setting, the params of the model may follow as a query,
+    e.g. `char_ngram_model:name_model?feature=author_name&na_tag=other`
+    """
+    model_type, _, model_path = model_spec.partition(':')
+    model_path, _, query = model_path.partition('?')
+    if not model_path:
+        raise ValueError(f'{model_spec} is not in the format of <model_type>:<model_path>')
+    return model_type, model_path, dict(parse_qsl(query))
+
+
+def preload_models(model_specs: Iterable[str]):
+    """load the configured models into the registry, a model which fails to load is logged and skipped"""
+    for model_spec in model_specs:
+        try:
+            model_type, model_path, model_params = parse_model_spec(model_spec)
+            get_model(model_type, model_path, **model_params)
+        except Exception as e:
+            _logger.error(f'failed to preload {model_spec}, additional error message {e}')
+
+
+def clear_models():
+    with _registry_lock:
+        _registry.clear()
+        _versions.clear()
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Union
+
+import joblib
+
+from models.audience_models import MODEL_ROOT
+from models.keyword_model import KeywordModel
+from models.rule_model import RuleModel
+from utils.selections import ModelType
+
+PATTERN_CACHE_DIR = Path(MODEL_ROOT / 'compiled_patterns')
+PATTERN_CACHE_SIZE = 16
+
+RULE_BASE_MODELS = {
+    ModelType.KEYWORD_MODEL.value: KeywordModel,
+    ModelType.RULE_MODEL.value: RuleModel,
+}
+
+# compiled models of the current process, shared by every greenlet of the worker
+_compiled_models: OrderedDict = OrderedDict()
+
+
+def pattern_hash(model_type: str, pattern: Dict) -> str:
+    """
+    content hash of a pattern set, the label order is part of the hash since label ids depend on it
+    Args:
+        model_type: keyword_model or rule_model
+        pattern: the `PATTERN` of a task
+    Returns:
+        a sha1 hex digest
+    """
+    model_class = RULE_BASE_MODELS[model_type]
+    content = json.dumps([model_type, model_class.compiled_version, pattern], ensure_ascii=False, default=str)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def get_artifact_path(model_type: str, pattern: Dict) -> Path:
+    model_class = RULE_BASE_MODELS[model_type]
+    return PATTERN_CACHE_DIR / model_type / f'v{model_class.compiled_version}' / \
+        f'{pattern_hash(model_type, pattern)}.pkl'
+
+
+def load_compiled_model(model_type: str, pattern: Dict) -> Union[KeywordModel, RuleModel]:
+    """
+    get a compiled rule-based model of the pattern, it is looked up in the process cache first,
+    then in the artifact on local disk, and is only built from the raw pattern if neither exists
+    Args:
+        model_type: keyword_model or rule_model
+        pattern: the `PATTERN` of a task
+    Returns:
+        a loaded KeywordModel or RuleModel
+    """
+    if model_type not in RULE_BASE_MODELS:
+        raise ValueError(f'{model_type} is not a rule-based model type')
+
+    key = pattern_hash(model_type, pattern)
+    if key in _compiled_models:
+        _compiled_models.move_to_end(key)
+        return _compiled_models[key]
+
+    artifact_path = get_artifact_path(model_type, pattern)
+    if artifact_path.exists():
+        model = joblib.load(artifact_path)
+    else:
+        model = RULE_BASE_MODELS[model_type](pattern)
+        save_compiled_model(model, artifact_path)
+
+    _compiled_models[key] = model
+    if len(_compiled_models) > PATTERN_CACHE_SIZE:
+        _compiled_models.popitem(last=False)
+    return model
+
+
+def save_compiled_model(model: Union[KeywordModel, RuleModel], artifact_path: Path):
+    artifact_path.parent.mkdir(parents=True, exist_ok=True)
+    # other workers may compile the same pattern at the same time, write to a temp file and swap it in
+    tmp_path = artifact_path.with_name(f'{artifact_path.name}.{uuid.uuid4().hex}.tmp')
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, artifact_path)
+
+
+def clear_compiled_models():
+    """drop the compiled models of the current process, the artifacts on disk are kept"""
+    _compiled_models.clear()
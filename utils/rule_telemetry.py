@@ -0,0 +1,28 @@
+from typing import Dict, List, Tuple
+
+
+class RuleTelemetry(object):
+    """
+    per-rule hit counts and evaluation seconds of a rule-based model, create it by ``model.create_telemetry()``
+    and pass it to ``predict``, ``predict_batch`` or ``decide_batch``, a single model may be shared by many tasks,
+    so the telemetry is kept outside of the model
+    Args:
+        rule_names: (label, rule) of every rule id of the model
+    """
+    def __init__(self, rule_names: List[Tuple[str, str]]):
+        self.rule_names = rule_names
+        self.rows = 0
+        self.hits = [0] * len(rule_names)
+        self.seconds = [0.0] * len(rule_names)
+
+    def summary(self) -> Dict:
+        """
+        Returns:
+            {"rows": n, "labels": {label: {rule: {"hits": n, "seconds": s}}}}, the seconds are only measured for regex
+        """
+        labels = {}
+        for (label, rule), hits, seconds in zip(self.rule_names, self.hits, self.seconds):
+            entry = labels.setdefault(label, {}).setdefault(rule, {'hits': 0, 'seconds': 0.0})
+            entry['hits'] += hits
+            entry['seconds'] = round(entry['seconds'] + seconds, 6)
+        return {'rows': self.rows, 'labels': labels}
@@ -3,19 +3,21 @@ from datetime import datetime
 from pathlib import Path
 from typing import Dict, Iterable, Optional, Union, Tuple, List
 
+import numpy as np
 from sqlalchemy import create_engine
 import pandas as pd
 
-from models.rule_model import RuleModel
-from models.keyword_model import  KeywordModel
-
 from definition import RULE_FOLDER
+from models.cascade_model import CascadeModel
 from settings import DatabaseConfig, SOURCE, LABEL
 from utils.clean_up_result import run_cleaning
 from utils.database_core import create_table, connect_database
 from utils.helper import get_logger
+from utils.pattern_cache import load_compiled_model
+from utils.rule_telemetry import RuleTelemetry
 from utils.selections import ModelType, PredictTarget, KeywordMatchType
-from utils.input_example import InputExample
+from utils.text_normalizer import get_normalized_column
+from utils.input_example import ExampleBatch, InputExample
 
 pd.options.mode.chained_assignment = None
 
@@ -73,84 +75,51 @@ def run_prediction(input_examples: Iterable[InputExample], pattern: Dict,
                    model_type: str,
                    predict_type: PredictTarget):
     if model_type == "rule_model":
-        label_model = RuleModel(pattern)
+        label_model = load_compiled_model(model_type, pattern)
         matched_labels, match_count_list = label_model.predict(input_examples, target=predict_type)
         return matched_labels, match_count_list
     elif model_type == "keyword_model":
-        label_model = KeywordModel(pattern)
+        label_model = load_compiled_model(model_type, pattern)
         matched_labels, match_count_list = label_model.predict(input_examples, target=predict_type)
         return matched_labels, match_count_list
 
 
-def convert_input_data(df: pd.DataFrame) -> Iterable[InputExample]:
-    input_examples = []
-    for _, row in df.iterrows():
-        input_example = InputExample(
-            id_= row.id,
-            s_area_id = row.source_author[:8],
-            author = row.source_author[9:],
-            title = "",
-            content = row.applied_content ,
-            post_time = row.created_at
-        )
-        input_examples.append(input_example)
-        
-    return input_examples
+def convert_input_data(df: pd.DataFrame) -> ExampleBatch:
+    # the `source_author` is `<s_area_id>_<author>` with an s_area_id of 8 characters
+    return ExampleBatch(id_=df['id'],
+                        s_area_id=df['source_author'].str[:8],
+                        author=df['source_author'].str[9:],
+                        title=np.full(len(df), '', dtype=object),
+                        content=df['applied_content'],
+                        post_time=df['created_at'])
 
 def labeling(_id:str, df: pd.DataFrame, model_type: str,
-             predict_type: str, pattern: Dict, logger: get_logger):
+             predict_type: str, pattern: Dict, logger: get_logger,
+             telemetry: Optional[RuleTelemetry] = None,
+             cascade: Optional[CascadeModel] = None):
     start = datetime.now()
     logger.info(f'start labeling at {start} ...')
-    if model_type == ModelType.RULE_MODEL.value:
-        model = RuleModel(pattern)
-        temp_list = []
-        for i in range(len(df)):
-            _input_data = InputExample(
-                id_=df['id'].iloc[i],
-                s_area_id=df['s_area_id'].iloc[i],
-                author=df['author'].iloc[i],
-                title=df['title'].iloc[i],
-                content=df['content'].iloc[i],
-                post_time=df['post_time'].iloc[i]
-            )
-            rs, prob = model.predict([_input_data], target=predict_type)
-
-            if rs:
-                if len(rs) == 1:
-                    temp_list.append(rs[0][0])
-            else:
-                temp_list.append('')
-
-        df['panel'] = temp_list
-        df['task_id'] = [_id for i in range(len(df))]
-
-    elif model_type == ModelType.KEYWORD_MODEL.value:
-        model = KeywordModel(pattern)
-        temp_list = []
-        for i in range(len(df)):
-            _input_data = InputExample(
-                id_=df['id'].iloc[i],
-                s_area_id=df['s_area_id'].iloc[i],
-                author=df['author'].iloc[i],
-                title=df['title'].iloc[i],
-                content=df['content'].iloc[i],
-                post_time=df['post_time'].iloc[i]
-            )
-            rs, prob = model.predict([_input_data], target=predict_type)
-
-            if rs:
-                if len(rs) == 1:
-                    temp_list.append(rs[0][0])
-            else:
-                temp_list.append('')
-
-        df['panel'] = temp_list
-        df['task_id'] = [_id for i in range(len(df))]
+    # the author name is kept in the `author` column of the batch
+    column = 'author' if predict_type == PredictTarget.AUTHOR_NAME.value else predict_type
+    if model_type in {ModelType.RULE_MODEL.value, ModelType.KEYWORD_MODEL.value}:
+        model = load_compiled_model(model_type, pattern)
+        # the whole column is matched in the decide mode, a row is only labeled when exactly one label is matched
+        label_ids = model.decide_batch(get_normalized_column(df, column, model.normalizer).values,
+                                       normalized=True, telemetry=telemetry)
+        # the undecided rows take -1, which is the trailing empty label
+        df['panel'] = np.append(np.asarray(model.labels, dtype=object), '')[label_ids]
+
+    elif model_type == ModelType.CASCADE_MODEL.value:
+        if cascade is None:
+            raise ValueError('a cascade_model task needs the `CASCADE` stages')
+        df['panel'] = cascade.predict_batch(df)
 
     else:
         logger.error('wrong model name input')
         raise ValueError('wrong model name input, please check the input')
 
+    df['task_id'] = _id
+
 
     # df = df[['id', 'task_id', 'source_author', 'created_at', 'panel']]
 
@@ -158,10 +127,7 @@ def labeling(_id:str, df: pd.DataFrame, model_type: str,
     df.rename(columns={'post_time': 'create_time'}, inplace=True)
     df['source_author'] = df['s_id'] + '_' + df['author']
     df['field_content'] = df['s_id']
-    if predict_type == PredictTarget.AUTHOR_NAME.value:
-        df['match_content'] = df['author']
-    else:
-        df['match_content'] = df[predict_type]
+    df['match_content'] = df[column]
 
     _df_output = df[['id', 'task_id', 'source_author', 'create_time',
                     'panel', 'field_content', 'match_content']]
@@ -0,0 +1,151 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from functools import partial
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+import jieba
+
+from utils.helper import get_config
+from utils.token_cache import TOKEN_CACHE_PATH, TokenCache
+
+
+def _init_worker(user_dict: Optional[str]):
+    # every process of the pool loads the dictionary once, not once per document
+    jieba.setLogLevel(logging.WARNING)
+    jieba.initialize()
+    if user_dict:
+        jieba.load_userdict(user_dict)
+
+
+def _cut_chunk(texts: List[str], cut_all: bool = False) -> List[List[str]]:
+    return [jieba.lcut(text, cut_all=cut_all) for text in texts]
+
+
+def _gevent_patched() -> bool:
+    # a multiprocessing pool is not safe in a process monkey-patched by gevent, e.g. a labeling worker of `-P gevent`
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_anything_patched()
+
+
+def _chunks(texts: Iterable[str], chunk_size: int) -> Iterator[List[str]]:
+    iterator = iter(texts)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Segmenter(object):
+    """
+    jieba segmentation of a batch of documents sharded across a process pool, the pool is started on the first
+    large batch and reused by every later one, the results are streamed back in the order of the input,
+    a batch smaller than a chunk, a daemonic process which may not start children, or a process monkey-patched by
+    gevent such as a labeling worker, is segmented in process
+    Args:
+        processes: the size of the pool, the number of cores by default, 1 turns the pool off
+        chunk_size: documents sent to a process at once
+        user_dict: a jieba user dictionary loaded by every process
+        cache: tokens of the documents segmented before, only the missed documents are sent to the pool
+    """
+    def __init__(self, processes: Optional[int] = None, chunk_size: int = 256, user_dict: Optional[str] = None,
+                 cache: Optional[TokenCache] = None):
+        self.processes = processes if processes else os.cpu_count()
+        self.chunk_size = chunk_size
+        self.user_dict = user_dict
+        self.cache = cache
+        self._pool = None
+        self._pool_pid = None
+        self._local_ready = False
+        self._lock = threading.Lock()
+
+    @property
+    def parallel(self) -> bool:
+        return self.processes > 1 and not multiprocessing.current_process().daemon and not _gevent_patched()
+
+    def _get_pool(self):
+        # a pool inherited through fork belongs to the parent, the child starts its own
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = multiprocessing.Pool(self.processes, initializer=_init_worker,
+                                                  initargs=(self.user_dict,))
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _prepare_local(self):
+        if not self._local_ready:
+            _init_worker(self.user_dict)
+            self._local_ready = True
+
+    def _cut(self, texts: List[str], cut_all: bool) -> List[List[str]]:
+        if not self.parallel or len(texts) <= self.chunk_size:
+            self._prepare_local()
+            return _cut_chunk(texts, cut_all=cut_all)
+        cut = partial(_cut_chunk, cut_all=cut_all)
+        return [tokens for chunk in self._get_pool().imap(cut, _chunks(texts, self.chunk_size)) for tokens in chunk]
+
+    def _segment(self, texts: List[str], cut_all: bool) -> List[List[str]]:
+        if self.cache is None:
+            return self._cut(texts, cut_all)
+        mode = 'full' if cut_all else 'precise'
+        results = self.cache.get_many(texts, mode)
+        # only the distinct documents missing from the cache are segmented
+        missed_texts = list(dict.fromkeys(text for text, tokens in zip(texts, results) if tokens is None))
+        if missed_texts:
+            missed_tokens = self._cut(missed_texts, cut_all)
+            self.cache.put_many(missed_texts, mode, missed_tokens)
+            segmented = dict(zip(missed_texts, missed_tokens))
+            results = [segmented[text] if tokens is None else tokens for text, tokens in zip(texts, results)]
+        return results
+
+    def iter_segment(self, texts: Iterable[str], cut_all: bool = False) -> Iterator[List[str]]:
+        """
+        Args:
+            texts: the documents, any iterable, it is consumed a window of a chunk per process at a time
+            cut_all: the full mode of jieba, every word of the dictionary found in the text is returned
+        Returns:
+            an iterator of the tokens of every document, in the order of the input
+        """
+        for window in _chunks(texts, self.chunk_size * max(self.processes, 1)):
+            yield from self._segment(window, cut_all)
+
+    def segment_batch(self, texts: List[str], cut_all: bool = False) -> List[List[str]]:
+        """the tokens of every document of a list, see ``iter_segment``"""
+        return self._segment(list(texts), cut_all)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.close()
+                self._pool.join()
+            self._pool = None
+            self._pool_pid = None
+        if self.cache is not None:
+            self.cache.close()
+
+
+_segmenter: Optional[Segmenter] = None
+
+
+def get_segmenter() -> Segmenter:
+    """the segmenter of the current process, configured by the ``SEGMENT_*`` settings"""
+    global _segmenter
+    if _segmenter is None:
+        configuration = get_config()
+        cache = TokenCache(path=configuration.SEGMENT_CACHE_PATH or TOKEN_CACHE_PATH,
+                           user_dict=configuration.SEGMENT_USER_DICT,
+                           lru_size=configuration.SEGMENT_CACHE_LRU_SIZE,
+                           max_rows=configuration.SEGMENT_CACHE_MAX_ROWS) if configuration.SEGMENT_CACHE else None
+        _segmenter = Segmenter(processes=configuration.SEGMENT_PROCESSES,
+                               chunk_size=configuration.SEGMENT_CHUNK_SIZE,
+                               user_dict=configuration.SEGMENT_USER_DICT,
+                               cache=cache)
+        atexit.register(_segmenter.close)
+    return _segmenter
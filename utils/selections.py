@@ -12,6 +12,20 @@ class ModelType(Enum):
     RULE_MODEL = "rule_model"
     RANDOM_FOREST_MODEL = "random_forest_model"
     TERM_WEIGHT_MODEL = "term_weight_model"
+    INCREMENTAL_MODEL = "incremental_model"
+    CASCADE_MODEL = "cascade_model"
+    CHAR_NGRAM_MODEL = "char_ngram_model"
+
+class TrainingStage(Enum):
+    SEGMENTATION = "segmentation"
+    VECTORIZATION = "vectorization"
+    FITTING = "fitting"
+    SAVING = "saving"
+    EVALUATION = "evaluation"
+
+class VectorizerType(Enum):
+    TFIDF = "tfidf"
+    HASHING = "hashing"
 
 class PredictTarget(Enum):
     AUTHOR_NAME = "author_name"
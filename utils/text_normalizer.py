@@ -0,0 +1,80 @@
+import unicodedata
+from typing import Iterable, List, Optional
+
+import pandas as pd
+
+
+class TextNormalizer(object):
+    """
+    normalize the text once per batch before any model reads it, every rule-based model matches against the output
+    Args:
+        case_sensitive: keep the case of the text, otherwise lowercase it
+        fold_width: NFKC normalization, which folds full-width characters into half-width ones
+        strip: strip the leading and trailing whitespaces
+        chinese_conversion: an OpenCC config such as `t2s` or `s2t`, requires the optional `opencc` package
+    """
+    def __init__(self, case_sensitive: bool = False, fold_width: bool = True, strip: bool = True,
+                 chinese_conversion: Optional[str] = None):
+        self.case_sensitive = case_sensitive
+        self.fold_width = fold_width
+        self.strip = strip
+        self.chinese_conversion = chinese_conversion
+        self._converter = None
+
+    def __repr__(self):
+        return f'TextNormalizer({self.key})'
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_converter'] = None
+        return state
+
+    @property
+    def key(self) -> str:
+        return f'case_sensitive={self.case_sensitive},fold_width={self.fold_width},' \
+               f'strip={self.strip},chinese_conversion={self.chinese_conversion}'
+
+    @property
+    def converter(self):
+        if self.chinese_conversion and self._converter is None:
+            try:
+                import opencc
+            except ImportError:
+                raise ImportError(f"chinese_conversion `{self.chinese_conversion}` requires the `opencc` package, "
+                                  f"please install it by `pip install opencc-python-reimplemented`")
+            self._converter = opencc.OpenCC(self.chinese_conversion)
+        return self._converter
+
+    def normalize(self, texts: Iterable[str]) -> List[str]:
+        """normalize a whole column, missing values become empty strings"""
+        texts = ['' if text is None or text != text else str(text) for text in texts]
+        if self.fold_width:
+            texts = [unicodedata.normalize('NFKC', text) for text in texts]
+        if not self.case_sensitive:
+            texts = [text.lower() for text in texts]
+        if self.strip:
+            texts = [text.strip() for text in texts]
+        if self.converter:
+            texts = [self.converter.convert(text) for text in texts]
+        return texts
+
+    def normalize_keyword(self, keyword: str) -> str:
+        """normalize a keyword the same way as the text, except stripping, since keywords may start or end with spaces"""
+        if self.fold_width:
+            keyword = unicodedata.normalize('NFKC', keyword)
+        if not self.case_sensitive:
+            keyword = keyword.lower()
+        if self.converter:
+            keyword = self.converter.convert(keyword)
+        return keyword
+
+
+def get_normalized_column(df: pd.DataFrame, column: str, normalizer: TextNormalizer) -> pd.Series:
+    """
+    normalize a column of the batch once, the result is cached as a hidden column of the dataframe
+    so that every model reading the same column with the same normalizer reuses it
+    """
+    cache_column = f'_normalized_{column}_{normalizer.key}'
+    if cache_column not in df.columns:
+        df[cache_column] = normalizer.normalize(df[column].values)
+    return df[cache_column]
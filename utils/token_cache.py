@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Union
+
+import jieba
+
+from definition import CACHE_FOLDER
+
+TOKEN_CACHE_PATH = CACHE_FOLDER / 'token_cache.sqlite3'
+
+
+def dictionary_version(user_dict: Optional[str] = None) -> str:
+    """
+    the version of the segmentation dictionaries, cached tokens of another version are never read
+    Args:
+        user_dict: the jieba user dictionary loaded along with the default one
+    Returns:
+        a sha1 hex digest of the jieba version and the content of the dictionaries
+    """
+    digest = hashlib.sha1(jieba.__version__.encode('utf-8'))
+    with jieba.get_dict_file() as f:
+        digest.update(f.read())
+    if user_dict:
+        digest.update(Path(user_dict).read_bytes())
+    return digest.hexdigest()
+
+
+class TokenCache(object):
+    """
+    segmented tokens kept in a sqlite file keyed by (content hash, segmentation mode, dictionary version),
+    an in-process LRU of ``lru_size`` entries is looked up before the file, so a corpus which is trained,
+    evaluated or labeled again is not segmented again, the file may be shared by many processes,
+    it keeps at most ``max_rows`` rows, the least recently used ones are deleted when a write goes over it
+    Args:
+        path: the sqlite file
+        user_dict: the jieba user dictionary of the segmenter, part of the dictionary version
+        lru_size: entries kept in memory
+        max_rows: rows kept in the file
+    """
+    def __init__(self, path: Union[str, Path] = TOKEN_CACHE_PATH, user_dict: Optional[str] = None,
+                 lru_size: int = 100000, max_rows: int = 1000000):
+        self.path = Path(path)
+        self.version = dictionary_version(user_dict)
+        self.lru_size = lru_size
+        self.max_rows = max_rows
+        # the rows of the file as far as this process knows, it is counted again before anything is deleted
+        self._rows = 0
+        self._lru: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection must not be used across fork, every process opens its own
+        if self._connection is None or self._connection_pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            with self._connection:
+                self._connection.execute('CREATE TABLE IF NOT EXISTS tokens '
+                                         '(key TEXT PRIMARY KEY, tokens TEXT NOT NULL, used REAL NOT NULL)')
+                self._connection.execute('CREATE INDEX IF NOT EXISTS tokens_used ON tokens (used)')
+            self._rows = self._connection.execute('SELECT COUNT(*) FROM tokens').fetchone()[0]
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def key(self, text: str, mode: str) -> str:
+        return f'{hashlib.sha1(text.encode("utf-8")).hexdigest()}:{mode}:{self.version}'
+
+    def get_many(self, texts: List[str], mode: str) -> List[Optional[List[str]]]:
+        """
+        Args:
+            texts: the documents
+            mode: the segmentation mode, `precise` or `full`
+        Returns:
+            the cached tokens of every document, None for a miss
+        """
+        keys = [self.key(text, mode) for text in texts]
+        results = [None] * len(keys)
+        missed = {}
+        with self._lock:
+            for index, key in enumerate(keys):
+                tokens = self._lru.get(key)
+                if tokens is None:
+                    missed.setdefault(key, []).append(index)
+                else:
+                    self._lru.move_to_end(key)
+                    results[index] = tokens
+            missed_keys = list(missed.keys())
+            connection = self._connect()
+            # sqlite limits the number of variables of a statement
+            for start in range(0, len(missed_keys), 500):
+                batch = missed_keys[start:start + 500]
+                rows = connection.execute(f'SELECT key, tokens FROM tokens WHERE key IN '
+                                          f'({",".join("?" * len(batch))})', batch).fetchall()
+                for key, tokens in rows:
+                    tokens = json.loads(tokens)
+                    self._remember(key, tokens)
+                    for index in missed[key]:
+                        results[index] = tokens
+                if rows:
+                    # the rows read from the file are the recently used ones when the file is trimmed
+                    with connection:
+                        connection.execute(f'UPDATE tokens SET used = ? WHERE key IN ({",".join("?" * len(rows))})',
+                                           [time.time()] + [key for key, _ in rows])
+        return results
+
+    def put_many(self, texts: List[str], mode: str, tokens_list: List[List[str]]):
+        rows = [(self.key(text, mode), tokens) for text, tokens in zip(texts, tokens_list)]
+        with self._lock:
+            for key, tokens in rows:
+                self._remember(key, tokens)
+            connection = self._connect()
+            used = time.time()
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO tokens (key, tokens, used) VALUES (?, ?, ?)',
+                                       [(key, json.dumps(tokens, ensure_ascii=False), used) for key, tokens in rows])
+            self._rows += len(rows)
+            if self._rows > self.max_rows:
+                self._trim(connection)
+
+    def _trim(self, connection: sqlite3.Connection):
+        # other processes write to the same file, so the rows are counted before the least recently used are deleted
+        with connection:
+            self._rows = connection.execute('SELECT COUNT(*) FROM tokens').fetchone()[0]
+            if self._rows > self.max_rows:
+                connection.execute('DELETE FROM tokens WHERE key IN '
+                                   '(SELECT key FROM tokens ORDER BY used LIMIT ?)', (self._rows - self.max_rows,))
+                self._rows = self.max_rows
+
+    def _remember(self, key: str, tokens: List[str]):
+        self._lru[key] = tokens
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._connection_pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+            self._connection_pid = None